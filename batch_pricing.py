@@ -0,0 +1,235 @@
+"""Headless pricing of many listings, matching the Oppussing and Finansiering tabs.
+
+Usage:
+    python batch_pricing.py listings.csv -o priced.parquet --rate 4.5 --years 25
+    python batch_pricing.py finnkoder.csv -o priced.csv --fetch --plan plan.json
+
+Input rows need a price (``total_price`` or ``price``) and an area
+(``bra_internal``, ``size``, ``bra_total`` or ``area``), or a ``finnkode``/``url``
+column together with --fetch to get them from Finn.no. Per-row columns named
+like the CLI options (equity_percent, interest_rate, years, felleskostnader,
+kommunale_avg, forsikring, vedlikehold, strom) override the defaults, and
+``quality:<item>``/``amount:<item>`` columns describe a per-row renovation plan.
+--plan applies one JSON plan to every row instead, e.g.
+    {"Nytt bad": {"quality": "Standard", "amount": 10}}
+(the same file works with reports.py --plan).
+--budget (or a per-row ``budget`` column) instead gives every row the plan
+with the largest estimated value uplift within the budget, valued at the
+row's ``market_price_per_sqm`` or else its own price per m², and adds a
+``value_uplift`` column.
+
+Input and output are processed chunk by chunk, so memory stays bounded by
+--chunksize regardless of the file size. Parquet needs pyarrow.
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from finance import (
+    DEFAULT_EQUITY_PERCENT,
+    DEFAULT_INTEREST_RATE,
+    DEFAULT_MONTHLY_COSTS,
+    DEFAULT_YEARS,
+    financing,
+)
+from renovation import amount_column, load_plan, quality_column, renovation_costs
+
+PRICE_COLUMNS = ("total_price", "price")
+AREA_COLUMNS = ("bra_internal", "size", "bra_total", "area")
+FINANCING_COLUMNS = ("equity_percent", "interest_rate", "years", "felleskostnader",
+                     "kommunale_avg", "forsikring", "vedlikehold", "strom")
+OUTPUT_COLUMNS = ("purchase_price", "area", "renovation_cost", "total_investment",
+                  "loan_amount", "monthly_loan", "monthly_running_costs", "total_monthly",
+                  "annual_cost", "tax_deduction", "net_annual_cost")
+
+
+def _is_parquet(path):
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        sys.exit("Parquet-filer krever pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def read_chunks(path, chunksize):
+    """Yield DataFrame chunks of at most chunksize rows from a CSV or Parquet file"""
+    if _is_parquet(path):
+        pyarrow = _require_pyarrow()
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+class ChunkWriter:
+    """Appends DataFrame chunks to a CSV or Parquet file without holding earlier chunks"""
+
+    def __init__(self, path):
+        self.path = path
+        self._parquet_writer = None
+        self._rows = 0
+
+    def write(self, frame):
+        if _is_parquet(self.path):
+            pyarrow = _require_pyarrow()
+            table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table.cast(self._parquet_writer.schema))
+        else:
+            frame.to_csv(self.path, mode="w" if self._rows == 0 else "a",
+                         header=self._rows == 0, index=False)
+        self._rows += len(frame)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        return self._rows
+
+
+def _coalesce(frame, columns):
+    # First non-missing, non-zero value across columns, like `a or b or 0`
+    result = pd.Series(0.0, index=frame.index)
+    for column in reversed(columns):
+        if column in frame:
+            values = pd.to_numeric(frame[column], errors="coerce")
+            result = values.where(values.notna() & (values != 0), result)
+    return result
+
+
+def fetch_missing(frame):
+    """Fill price and area columns from Finn.no for rows that only have a finnkode or url"""
+    from finn_batch import fetch_listings, normalize_listing_url
+
+    key = "url" if "url" in frame else "finnkode" if "finnkode" in frame else None
+    if key is None:
+        return frame
+    frame = frame.copy()
+    missing = _coalesce(frame, PRICE_COLUMNS) == 0
+    urls = frame.loc[missing, key].dropna().astype(str)
+    rows = {normalize_listing_url(value): index for index, value in urls.items()}
+    fields = PRICE_COLUMNS + AREA_COLUMNS[:-1]
+    for column in fields:
+        if column not in frame:
+            frame[column] = np.nan
+    for url, property_data, success, message in fetch_listings(rows):
+        if not success:
+            print(f"{url}: {message}", file=sys.stderr)
+            continue
+        for column in fields:
+            frame.at[rows[url], column] = property_data.get(column)
+    return frame
+
+
+def optimized_plans(frame, purchase_price, area, budget=None):
+    """Budget-optimal plan per row as quality:/amount: columns, and the estimated value uplift"""
+    from optimizer import optimize_plan
+
+    budgets = pd.Series(budget or 0.0, index=frame.index, dtype=np.float64)
+    if "budget" in frame:
+        budgets = pd.to_numeric(frame["budget"], errors="coerce").fillna(budgets)
+    price_per_sqm = (purchase_price / area.where(area > 0)).fillna(0.0)
+    if "market_price_per_sqm" in frame:
+        price_per_sqm = pd.to_numeric(frame["market_price_per_sqm"], errors="coerce").fillna(price_per_sqm)
+    regions = frame["region"] if "region" in frame else pd.Series(None, index=frame.index, dtype=object)
+
+    rows, uplifts = [], []
+    for row_area, row_budget, row_price, region in zip(area, budgets, price_per_sqm, regions):
+        plan, _, uplift = optimize_plan(row_area, row_budget, row_price,
+                                        region=region if isinstance(region, str) else None)
+        row = {}
+        for item_name, (quality, amount) in plan.items():
+            row[quality_column(item_name)] = quality
+            row[amount_column(item_name)] = amount
+        rows.append(row)
+        uplifts.append(uplift)
+    plans = pd.DataFrame(rows, index=frame.index)
+    if "region" in frame:
+        plans["region"] = frame["region"]
+    return plans, pd.Series(uplifts, index=frame.index, dtype=np.float64)
+
+
+def price_chunk(frame, defaults, plan=None, budget=None):
+    """Compute purchase price, renovation cost and financing for every row of frame"""
+    purchase_price = _coalesce(frame, PRICE_COLUMNS)
+    area = _coalesce(frame, AREA_COLUMNS)
+
+    plans = frame
+    value_uplift = None
+    if budget is not None or "budget" in frame:
+        plans, value_uplift = optimized_plans(frame, purchase_price, area, budget)
+    elif plan:
+        plans = pd.DataFrame(index=frame.index)
+        for item_name, (quality, amount) in plan.items():
+            plans[quality_column(item_name)] = quality
+            plans[amount_column(item_name)] = amount
+    plans = plans.assign(area=area)
+    renovation_cost = renovation_costs(plans)["total"]
+
+    total_investment = purchase_price + renovation_cost
+    parameters = {}
+    for column in FINANCING_COLUMNS:
+        value = defaults.get(column)
+        if column in frame:
+            per_row = pd.to_numeric(frame[column], errors="coerce")
+            value = per_row.fillna(value).to_numpy() if value is not None else per_row.to_numpy()
+        parameters[column] = value
+    results = financing(total_investment.to_numpy(), **parameters)
+
+    priced = pd.DataFrame({
+        "purchase_price": purchase_price,
+        "area": area,
+        "renovation_cost": renovation_cost,
+        "total_investment": total_investment,
+    }, index=frame.index)
+    for name in OUTPUT_COLUMNS[4:]:
+        priced[name] = results[name]
+    if value_uplift is not None:
+        priced["value_uplift"] = value_uplift
+    passthrough = [c for c in ("finnkode", "url", "address") if c in frame]
+    return pd.concat([frame[passthrough], priced], axis=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Beregn kjøpspris, oppussing og finansiering for mange boliger")
+    parser.add_argument("input", help="CSV- eller Parquet-fil med boliger")
+    parser.add_argument("-o", "--output", required=True, help="CSV- eller Parquet-fil for resultatet")
+    parser.add_argument("--chunksize", type=int, default=100000, help="Rader per del")
+    parser.add_argument("--plan", help="JSON-fil med oppussingsplan for alle rader")
+    parser.add_argument("--budget", type=float,
+                        help="Velg planen med størst anslått verdiøkning innenfor dette budsjettet (NOK)")
+    parser.add_argument("--fetch", action="store_true", help="Hent pris og areal fra Finn.no for rader uten pris")
+    parser.add_argument("--equity-percent", type=float, default=DEFAULT_EQUITY_PERCENT)
+    parser.add_argument("--interest-rate", type=float, default=DEFAULT_INTEREST_RATE)
+    parser.add_argument("--years", type=int, default=DEFAULT_YEARS)
+    for name, value in DEFAULT_MONTHLY_COSTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=value)
+    parser.add_argument("--vedlikehold", type=float, default=None,
+                        help="Månedlig vedlikehold (standard: 0,1%% av total investering)")
+    args = parser.parse_args(argv)
+
+    plan = load_plan(args.plan) if args.plan else None
+    defaults = {column: getattr(args, column) for column in FINANCING_COLUMNS}
+
+    writer = ChunkWriter(args.output)
+    try:
+        for chunk in read_chunks(args.input, args.chunksize):
+            if args.fetch:
+                chunk = fetch_missing(chunk)
+            writer.write(price_chunk(chunk, defaults, plan, args.budget))
+    finally:
+        rows = writer.close()
+    print(f"{rows} rader skrevet til {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,567 @@
+"""Concurrent-session load test of the Streamlit app against a local stand-in for Finn.no.
+
+Usage:
+    python benchmarks/bench_load.py [--sessions 1,2,4,8,16] [--rounds 2] [--think 1.0] [--plot curve.html]
+
+Starts `streamlit run calc.py` with BOLIGBUDSJETT_HTTP_MODE=replay on the
+synthetic listing archive from bench_replay, so Finn.no is served from
+disk, and with a fresh listing store seeded from the same archive, so the
+area tab has comparables. Each concurrency level then connects that many
+simulated browsers to the app's websocket. Every browser walks a visitor's
+flow --rounds times: paste a listing URL and fetch it, tick renovation
+items, change equity, rate and loan period, and widen the area search
+radius, pausing around --think seconds between steps. A browser sends the
+same rerun requests as the frontend: fragment reruns for widgets inside a
+fragment, and the timed reruns of run_every fragments while a fetch runs.
+
+An interaction is timed from the rerun request until the script run it
+triggered has finished (the fetch until the listing is on screen), which
+is what the visitor waits for. Per level the report has latency
+percentiles per interaction, interactions per second, the server's CPU
+use and its resident memory per session; the levels together are the
+saturation curve. Runs are appended to benchmarks/results/load_history.jsonl
+and a level whose p95 is more than --threshold above its recent median on
+this machine, with the same settings, is flagged as a scaling regression.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARK_DIR)
+APP = os.path.join(ROOT, "calc.py")
+DEFAULT_HISTORY = os.path.join(BENCHMARK_DIR, "results", "load_history.jsonl")
+DEFAULT_THRESHOLD = 0.25
+BASELINE_RUNS = 5
+STEPS = ("åpne", "url", "hent", "oppussing", "finansiering", "område")
+SATURATION_EFFICIENCY = 0.5  # interactions per session, relative to one session alone
+SAMPLE_INTERVAL = 0.1
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class FlowError(Exception):
+    """The app did not show what the next step of the flow needs"""
+
+
+class BrowserSession:
+    """One simulated browser tab, sending reruns over the app's websocket like the frontend
+
+    Keeps the elements on screen by delta path (so a fragment rerun only
+    replaces its own part), the fragment each widget was drawn in, the
+    fragments the server asked to rerun on a timer and the widget values
+    this visitor has set. Like the frontend it sends only the values of
+    widgets still on screen; the server keeps the rest.
+    """
+
+    def __init__(self, socket, timeout=60):
+        self.socket = socket
+        self.timeout = timeout
+        self.page_script_hash = ""
+        self.elements = {}  # delta path -> (element type, proto, fragment id, run)
+        self.values = {}  # widget id -> value set by the visitor
+        self.auto_reruns = {}  # fragment id -> seconds between reruns
+        self.exceptions = []
+        self.runs = 0
+        self._fragments_this_run = ()
+
+    def widgets(self, kind):
+        """Protos of the elements of one type on screen, in page order"""
+        return [proto for element_kind, proto, _, _ in self.elements.values() if element_kind == kind]
+
+    def find(self, kind, key=None, label=None):
+        """The first element of a type with the given key and/or label, or None"""
+        from streamlit.runtime.state.common import user_key_from_element_id
+        for proto in self.widgets(kind):
+            if key is not None and user_key_from_element_id(proto.id) != key:
+                continue
+            if label is not None and proto.label != label:
+                continue
+            return proto
+        return None
+
+    def change(self, widget, value):
+        """Set a widget's value and rerun it like the frontend does; returns seconds until done
+
+        value is a str, bool, number or tuple (for sliders), matching the
+        widget's text, checkbox, number or slider state.
+        """
+        self.values[widget.id] = value
+        return self.rerun(self._fragment_of(widget))
+
+    def click(self, button):
+        return self.rerun(self._fragment_of(button), trigger=button.id)
+
+    def fetch(self, button):
+        """Click the fetch button and keep rerunning its progress fragment until the listing is shown"""
+        start = time.perf_counter()
+        self.click(button)
+        while self.auto_reruns:
+            if time.perf_counter() - start > self.timeout:
+                raise TimeoutError("henting ble ikke ferdig")
+            fragment_id, interval = next(iter(self.auto_reruns.items()))
+            time.sleep(interval)
+            self.rerun(fragment_id, is_auto_rerun=True)
+        return time.perf_counter() - start
+
+    def rerun(self, fragment_id="", is_auto_rerun=False, trigger=None):
+        """Request a script run and read its messages until it has finished; returns seconds"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        message = BackMsg()
+        client_state = message.rerun_script
+        client_state.page_script_hash = self.page_script_hash
+        client_state.fragment_id = fragment_id
+        client_state.is_auto_rerun = is_auto_rerun
+        states = client_state.widget_states
+        on_screen = {proto.id for _, proto, _, _ in self.elements.values() if getattr(proto, "id", "")}
+        for widget_id, value in self.values.items():
+            if widget_id in on_screen:
+                _set_widget_state(states.widgets.add(id=widget_id), value)
+        if trigger is not None:
+            states.widgets.add(id=trigger, trigger_value=True)
+
+        start = time.perf_counter()
+        self.socket.send(message.SerializeToString())
+        self._read_run()
+        return time.perf_counter() - start
+
+    def _fragment_of(self, widget):
+        for _, proto, fragment_id, _ in self.elements.values():
+            if getattr(proto, "id", "") == widget.id:
+                return fragment_id
+        return ""
+
+    def _read_run(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        while True:
+            message = ForwardMsg.FromString(self.socket.recv(timeout=self.timeout))
+            kind = message.WhichOneof("type")
+            if kind == "new_session":
+                self.runs += 1
+                self.page_script_hash = message.new_session.page_script_hash
+                self._fragments_this_run = set(message.new_session.fragment_ids_this_run)
+                if not self._fragments_this_run:
+                    # A full run redraws the whole page and restarts every fragment timer
+                    self.elements, self.auto_reruns = {}, {}
+            elif kind == "delta" and message.delta.WhichOneof("type") == "new_element":
+                element = message.delta.new_element
+                element_kind = element.WhichOneof("type")
+                if element_kind == "exception":
+                    self.exceptions.append(element.exception.message)
+                self.elements[tuple(message.metadata.delta_path)] = (
+                    element_kind, getattr(element, element_kind), message.delta.fragment_id, self.runs
+                )
+            elif kind == "auto_rerun":
+                self.auto_reruns[message.auto_rerun.fragment_id] = message.auto_rerun.interval
+            elif kind == "stop_auto_rerun":
+                for fragment_id in message.stop_auto_rerun.fragment_ids:
+                    self.auto_reruns.pop(fragment_id, None)
+            elif kind == "script_finished" and message.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                # Elements a fragment run did not draw again are gone from the page
+                self.elements = {
+                    path: entry for path, entry in self.elements.items()
+                    if entry[3] == self.runs or entry[2] not in self._fragments_this_run
+                }
+                return
+
+
+def _set_widget_state(state, value):
+    if isinstance(value, bool):
+        state.bool_value = value
+    elif isinstance(value, str):
+        state.string_value = value
+    elif isinstance(value, tuple):
+        state.double_array_value.data.extend(value)
+    else:
+        state.double_value = value
+
+
+def walk(browser, listing_url, rng, think, items, record):
+    """One pass through the visitor flow for a listing, recording (step, seconds) per interaction"""
+    def pause():
+        time.sleep(rng.uniform(0.5, 1.5) * think)
+
+    url_input = browser.find("text_input", key="finn_url")
+    if url_input is None:
+        raise FlowError("fant ikke URL-feltet")
+    pause()
+    record("url", browser.change(url_input, listing_url))
+    pause()
+    record("hent", browser.fetch(browser.find("button", label="Hent boligdata")))
+
+    from streamlit.runtime.state.common import user_key_from_element_id
+    checkboxes = [proto for proto in browser.widgets("checkbox")
+                  if (user_key_from_element_id(proto.id) or "").startswith("check_")]
+    if not checkboxes:
+        raise FlowError("annonsen ble ikke vist etter hentingen")
+    for checkbox in rng.sample(checkboxes, min(items, len(checkboxes))):
+        pause()
+        # Items ticked in an earlier round are unticked again
+        record("oppussing", browser.change(checkbox, not browser.values.get(checkbox.id, checkbox.default)))
+
+    for key, value in (("equity_percent", (float(rng.choice([10, 15, 20, 25, 30])),)),
+                       ("interest_rate", round(rng.uniform(3.5, 6.5), 1)),
+                       ("loan_years", float(rng.choice([15, 20, 25, 30])))):
+        widget = browser.find("slider" if key == "equity_percent" else "number_input", key=key)
+        if widget is None:
+            raise FlowError(f"fant ikke {key}")
+        pause()
+        record("finansiering", browser.change(widget, value))
+
+    radius = browser.find("slider", label="Søkeradius (km)")
+    if radius is not None:
+        pause()
+        record("område", browser.change(radius, (rng.choice([1.0, 3.0, 5.0]),)))
+
+
+def visit(url, listing_urls, seed, think, items, timeout, record, fail):
+    """A visitor's whole session: open the app, then walk the flow once per listing"""
+    from websockets.sync.client import connect
+    rng = random.Random(seed)
+    time.sleep(rng.uniform(0, think))  # visitors do not all arrive in the same instant
+    try:
+        with connect(url, subprotocols=["streamlit"], max_size=None, open_timeout=timeout) as socket:
+            browser = BrowserSession(socket, timeout)
+            record("åpne", browser.rerun())
+            for listing_url in listing_urls:
+                walk(browser, listing_url, rng, think, items, record)
+            for message in browser.exceptions:
+                fail(f"unntak i appen: {message}")
+    except Exception as e:
+        fail(f"{type(e).__name__}: {e}")
+
+
+def process_usage(pid):
+    """(CPU seconds, resident bytes) of a process from /proc, or (None, None) where that is missing"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        return None, None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, resident_pages * PAGE_SIZE
+
+
+class ServerMonitor:
+    """CPU time and peak resident memory of the server process over one level"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self._stop = threading.Event()
+        self.cpu_start, self.rss_start = process_usage(pid)
+        self.rss_peak = self.rss_start
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            _, rss = process_usage(self.pid)
+            if rss is not None:
+                self.rss_peak = max(self.rss_peak, rss)
+
+    def stop(self):
+        """(CPU seconds used, resident bytes at the start, peak resident bytes)"""
+        self._stop.set()
+        self._thread.join()
+        cpu, _ = process_usage(self.pid)
+        if cpu is None:
+            return None, None, None
+        return cpu - self.cpu_start, self.rss_start, self.rss_peak
+
+
+def percentiles(seconds):
+    if not seconds:
+        return {"count": 0}
+    import numpy as np
+    p50, p95, p99 = np.percentile(np.asarray(seconds) * 1000, (50, 95, 99))
+    return {"count": len(seconds), "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def run_level(url, pid, sessions, listing_urls, rounds, think, items, timeout, seed):
+    """Run one concurrency level and summarize it"""
+    timings = defaultdict(list)
+    errors = []
+    lock = threading.Lock()
+
+    def record(step, seconds):
+        with lock:
+            timings[step].append(seconds)
+
+    def fail(message):
+        with lock:
+            errors.append(message)
+
+    monitor = ServerMonitor(pid)
+    client_cpu = time.process_time()
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=visit, args=(
+            url, listing_urls[i * rounds:(i + 1) * rounds], seed + i, think, items, timeout, record, fail
+        ))
+        for i in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    client_cpu = time.process_time() - client_cpu
+    server_cpu, rss_start, rss_peak = monitor.stop()
+
+    every = [seconds for step in timings.values() for seconds in step]
+    result = {
+        "sessions": sessions,
+        "seconds": elapsed,
+        "interactions": len(every),
+        "throughput": len(every) / elapsed,
+        "errors": len(errors),
+        "error_messages": errors[:5],
+        **percentiles(every),
+        "steps": {step: percentiles(timings[step]) for step in STEPS if timings[step]},
+        "client_cpu": client_cpu / elapsed,
+    }
+    if server_cpu is not None:
+        result.update({
+            "server_cpu": server_cpu / elapsed,
+            "cpu_ms_per_interaction": server_cpu * 1000 / len(every) if every else None,
+            "rss_mb": rss_peak / 2 ** 20,
+            "rss_mb_per_session": (rss_peak - rss_start) / 2 ** 20 / sessions,
+        })
+    return result
+
+
+def prepare(workdir, archive_path, listings):
+    """Archive with at least listings pages, and a store seeded with them; returns the archive's keys"""
+    from bench_parser import DEFAULT_CORPUS, load_corpus
+    from bench_replay import build_archive
+    from http_archive import HttpArchive
+
+    archive = HttpArchive(archive_path)
+    try:
+        if len(archive) < listings:
+            build_archive(archive, load_corpus(DEFAULT_CORPUS), listings)
+        keys = archive.keys()
+    finally:
+        archive.close()
+
+    urls = os.path.join(workdir, "seed.txt")
+    with open(urls, "w", encoding="utf-8") as f:
+        f.write("\n".join(keys[:listings]) + "\n")
+    subprocess.run(
+        [sys.executable, os.path.join(ROOT, "finn_batch.py"), urls, "-o", os.devnull,
+         "--rate", "0", "--no-cache", "--store", os.path.join(workdir, "store")],
+        cwd=ROOT, env=server_environment(workdir, archive_path), check=True
+    )
+    return keys
+
+
+def server_environment(workdir, archive_path):
+    return {
+        **os.environ,
+        "BOLIGBUDSJETT_HTTP_MODE": "replay",
+        "BOLIGBUDSJETT_HTTP_ARCHIVE": archive_path,
+        "BOLIGBUDSJETT_CACHE": "",  # listing cache in memory only, so fetches start cold
+        "BOLIGBUDSJETT_STORE": os.path.join(workdir, "store"),
+        "BOLIGBUDSJETT_MARKET_INDEX": os.path.join(workdir, "market_index.npz"),
+        "BOLIGBUDSJETT_LISTINGS": os.path.join(workdir, "listings.parquet"),
+        "BOLIGBUDSJETT_LOG_LEVEL": "WARNING",
+    }
+
+
+def start_server(env, port, log, timeout=60):
+    """`streamlit run calc.py` on port, returned once its health check answers"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true",
+         "--server.port", str(port), "--server.fileWatcherType", "none",
+         "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"streamlit avsluttet med kode {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise TimeoutError("streamlit ble ikke klar")
+
+
+def saturation(levels):
+    """The first level where each session gets less than half the throughput of a single one, or None"""
+    reference = levels[0]["throughput"] / levels[0]["sessions"]
+    for level in levels:
+        level["efficiency"] = level["throughput"] / level["sessions"] / reference
+    return next((level["sessions"] for level in levels[1:]
+                 if level["efficiency"] < SATURATION_EFFICIENCY), None)
+
+
+def baseline(history, machine, settings, level, runs=BASELINE_RUNS):
+    """Median p95 of a level over its last runs with the same settings on this machine, or None"""
+    previous = [entry["results"][level]["p95_ms"] for entry in history
+                if entry["environment"]["machine"] == machine and entry["settings"] == settings
+                and "p95_ms" in entry["results"].get(level, {})]
+    return statistics.median(previous[-runs:]) if previous else None
+
+
+def plot(levels, path):
+    """Write the saturation curve as an HTML page"""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    sessions = [level["sessions"] for level in levels]
+    figure = make_subplots(rows=2, cols=1, shared_xaxes=True, subplot_titles=(
+        "Ventetid per interaksjon (ms)", "Interaksjoner per sekund og server-CPU"))
+    for name in ("p50_ms", "p95_ms", "p99_ms"):
+        figure.add_trace(go.Scatter(x=sessions, y=[level.get(name) for level in levels],
+                                    name=name[:3], mode="lines+markers"), row=1, col=1)
+    figure.add_trace(go.Scatter(x=sessions, y=[level["throughput"] for level in levels],
+                                name="interaksjoner/s", mode="lines+markers"), row=2, col=1)
+    figure.add_trace(go.Scatter(x=sessions, y=[level.get("server_cpu") for level in levels],
+                                name="server-CPU (kjerner)", mode="lines+markers"), row=2, col=1)
+    figure.update_xaxes(title_text="Samtidige sesjoner", type="log", row=2, col=1)
+    figure.write_html(path)
+
+
+def _cell(value, width, digits=0):
+    return f"{value:>{width}.{digits}f}" if value is not None else f"{'-':>{width}}"
+
+
+def report(levels):
+    print(f"{'sesjoner':>8}{'int./s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'effekt.':>9}"
+          f"{'srv-CPU':>9}{'CPU ms/int':>11}{'RSS MiB':>9}{'MiB/sesj.':>10}{'kl.-CPU':>9}{'feil':>6}")
+    for level in levels:
+        print(f"{level['sessions']:>8}{level['throughput']:>9.1f}{_cell(level.get('p50_ms'), 9)}"
+              f"{_cell(level.get('p95_ms'), 9)}{_cell(level.get('p99_ms'), 9)}{level['efficiency']:>9.0%}"
+              f"{_cell(level.get('server_cpu'), 9, 2)}{_cell(level.get('cpu_ms_per_interaction'), 11, 1)}"
+              f"{_cell(level.get('rss_mb'), 9)}{_cell(level.get('rss_mb_per_session'), 10, 1)}"
+              f"{level['client_cpu']:>9.2f}{level['errors']:>6}")
+    print("\np50/p95 ms per interaksjon:")
+    print(f"{'sesjoner':>8}" + "".join(f"{step:>15}" for step in STEPS))
+    for level in levels:
+        cells = []
+        for step in STEPS:
+            stats = level["steps"].get(step)
+            cells.append(f"{stats['p50_ms']:.0f}/{stats['p95_ms']:.0f}" if stats else "-")
+        print(f"{level['sessions']:>8}" + "".join(f"{cell:>15}" for cell in cells))
+    for level in levels:
+        for message in level["error_messages"]:
+            print(f"  {level['sessions']} sesjoner: {message}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", default="1,2,4,8,16", help="Samtidige sesjoner per nivå, kommaseparert")
+    parser.add_argument("--rounds", type=int, default=2, help="Annonser hver sesjon går gjennom")
+    parser.add_argument("--think", type=float, default=1.0, help="Betenkningstid mellom interaksjoner (s)")
+    parser.add_argument("--items", type=int, default=3, help="Oppussingsposter som krysses av per annonse")
+    parser.add_argument("--listings", type=int, default=2000, help="Annonser i arkivet og i boliglageret")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Maks ventetid per interaksjon (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--archive", default=None, help="Arkivkatalog (standard som bench_replay)")
+    parser.add_argument("--plot", help="Skriv metningskurven som HTML til denne filen")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relativ p95-økning per nivå som regnes som regresjon")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON lines-fil med tidligere kjøringer")
+    parser.add_argument("--no-save", action="store_true", help="Ikke legg denne kjøringen til historikken")
+    args = parser.parse_args(argv)
+    levels_wanted = sorted({int(value) for value in args.sessions.split(",")})
+
+    sys.path.insert(0, ROOT)
+    from bench_replay import DEFAULT_ARCHIVE
+    from bench_startup import free_port
+    from suite import environment, load_history
+
+    archive_path = os.path.abspath(args.archive or DEFAULT_ARCHIVE)
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    server = None
+    try:
+        start = time.perf_counter()
+        keys = prepare(workdir, archive_path, args.listings)
+        print(f"boliglager med {args.listings} annonser klart på {time.perf_counter() - start:.1f} s")
+
+        # Every visit fetches listings no other visit has fetched, so fetches miss the listing cache
+        from finn_batch import FINN_AD_URL
+        rng = random.Random(args.seed)
+        needed = (sum(levels_wanted) + 1) * args.rounds
+        listing_urls = [FINN_AD_URL.format(key) for key in rng.sample(keys, min(needed, len(keys)))]
+        if len(listing_urls) < needed:
+            parser.error(f"arkivet har bare {len(keys)} annonser, trenger {needed}")
+
+        port = free_port()
+        log = open(os.path.join(workdir, "server.log"), "w", encoding="utf-8")
+        start = time.perf_counter()
+        server = start_server(server_environment(workdir, archive_path), port, log)
+        url = f"ws://127.0.0.1:{port}/_stcore/stream"
+        print(f"server klar på {time.perf_counter() - start:.1f} s")
+
+        # One untimed visitor first, so imports and shared caches are not billed to the first level
+        warmup = run_level(url, server.pid, 1, listing_urls[:args.rounds], args.rounds, 0.0,
+                           args.items, args.timeout, args.seed)
+        print(f"oppvarming: {warmup['seconds']:.1f} s, {warmup['errors']} feil")
+        for message in warmup["error_messages"]:
+            print(f"  {message}")
+
+        levels, offset = [], args.rounds
+        for sessions in levels_wanted:
+            level = run_level(url, server.pid, sessions, listing_urls[offset:], args.rounds, args.think,
+                              args.items, args.timeout, args.seed + offset)
+            offset += sessions * args.rounds
+            levels.append(level)
+            print(f"{sessions:>4} sesjoner: {level['throughput']:.1f} interaksjoner/s, "
+                  f"p95 {level.get('p95_ms', 0):.0f} ms, {level['errors']} feil")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            log.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    knee = saturation(levels)
+    print()
+    report(levels)
+    print()
+    if knee is None:
+        print(f"Ingen metning opp til {levels[-1]['sessions']} sesjoner")
+    else:
+        print(f"Metning ved {knee} sesjoner: hver sesjon får under "
+              f"{SATURATION_EFFICIENCY:.0%} av gjennomstrømningen til én sesjon alene")
+
+    if args.plot:
+        plot(levels, args.plot)
+        print(f"metningskurve skrevet til {args.plot}")
+
+    env = environment()
+    settings = {"rounds": args.rounds, "think": args.think, "items": args.items, "listings": args.listings}
+    history = load_history(args.history)
+    results = {f"sessions.{level['sessions']}": level for level in levels}
+    regressions = []
+    for name, level in results.items():
+        reference = baseline(history, env["machine"], settings, name)
+        if reference and "p95_ms" in level and level["p95_ms"] / reference - 1 > args.threshold:
+            regressions.append(f"{level['sessions']} sesjoner ({reference:.0f} -> {level['p95_ms']:.0f} ms p95)")
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.history), exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"environment": env, "settings": settings, "saturation": knee,
+                                "results": results}, ensure_ascii=False) + "\n")
+    if regressions:
+        print(f"{len(regressions)} regresjon(er) over {args.threshold:.0%}: {', '.join(regressions)}")
+    failures = sum(level["errors"] for level in levels)
+    return 1 if regressions or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Pages parsed per second for each available listing parser backend.
+
+Usage:
+    python benchmarks/bench_parser.py [corpus_dir] [--seconds 2]
+
+The corpus defaults to the saved listing pages in benchmarks/fixtures/listings.
+Every backend must produce the same property_data for every page.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from finn_parser import BACKENDS, parse_finn_html  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "listings")
+
+
+def load_corpus(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def pages_per_second(pages, backend, seconds):
+    parsed = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _, html in pages:
+            parse_finn_html(html, backend)
+        parsed += len(pages)
+    return parsed / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS)
+    parser.add_argument("--seconds", type=float, default=2.0, help="Run time per backend")
+    args = parser.parse_args(argv)
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        parser.error(f"no .html pages in {args.corpus}")
+
+    # All backends must agree before their speed is worth comparing
+    mismatches = 0
+    for name, html in pages:
+        expected = parse_finn_html(html, "html.parser")
+        for backend in BACKENDS:
+            if parse_finn_html(html, backend) != expected:
+                print(f"MISMATCH {backend}: {name}")
+                mismatches += 1
+
+    print(f"{len(pages)} pages from {args.corpus}")
+    baseline = None
+    for backend in reversed(list(BACKENDS)):
+        rate = pages_per_second(pages, backend, args.seconds)
+        baseline = baseline or rate
+        print(f"{backend:>12}: {rate:10.1f} pages/s  ({rate / baseline:.1f}x html.parser)")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
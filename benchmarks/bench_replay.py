@@ -0,0 +1,79 @@
+"""Listings fetched per second from a replayed HTTP archive, against pure parsing.
+
+Usage:
+    python benchmarks/bench_replay.py [--pages 100000] [--workers 8] [--archive DIR]
+
+Builds (once) an archive of --pages synthetic listing pages from the
+fixtures in benchmarks/fixtures/listings, each with its own finnkode and
+price, and then runs finn_batch.fetch_listings over all of them with
+BOLIGBUDSJETT_HTTP_MODE=replay: the full download, decode and parse
+pipeline with no network. The same pages parsed directly give the upper
+bound; the gap is what requests' Session adds per call.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ARCHIVE = os.path.join(os.path.dirname(BENCHMARK_DIR), ".cache", "replay_corpus")
+
+
+def build_archive(archive, pages, count):
+    """Record count variants of the fixture pages, finnkode 100000000 and up"""
+    for i in range(len(archive), count):
+        name, html = pages[i % len(pages)]
+        # A distinct asking price per page keeps every body unique, like a real corpus
+        html = re.sub(r'"price":"\d+"', f'"price":"{2_000_000 + i * 10}"', html)
+        archive.put(f"https://www.finn.no/realestate/homes/ad.html?finnkode={100_000_000 + i}", 200,
+                    {"Content-Type": "text/html; charset=utf-8", "ETag": f'"{i}"'}, html.encode("utf-8"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE)
+    args = parser.parse_args(argv)
+
+    # Replay through the normal sessions, with the listing cache in memory only
+    os.environ["BOLIGBUDSJETT_HTTP_MODE"] = "replay"
+    os.environ["BOLIGBUDSJETT_HTTP_ARCHIVE"] = args.archive
+    os.environ["BOLIGBUDSJETT_CACHE"] = ""
+    sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+    from bench_parser import DEFAULT_CORPUS, load_corpus
+    from finn_batch import fetch_listings
+    from finn_parser import parse_finn_html
+    from http_archive import current_archive
+
+    archive = current_archive()
+    if len(archive) < args.pages:
+        start = time.perf_counter()
+        build_archive(archive, load_corpus(DEFAULT_CORPUS), args.pages)
+        print(f"recorded {args.pages} pages in {time.perf_counter() - start:.1f} s")
+    stats = archive.stats()
+    print(f"archive: {stats['responses']} responses, {stats['pack_bytes'] / 1024 / 1024:.1f} MiB in {args.archive}")
+    keys = archive.keys()[:args.pages]
+
+    start = time.perf_counter()
+    for key in keys:
+        parse_finn_html(archive.get(key)[2].decode("utf-8"))
+    parse_rate = len(keys) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    failures = sum(
+        not success
+        for _, _, success, _ in fetch_listings(keys, workers=args.workers, rate=0, use_cache=False)
+    )
+    replay_rate = len(keys) / (time.perf_counter() - start)
+
+    print(f"   parse: {parse_rate:8.0f} pages/s (read from the archive and parsed)")
+    print(f"  replay: {replay_rate:8.0f} pages/s (finn_batch.fetch_listings, {args.workers} workers)"
+          f"  {replay_rate / parse_rate:.0%} of parse speed, {failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
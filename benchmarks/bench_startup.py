@@ -0,0 +1,103 @@
+"""Cold start and first paint of the Streamlit app, each run in a fresh interpreter.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--server]
+
+first run is the time for the first script run of calc.py with empty
+session state (what a new visitor waits for after the server has started),
+measured with streamlit's AppTest; rerun is the next run in the same
+process. --server also times `streamlit run` until its health check answers.
+The heavy libraries that the first run imported are listed, since keeping
+them out of the first run is what makes cold starts fast.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "calc.py")
+HEAVY_MODULES = ("pandas", "pyarrow", "plotly.express", "requests", "bs4", "lxml", "selectolax")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+framework = time.perf_counter() - start
+before = set(sys.modules)
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+start = time.perf_counter()
+app.run()
+first_run = time.perf_counter() - start
+start = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - start
+assert not app.exception, app.exception
+heavy = sorted(name for name in sys.argv[2:] if name in sys.modules and name not in before)
+print(json.dumps({"framework": framework, "first_run": first_run, "rerun": rerun, "heavy": heavy}))
+"""
+
+
+def probe(env):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, APP, *HEAVY_MODULES],
+        capture_output=True, text=True, cwd=ROOT, env=env, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_ready_seconds(env, timeout=60):
+    """Seconds from `streamlit run` until /_stcore/health answers"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.05)
+        raise TimeoutError("streamlit did not become healthy")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--server", action="store_true", help="Also time `streamlit run` until healthy")
+    args = parser.parse_args(argv)
+
+    env = {**os.environ, "BOLIGBUDSJETT_LOG_LEVEL": "WARNING", "PYTHONDONTWRITEBYTECODE": "0"}
+    probe(env)  # compile bytecode and warm the OS file cache once
+    results = [probe(env) for _ in range(args.runs)]
+    for name in ("framework", "first_run", "rerun"):
+        values = [result[name] * 1000 for result in results]
+        print(f"{name:>10}: median {statistics.median(values):7.1f} ms  (min {min(values):.1f}, max {max(values):.1f})")
+    print(f"     heavy: {', '.join(results[-1]['heavy']) or '-'}")
+
+    if args.server:
+        values = [server_ready_seconds(env) * 1000 for _ in range(args.runs)]
+        print(f"    server: median {statistics.median(values):7.1f} ms until healthy")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""Offline regression benchmarks for the parse, renovation cost, plan optimizer and financing hot paths.
+
+Usage:
+    python benchmarks/suite.py [--filter parse] [--seconds 1] [--threshold 0.15]
+
+Every case runs against the checked-in fixtures in benchmarks/fixtures and
+reports throughput, p50/p99 latency per call and peak traced memory. Results
+are appended to benchmarks/results/history.jsonl together with the library
+versions, and each case is compared to the median of its recent runs on the
+same machine: a p50 slower than --threshold is flagged as a regression and
+makes the run exit with status 1.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from importlib import metadata
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import requests  # noqa: E402
+
+from bench_parser import DEFAULT_CORPUS, load_corpus  # noqa: E402
+from finance import sensitivity_grid  # noqa: E402
+from finn import fetch_finn_data  # noqa: E402
+from finn_parser import BACKENDS, parse_finn_html  # noqa: E402
+from loans import ANNUITY, SERIAL, amortization_schedule, annuity_payment  # noqa: E402
+from optimizer import optimize_plan  # noqa: E402
+from renovation import renovation_costs  # noqa: E402
+
+FIXTURES = os.path.join(BENCHMARK_DIR, "fixtures")
+DEFAULT_HISTORY = os.path.join(BENCHMARK_DIR, "results", "history.jsonl")
+DEFAULT_THRESHOLD = 0.15
+BASELINE_RUNS = 5  # recent runs whose median p50 is the baseline
+TRACKED_PACKAGES = ("beautifulsoup4", "lxml", "selectolax", "numpy", "pandas", "pyarrow",
+                    "requests", "streamlit")
+
+
+class FixtureAdapter(requests.adapters.BaseAdapter):
+    """Serves the fixture listing pages for any URL, so fetch_finn_data runs offline"""
+
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = [html.encode("utf-8") for _, html in pages]
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "text/html; charset=utf-8"
+        response._content = self.pages[self.calls % len(self.pages)]
+        response.url = request.url
+        response.request = request
+        self.calls += 1
+        return response
+
+    def close(self):
+        pass
+
+
+# Cases: name -> setup() returning (function to time, units of work per call, unit name)
+
+def parse_case(backend):
+    def setup():
+        pages = [html for _, html in load_corpus(DEFAULT_CORPUS)]
+
+        def run():
+            for html in pages:
+                parse_finn_html(html, backend)
+        return run, len(pages), "sider"
+    return setup
+
+
+def fetch_case():
+    pages = load_corpus(DEFAULT_CORPUS)
+    session = requests.Session()
+    session.mount("https://", FixtureAdapter(pages))
+
+    def run():
+        for _ in pages:
+            fetch_finn_data("https://www.finn.no/realestate/homes/ad.html?finnkode=123456789", session)
+    return run, len(pages), "sider"
+
+
+def renovation_case():
+    plans = pd.read_csv(os.path.join(FIXTURES, "renovation_plans.csv"))
+    return lambda: renovation_costs(plans), len(plans), "planer"
+
+
+def optimizer_case():
+    plans = pd.read_csv(os.path.join(FIXTURES, "renovation_plans.csv"))
+    rng = np.random.default_rng(0)
+    listings = [(area, budget, price_per_sqm) for area, budget, price_per_sqm in zip(
+        plans["area"], rng.uniform(100_000, 1_500_000, len(plans)), rng.uniform(30_000, 120_000, len(plans))
+    )][:50]
+    return (lambda: [optimize_plan(*listing) for listing in listings]), len(listings), "planer"
+
+
+def _financing_grid():
+    with open(os.path.join(FIXTURES, "financing_grid.json"), encoding="utf-8") as f:
+        grid = json.load(f)
+    start, stop, step = grid["interest_rate_range"]
+    grid["interest_rates"] = np.arange(start, stop + step / 2, step)
+    grid["years"] = np.arange(grid["year_range"][0], grid["year_range"][1] + 1)
+    return grid
+
+
+def annuity_case():
+    grid = _financing_grid()
+    loans = np.asarray(grid["loan_amounts"], dtype=np.float64)[:, None, None]
+    rates = grid["interest_rates"][None, :, None]
+    years = grid["years"][None, None, :]
+    size = loans.size * rates.size * years.size
+    return lambda: annuity_payment(loans, rates, years), size, "lån"
+
+
+def sensitivity_case():
+    grid = _financing_grid()
+    return (lambda: [sensitivity_grid(amount) for amount in grid["loan_amounts"]],
+            len(grid["loan_amounts"]), "rutenett")
+
+
+def schedule_case(kind):
+    def setup():
+        grid = _financing_grid()
+        rng = np.random.default_rng(0)
+        count = grid["schedule_loans"]
+        loans = rng.choice(grid["loan_amounts"], count)
+        rates = rng.choice(grid["interest_rates"], count)
+        return (lambda: amortization_schedule(loans, rates, grid["schedule_years"], kind),
+                count, "planer")
+    return setup
+
+
+CASES = {
+    **{f"parse.{backend}": parse_case(backend) for backend in BACKENDS},
+    "fetch.offline": fetch_case,
+    "renovation.costs": renovation_case,
+    "renovation.optimize": optimizer_case,
+    "financing.annuity": annuity_case,
+    "financing.sensitivity": sensitivity_case,
+    "financing.schedule_annuity": schedule_case(ANNUITY),
+    "financing.schedule_serial": schedule_case(SERIAL),
+}
+
+
+def measure(setup, seconds, min_calls=5):
+    """Time repeated calls of one case; returns its result record"""
+    run, units, unit = setup()
+    run()  # warm-up: imports, caches, lazy parser setup
+
+    timings = []
+    gc.collect()
+    deadline = time.perf_counter() + seconds
+    while len(timings) < min_calls or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate call since tracemalloc slows everything down
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = np.asarray(timings)
+    return {
+        "calls": len(timings),
+        "units": units,
+        "unit": unit,
+        "throughput": units * len(timings) / timings.sum(),
+        "p50_ms": float(np.percentile(timings, 50) * 1000),
+        "p99_ms": float(np.percentile(timings, 99) * 1000),
+        "peak_kb": peak / 1024,
+    }
+
+
+def environment():
+    versions = {}
+    for package in TRACKED_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=BENCHMARK_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "commit": commit,
+        "packages": versions,
+    }
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline(history, machine, case, runs=BASELINE_RUNS):
+    """Median p50 of the case over its last runs on this machine, or None"""
+    previous = [entry["results"][case]["p50_ms"] for entry in history
+                if entry["environment"]["machine"] == machine and case in entry["results"]]
+    return statistics.median(previous[-runs:]) if previous else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Run time per case")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative p50 slowdown flagged as a regression")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON lines file of earlier runs")
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to the history")
+    args = parser.parse_args(argv)
+
+    env = environment()
+    history = load_history(args.history)
+    results, regressions = {}, []
+    print(f"{'case':<28}{'throughput':>24}{'p50 ms':>10}{'p99 ms':>10}{'peak KiB':>10}  vs baseline")
+    for name, setup in CASES.items():
+        if args.filter not in name:
+            continue
+        result = results[name] = measure(setup, args.seconds)
+        reference = baseline(history, env["machine"], name)
+        change = ""
+        if reference:
+            ratio = result["p50_ms"] / reference - 1
+            change = f"{ratio:+.1%}"
+            if ratio > args.threshold:
+                change += "  REGRESSION"
+                regressions.append(name)
+        print(f"{name:<28}{result['throughput']:>12.0f} {result['unit'] + '/s':<11}"
+              f"{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}{result['peak_kb']:>10.0f}  {change}")
+
+    if not args.no_save and results:
+        os.makedirs(os.path.dirname(args.history), exist_ok=True)
+        entry = {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                 "environment": env, "results": results}
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    if regressions:
+        print(f"{len(regressions)} regresjon(er) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
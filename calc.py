@@ -1,12 +1,38 @@
-import streamlit as st
-import pandas as pd
+import functools
+import os
 import re
-from urllib.parse import urlparse, parse_qs
-import plotly.express as px
-import plotly.graph_objects as go
-import requests
-from bs4 import BeautifulSoup
-import json
+from datetime import datetime, timezone
+
+import streamlit as st
+
+from finance import (
+    DEFAULT_EQUITY_PERCENT,
+    DEFAULT_INTEREST_RATE,
+    DEFAULT_YEARS,
+    SENSITIVITY_EQUITY_PERCENTS,
+    SENSITIVITY_RATES,
+    SENSITIVITY_YEARS,
+    sensitivity_grid,
+)
+from instrumentation import METRICS, start_metrics_server, timed_section
+from loans import ANNUITY, SERIAL, amortization_schedule, first_payment, schedule_frame
+from simulation import DEFAULT_MODEL, simulate_costs
+
+# pandas, plotly, pyarrow and the Finn.no fetch stack are imported where they
+# are first needed: none of them are used before a listing has been fetched,
+# and leaving them out of the first script run keeps cold starts fast
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+@st.cache_resource
+def page_css():
+    """static/style.css without comments and indentation, read once per process"""
+    with open(os.path.join(STATIC_DIR, "style.css"), encoding="utf-8") as f:
+        css = f.read()
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s*([{};:,])\s*", r"\1", css)
+    return "<style>" + re.sub(r"\s+", " ", css).strip() + "</style>"
+
 
 # Page configuration
 st.set_page_config(
@@ -16,300 +42,364 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Enhanced CSS to match Solgt.no style
-st.markdown("""
-    <style>
-    /* Global styles */
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
-    
-    * {
-        font-family: 'Inter', sans-serif;
-    }
-    
-    /* Main container */
-    .main {
-        background-color: #f8fafc;
-        padding: 1rem 2rem;
-    }
-    
-    /* Header styling */
-    h1 {
-        color: #0f172a;
-        font-weight: 700;
-        font-size: 1.875rem;
-    }
-    
-    h2, h3 {
-        color: #1e293b;
-        font-weight: 600;
-    }
-    
-    /* Card styling */
-    .stMetric, div.css-1r6slb0 {
-        background-color: white;
-        padding: 1.25rem;
-        border-radius: 0.75rem;
-        box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-        border: 1px solid #e2e8f0;
-    }
-    
-    /* Metric values */
-    div[data-testid="stMetricValue"] {
-        color: #0f172a !important;
-        font-weight: 600;
-    }
-    
-    /* Buttons */
-    .stButton > button {
-        background-color: #2563eb;
-        color: white;
-        border: none;
-        padding: 0.5rem 1rem;
-        border-radius: 0.5rem;
-        font-weight: 500;
-        transition: all 0.2s;
-    }
-    
-    .stButton > button:hover {
-        background-color: #1d4ed8;
-    }
-    
-    /* Tabs */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 1rem;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        padding: 1rem 2rem;
-        color: #64748b;
-    }
-    
-    .stTabs [data-baseweb="tab-highlight"] {
-        background-color: #2563eb;
-    }
-    
-    /* Inputs */
-    .stNumberInput input, .stTextInput input {
-        border-radius: 0.5rem;
-        border: 1px solid #e2e8f0;
-    }
-    
-    /* Sidebar */
-    .css-1d391kg {
-        background-color: white;
-    }
-    
-    /* Expander */
-    .streamlit-expanderHeader {
-        background-color: white;
-        border: 1px solid #e2e8f0;
-        border-radius: 0.5rem;
-    }
-    
-    /* Charts */
-    .js-plotly-plot {
-        border-radius: 0.75rem;
-        background-color: white;
-        padding: 1rem;
-        border: 1px solid #e2e8f0;
-    }
-    </style>
-""", unsafe_allow_html=True)
+# Enhanced CSS to match Solgt.no style, minified once per process
+st.html(page_css())
 
-# Add navigation tabs like Solgt.no
-tabs = st.tabs([
-    "🏠 Oversikt",
-    "💰 Oppussing",
-    "📊 Finansiering",
-    "📍 Område"
-])
+LOAN_TYPES = {
+    "Annuitetslån": ANNUITY,
+    "Serielån": SERIAL,
+}
 
-# First, add these constants at the top of the file after imports
-RENOVATION_COSTS = {
-    "Overflater": {
-        "Maling av vegger": {
-            "Budget": 200,
-            "Standard": 300,
-            "Premium": 400,
-            "unit": "m²",
-            "description": "Inkluderer sparkling, grunning og to strøk maling"
-        },
-        "Nytt gulv": {
-            "Budget": 800,
-            "Standard": 1200,
-            "Premium": 2000,
-            "unit": "m²",
-            "description": "Inkluderer riving av eksisterende gulv og legging av nytt"
-        }
-    },
-    "Våtrom": {
-        "Nytt bad": {
-            "Budget": 15000,
-            "Standard": 25000,
-            "Premium": 40000,
-            "unit": "m²",
-            "description": "Komplett rehabilitering inkl. membran, fliser og sanitærutstyr"
-        }
-    },
-    "Kjøkken": {
-        "Nytt kjøkken": {
-            "Budget": 8000,
-            "Standard": 15000,
-            "Premium": 30000,
-            "unit": "m²",
-            "description": "Inkluderer skap, benkeplate og montering (eks. hvitevarer)"
-        }
-    },
-    "Teknisk": {
-        "Ny elektrisk": {
-            "Budget": 800,
-            "Standard": 1000,
-            "Premium": 1500,
-            "unit": "m²",
-            "description": "Oppgradering av elektrisk anlegg"
-        },
-        "Ny ventilasjon": {
-            "Budget": 1500,
-            "Standard": 2000,
-            "Premium": 3000,
-            "unit": "m²",
-            "description": "Balansert ventilasjon med varmegjenvinning"
-        }
-    },
-    "Annet": {
-        "Nye vinduer": {
-            "Budget": 6000,
-            "Standard": 8000,
-            "Premium": 12000,
-            "unit": "stk",
-            "description": "Pris per vindu inkl. montering"
-        },
-        "Nye dører": {
-            "Budget": 3000,
-            "Standard": 5000,
-            "Premium": 8000,
-            "unit": "stk",
-            "description": "Pris per dør inkl. montering"
-        }
-    }
+REPORT_FORMATS = {
+    "PDF": "pdf",
+    "Excel": "xlsx",
+    "CSV": "csv",
 }
 
-def get_finn_data(url):
-    """Fetch and parse data from Finn.no listing"""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'nb-NO,nb;q=0.9,no-NO;q=0.8,no;q=0.6,en-US;q=0.5,en;q=0.4',
-            'Connection': 'keep-alive',
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Initialize property data with all fields
-        property_data = {
-            'price': None,
-            'size': None,
-            'rooms': None,
-            'bedrooms': None,
-            'year_built': None,
-            'address': None,
-            'property_type': None,
-            'floor': None,
-            'total_price': None,
-            'shared_debt': None,
-            'ownership_type': None,
-            'bra_total': None,
-            'bra_primary': None,
-            'bra_external': None,
-            'balcony_size': None,
-            'energy_rating': None,
-            'plot_size': None,
-            'bra_internal': None,
-        }
-
-        # Find all key-value pairs in the listing
-        key_value_pairs = soup.find_all(['dt', 'dd'])
-        
-        current_key = None
-        for elem in key_value_pairs:
-            if elem.name == 'dt':
-                current_key = elem.text.strip().lower()
-            elif elem.name == 'dd' and current_key:
-                value_text = elem.text.strip()
-                
-                # Match different data types based on the key
-                if 'totalpris' in current_key:
-                    property_data['total_price'] = int(''.join(filter(str.isdigit, value_text)))
-                elif 'prisantydning' in current_key:
-                    property_data['price'] = int(''.join(filter(str.isdigit, value_text)))
-                elif 'fellesgjeld' in current_key:
-                    property_data['shared_debt'] = int(''.join(filter(str.isdigit, value_text)))
-                elif 'bruksareal' in current_key:
-                    # Check for internal area first
-                    internal_match = re.search(r'(\d+)\s*m²\s*\(BRA-i\)', value_text)
-                    if internal_match:
-                        property_data['bra_internal'] = float(internal_match.group(1))
-                    # Then check for total area if no internal area was found
-                    elif 'primær' not in current_key:
-                        match = re.search(r'(\d+)\s*m²', value_text)
-                        if match:
-                            property_data['bra_total'] = float(match.group(1))
-                elif 'primærrom' in current_key or 'p-rom' in current_key:
-                    match = re.search(r'(\d+)\s*m²', value_text)
-                    if match:
-                        property_data['size'] = float(match.group(1))
-                elif 'byggeår' in current_key:
-                    try:
-                        property_data['year_built'] = int(''.join(filter(str.isdigit, value_text)))
-                    except ValueError:
-                        pass
-                elif 'boligtype' in current_key:
-                    property_data['property_type'] = value_text
-                elif 'eieform' in current_key:
-                    property_data['ownership_type'] = value_text
-                elif 'etasje' in current_key:
-                    try:
-                        property_data['floor'] = int(''.join(filter(str.isdigit, value_text)))
-                    except ValueError:
-                        pass
-                elif 'soverom' in current_key:
-                    try:
-                        property_data['bedrooms'] = int(''.join(filter(str.isdigit, value_text)))
-                    except ValueError:
-                        pass
-                elif 'rom' in current_key and 'sove' not in current_key:
-                    try:
-                        property_data['rooms'] = int(value_text.split()[0])
-                    except (ValueError, IndexError):
-                        pass
-                elif 'balkong' in current_key or 'terrasse' in current_key:
-                    match = re.search(r'(\d+)\s*m²', value_text)
-                    if match:
-                        property_data['balcony_size'] = float(match.group(1))
-                elif 'energimerking' in current_key:
-                    property_data['energy_rating'] = value_text
-                elif 'tomteareal' in current_key:
-                    match = re.search(r'(\d+)\s*m²', value_text)
-                    if match:
-                        property_data['plot_size'] = float(match.group(1))
-
-        # Get address from breadcrumb or title
-        address_elem = soup.find('h1', {'class': 'u-t3'}) or soup.find('h1')
-        if address_elem:
-            property_data['address'] = address_elem.text.strip()
-        
-        return property_data, True, "Data hentet successfully"
-        
-    except requests.RequestException as e:
-        return None, False, f"Nettverksfeil: {str(e)}"
-    except Exception as e:
-        return None, False, f"Feil ved henting av data: {str(e)}"
+SENSITIVITY_METRICS = {
+    "Totale månedlige kostnader": "total_monthly",
+    "Årlige kostnader": "annual_cost",
+    "Netto årlig kostnad (etter skattefradrag)": "net_annual_cost",
+}
 
-with tabs[0]:
+FETCH_POLL_INTERVAL = 0.5  # seconds between checks on a running Finn.no fetch
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_plan_selections(total_area, plan_items, region, catalog_version):
+    """Renovation cost breakdown memoized on the area, the (item, choice) pairs and the catalog version"""
+    from renovation import plan_selections
+    return plan_selections(total_area, dict(plan_items), region=region)
+
+
+def default_tier(table, item_name):
+    """Middle quality tier the item is offered in ("Standard" in the default catalog)"""
+    tiers = table.offered_tiers(item_name)
+    return tiers[len(tiers) // 2]
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_optimal_plan(total_area, budget, price_per_sqm, region, catalog_version):
+    """Budget-optimal renovation plan memoized on its inputs and the catalog version"""
+    from optimizer import optimize_plan
+    return optimize_plan(total_area, budget, price_per_sqm, region=region)
+
+
+def current_plan(table):
+    """The plan chosen in the Oppussing tab as (item name, (quality, amount)) pairs, read from widget state"""
+    plan = []
+    for items in table.costs.values():
+        for item_name, item_details in items.items():
+            if not st.session_state.get(f"check_{item_name}"):
+                continue
+            quality = st.session_state.get(f"quality_{item_name}", default_tier(table, item_name))
+            if not table.offers(item_name, quality):
+                quality = default_tier(table, item_name)
+            if item_details['unit'] == "m²":
+                amount = st.session_state.get(f"area_{item_name}", 100)
+            else:
+                amount = st.session_state.get(f"count_{item_name}", 1)
+            plan.append((item_name, (quality, amount)))
+    return plan
+
+
+def current_renovation_selections(total_area):
+    """Cost breakdown of the plan chosen in the Oppussing tab, read from widget state"""
+    from renovation import current_table
+    table = current_table()
+    return cached_plan_selections(
+        total_area, tuple(current_plan(table)), st.session_state.get("price_region"), table.version
+    )
+
+
+@st.cache_resource
+def listing_store():
+    """Process-wide store every fetched listing is appended to"""
+    from listing_store import ListingStore
+    return ListingStore()
+
+
+@st.cache_resource(show_spinner="Laster markedsindeks...")
+def market_index():
+    """Price/m² market index, caught up with the listing store on load and saved in the background"""
+    from market_index import MarketIndex
+    index = MarketIndex.load()
+    index.update_from_store(listing_store())
+    index.autosave()
+    return index
+
+
+@st.cache_resource(show_spinner="Laster boligdatabase...", ttl=60 * 60)
+def comparables_index():
+    """Spatial index over the ingested listings, shared by all sessions"""
+    from comparables import LISTINGS_PATH, ComparablesIndex, load_listings
+    if os.path.exists(LISTINGS_PATH):
+        return ComparablesIndex(load_listings(LISTINGS_PATH))
+    listings = listing_store().latest()
+    if listings.empty:
+        return None
+    return ComparablesIndex(listings)
+
+
+def rerun_plan_sections():
+    """Renovation widget callback: only the renovation, financing and portfolio sections depend on the plan"""
+    st.rerun(["renovation", "financing", "portfolio"])
+
+
+def apply_plan(plan):
+    """Button callback: set the renovation widgets to plan (item name -> (quality, amount))"""
+    from renovation import current_table
+    table = current_table()
+    for item_name, unit in zip(table.items, table.units):
+        st.session_state[f"check_{item_name}"] = item_name in plan
+        if item_name in plan:
+            quality, amount = plan[item_name]
+            st.session_state[f"quality_{item_name}"] = quality
+            st.session_state[f"area_{item_name}" if unit == "m²" else f"count_{item_name}"] = int(amount)
+    rerun_plan_sections()
+
+
+def reference_price_per_sqm(data, price, size):
+    """Price per m² value uplift is estimated from, and where it comes from
+
+    The median of the listing's market in the market index, or the
+    listing's own price per m² when the market has too few observations.
+    """
+    from listing_store import municipality_from_address
+    from market_index import market_label
+    summary = market_index().lookup(
+        municipality_from_address(data['address']),
+        data['property_type'],
+        data['year_built']
+    )
+    if summary:
+        return summary[0.5], f"median pris/m² for {market_label(summary['market'])}"
+    return price / size, "boligens egen pris/m²"
+
+
+def rerun_pricing_sections():
+    """Price region callback: the scenarios are priced in the same region as the plan"""
+    st.rerun(["renovation", "financing", "scenarios", "portfolio"])
+
+
+def rerun_loan_sections():
+    """Loan terms and running costs callback: the renovation section's cost report is built from them"""
+    st.rerun(["renovation", "financing"])
+
+
+def loan_terms():
+    """The Finansiering tab's loan terms as financing() keyword arguments, its defaults until it is shown"""
+    return {
+        "equity_percent": st.session_state.get("equity_percent", DEFAULT_EQUITY_PERCENT),
+        "interest_rate": st.session_state.get("interest_rate", DEFAULT_INTEREST_RATE),
+        "years": st.session_state.get("loan_years", DEFAULT_YEARS),
+        "loan_type": LOAN_TYPES[st.session_state.get("loan_type", next(iter(LOAN_TYPES)))],
+    }
+
+
+def running_costs(data):
+    """The Finansiering tab's monthly running costs as financing() keyword arguments
+
+    Until the tab is shown they are None, which financing() prices at its
+    defaults, except felleskostnader which comes from the listing.
+    """
+    costs = {name: st.session_state.get(name) for name in ("kommunale_avg", "forsikring", "vedlikehold", "strom")}
+    costs["felleskostnader"] = st.session_state.get("felleskostnader", data.get('shared_costs'))
+    return costs
+
+
+def render_report_download(build, *args, key, title=None, **kwargs):
+    """Format choice and download button for the report build(*args, **kwargs)
+
+    The report is generated by the download request itself, on a separate
+    thread, so reruns never build it; build and its arguments must not
+    touch st.session_state.
+    """
+    from reports import FORMATS, report_bytes
+
+    format = REPORT_FORMATS[st.radio("Format", list(REPORT_FORMATS), horizontal=True, key=f"{key}_format")]
+    mime, extension = FORMATS[format]
+    st.download_button(
+        "📥 Last ned kostnadsrapport",
+        functools.partial(report_bytes, format, build, *args, title=title, **kwargs),
+        file_name=f"kostnadsrapport.{extension}",
+        mime=mime,
+        key=key,
+        on_click="ignore"
+    )
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_yearly_schedule(loan_amount, interest_rate, years, loan_type):
+    """Yearly repayment plan memoized on the loan terms"""
+    return schedule_frame(
+        amortization_schedule(loan_amount, interest_rate, years, loan_type),
+        yearly=True
+    )
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_sensitivity_grid(total_investment, felleskostnader, kommunale_avg,
+                            forsikring, vedlikehold, strom, loan_type):
+    """Sensitivity cube memoized on its inputs, so moving a slider only re-slices it"""
+    return sensitivity_grid(
+        total_investment,
+        felleskostnader=felleskostnader,
+        kommunale_avg=kommunale_avg,
+        forsikring=forsikring,
+        vedlikehold=vedlikehold,
+        strom=strom,
+        loan_type=loan_type
+    )
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_cost_simulation(loan_amount, interest_rate, years, fixed_monthly, strom,
+                           renovation_total, loan_type, n_paths, rate_volatility,
+                           electricity_volatility, overrun_mean):
+    """Monte Carlo cost bands memoized on every input that affects them"""
+    return simulate_costs(
+        loan_amount,
+        interest_rate,
+        years,
+        fixed_monthly,
+        strom,
+        renovation_total=renovation_total,
+        loan_type=loan_type,
+        n_paths=n_paths,
+        rate_volatility=rate_volatility,
+        electricity_volatility=electricity_volatility,
+        overrun_mean=overrun_mean
+    )
+
+
+def fetch_and_store(store, index, url):
+    """get_finn_data plus recording the listing; runs once per upstream fetch"""
+    from finn import extract_finnkode, get_finn_data
+    property_data, success, message = get_finn_data(url)
+    if success:
+        record = {**property_data, "url": url, "finnkode": extract_finnkode(url),
+                  "fetched_at": datetime.now(timezone.utc)}
+        # The index takes the stored row directly; market_index() saves it
+        if store.append([record]):
+            index.add([record])
+    return property_data, success, message
+
+
+@st.cache_resource
+def fetch_service():
+    """Background fetch executor shared by every session"""
+    from fetch_service import FetchService
+    service = FetchService(functools.partial(fetch_and_store, listing_store(), market_index()))
+
+    def collect(metrics):
+        for name, value in service.stats().items():
+            metrics.set_gauge("fetch_service_jobs", value, state=name)
+    METRICS.add_collector(collect)
+    return service
+
+
+def collect_session_metrics(metrics):
+    # The session manager is not public API, so a missing one reports nothing
+    from streamlit.runtime import Runtime
+    if Runtime.exists():
+        session_mgr = getattr(Runtime.instance(), "_session_mgr", None)
+        if session_mgr is not None:
+            metrics.set_gauge("active_sessions", session_mgr.num_active_sessions())
+
+
+@st.cache_resource
+def metrics_endpoint():
+    """Start the /metrics endpoint once per server process (if BOLIGBUDSJETT_METRICS_PORT is set)"""
+    METRICS.add_collector(collect_session_metrics)
+    return start_metrics_server()
+
+
+@st.fragment(run_every=FETCH_POLL_INTERVAL)
+def render_fetch_progress():
+    """Poll the session's fetch job and hand the result to the app when it is done"""
+    from finn import REQUEST_TIMEOUT
+    job = st.session_state.fetch_job
+    if not job.done():
+        shared = f" (delt med {job.waiters - 1} andre)" if job.waiters > 1 else ""
+        st.progress(
+            min(job.elapsed() / REQUEST_TIMEOUT, 1.0),
+            text=f"Henter data fra Finn.no: {job.state}, {job.elapsed():.1f} s{shared}"
+        )
+        return
+
+    del st.session_state.fetch_job
+    property_data, success, message = job.result()
+    if success:
+        # Store the data in session state and redraw every tab with it
+        st.session_state.property_data = property_data
+        st.session_state.fetch_notice = "✅ Boligdata hentet"
+    else:
+        st.session_state.fetch_error = message
+    st.rerun()
+
+
+def portfolio():
+    """This session's portfolio of listings, created on first use"""
+    if 'portfolio' not in st.session_state:
+        from portfolio import Portfolio
+        st.session_state.portfolio = Portfolio(listing_store())
+    return st.session_state.portfolio
+
+
+def submit_portfolio_urls():
+    """Button callback: fetch every pasted listing on the shared executor"""
+    urls = [line.strip() for line in st.session_state.get("portfolio_urls", "").splitlines() if line.strip()]
+    service = fetch_service()
+    st.session_state.portfolio_jobs = [(url, service.submit(url)) for url in dict.fromkeys(urls)]
+    st.session_state.portfolio_urls = ""
+
+
+def add_current_listing():
+    """Button callback: add the listing shown in Oversikt to the portfolio"""
+    from finn import extract_finnkode
+    url = st.session_state.finn_url
+    portfolio().add([{**st.session_state.property_data, "url": url, "finnkode": extract_finnkode(url)}])
+
+
+def remove_from_portfolio():
+    """Button callback: remove the listings picked in the portfolio's remove box"""
+    portfolio().remove(st.session_state.get("portfolio_remove", []))
+    st.session_state.portfolio_remove = []
+
+
+@st.fragment(run_every=FETCH_POLL_INTERVAL)
+def render_portfolio_progress():
+    """Poll the portfolio's fetch jobs and add the listings once all of them are done"""
+    from finn import extract_finnkode
+    jobs = st.session_state.portfolio_jobs
+    done = sum(job.done() for _, job in jobs)
+    if done < len(jobs):
+        st.progress(done / len(jobs), text=f"Henter boliger fra Finn.no: {done} av {len(jobs)}")
+        return
+
+    del st.session_state.portfolio_jobs
+    records, errors = [], []
+    for url, job in jobs:
+        property_data, success, message = job.result()
+        finnkode = extract_finnkode(url)
+        if not success:
+            errors.append(f"{url}: {message}")
+        elif not finnkode:
+            errors.append(f"{url}: fant ingen finnkode i lenken")
+        else:
+            records.append({**property_data, "url": url, "finnkode": finnkode})
+    added = portfolio().add(records)
+    st.session_state.portfolio_notice = f"✅ {added} nye boliger lagt til, {len(records) - added} oppdatert"
+    if errors:
+        st.session_state.portfolio_errors = errors
+    st.rerun()
+
+
+@st.fragment(key="overview")
+@timed_section("oversikt")
+def render_overview():
+    """Property overview with the Finn.no fetch"""
     # Property overview section
     col1, col2 = st.columns([2, 1])
     
@@ -317,23 +407,23 @@ with tabs[0]:
         st.title("Oppussingskalkulator")
         finn_url = st.text_input(
             "Finn.no annonse URL",
-            placeholder="https://www.finn.no/realestate/homes/ad.html?finnkode=..."
+            placeholder="https://www.finn.no/realestate/homes/ad.html?finnkode=...",
+            key="finn_url"
         )
     
     with col2:
-        if st.button("Hent boligdata", type="primary"):
+        if st.button("Hent boligdata", type="primary", disabled='fetch_job' in st.session_state):
             if finn_url:
-                with st.spinner("Henter data fra Finn.no..."):
-                    property_data, success, message = get_finn_data(finn_url)
-                    
-                    if success:
-                        st.success("✅ Boligdata hentet")
-                        # Store the data in session state
-                        st.session_state.property_data = property_data
-                    else:
-                        st.error(f"❌ {message}")
+                # The fetch runs on the shared executor; the progress fragment picks up the result
+                st.session_state.fetch_job = fetch_service().submit(finn_url)
             else:
                 st.warning("⚠️ Vennligst lim inn en Finn.no URL")
+        if 'fetch_job' in st.session_state:
+            render_fetch_progress()
+        if 'fetch_error' in st.session_state:
+            st.error(f"❌ {st.session_state.pop('fetch_error')}")
+        if 'fetch_notice' in st.session_state:
+            st.success(st.session_state.pop('fetch_notice'))
 
     if finn_url and 'property_data' in st.session_state:
         st.markdown("### Boligdetaljer")
@@ -383,31 +473,91 @@ with tabs[0]:
         
         with col4:
             if price and size:
+                from listing_store import municipality_from_address
+                from market_index import WINDOW_MONTHS, market_label
                 price_per_sqm = int(price / size)
                 price_per_sqm_formatted = f"{price_per_sqm:,}".replace(",", " ")
-                st.metric("Pris/m²", f"{price_per_sqm_formatted} kr")
+                market = market_index().compare(
+                    price_per_sqm,
+                    municipality_from_address(data['address']),
+                    data['property_type'],
+                    data['year_built']
+                )
+                if market:
+                    st.metric(
+                        "Pris/m²",
+                        f"{price_per_sqm_formatted} kr",
+                        delta=f"{price_per_sqm / market['median'] - 1:+.0%} mot markedet",
+                        delta_color="inverse"
+                    )
+                    st.caption(
+                        f"Dyrere enn {market['rank']:.0%} av {market_label(market['market'])} "
+                        f"siste {WINDOW_MONTHS} mnd (n={market['count']})"
+                    )
+                else:
+                    st.metric("Pris/m²", f"{price_per_sqm_formatted} kr")
             if data['ownership_type']:
                 st.caption(f"Eieform: {data['ownership_type']}")
             if data['plot_size']:
                 st.caption(f"Tomt: {data['plot_size']} m²")
 
-with tabs[1]:
+
+@st.fragment(key="renovation")
+@timed_section("oppussing")
+def render_renovation():
+    """Renovation plan and cost summary"""
     if 'property_data' in st.session_state:
+        from listing_store import municipality_from_address
+        from renovation import current_table
+        from reports import listing_report
+
         st.markdown("### 🔨 Oppussingsplan")
         data = st.session_state.property_data
+        table = current_table()
         
-        # Initialize or get renovation selections from session state
-        if 'renovation_selections' not in st.session_state:
-            st.session_state.renovation_selections = {}
-        
-        total_renovation_cost = 0
         total_area = data['bra_internal'] or data['size'] or data['bra_total'] or 0
+        original_price = data['total_price'] or data['price'] or 0
         
         # Create two columns for the layout
         plan_col, summary_col = st.columns([2, 1])
         
         with plan_col:
-            for category, items in RENOVATION_COSTS.items():
+            regions = list(table.regions) or [table.default_region]
+            municipality = municipality_from_address(data['address'])
+            region = municipality if municipality in regions else table.default_region
+            st.selectbox(
+                "Prisregion",
+                regions,
+                index=regions.index(region) if region in regions else 0,
+                key="price_region",
+                help=f"Priser justert til prisindeks per {table.index_date}",
+                on_change=rerun_pricing_sections
+            )
+            if original_price and total_area:
+                with st.expander("🎯 Foreslå plan innenfor budsjett"):
+                    budget = st.number_input(
+                        "Budsjett (NOK)",
+                        min_value=0,
+                        value=int(round(original_price * 0.1, -4)),
+                        step=10000,
+                        key="renovation_budget"
+                    )
+                    price_per_sqm, source = reference_price_per_sqm(data, original_price, total_area)
+                    plan, plan_cost, uplift = cached_optimal_plan(
+                        total_area, budget, price_per_sqm, st.session_state.get("price_region"), table.version
+                    )
+                    if plan:
+                        for item_name, (quality, amount) in plan.items():
+                            scope = f"{amount:g} %" if table.details[item_name]['unit'] == "m²" else f"{amount:g} stk"
+                            st.markdown(f"- **{item_name}**: {quality}, {scope}")
+                        st.caption(
+                            f"Kostnad {plan_cost:,.0f} NOK, anslått verdiøkning {uplift:,.0f} NOK "
+                            f"ut fra {source} ({price_per_sqm:,.0f} NOK)"
+                        )
+                        st.button("Bruk denne planen", on_click=apply_plan, args=(plan,))
+                    else:
+                        st.info("Budsjettet rekker ikke til noen av oppussingspostene")
+            for category, items in table.costs.items():
                 with st.expander(f"📑 {category}", expanded=True):
                     for item_name, item_details in items.items():
                         st.markdown(f"**{item_name}**")
@@ -418,56 +568,53 @@ with tabs[1]:
                             needs_renovation = st.checkbox(
                                 "Skal oppusses",
                                 key=f"check_{item_name}",
-                                help=f"Velg dette hvis {item_name.lower()} skal oppgraderes"
+                                help=f"Velg dette hvis {item_name.lower()} skal oppgraderes",
+                                on_change=rerun_plan_sections
                             )
                         
                         if needs_renovation:
+                            tiers = table.offered_tiers(item_name)
+                            # Defaults live in session state only, so apply_plan can set these
+                            # widgets; a tier dropped from the catalog since it was chosen falls
+                            # back to the default
+                            if st.session_state.get(f"quality_{item_name}") not in tiers:
+                                st.session_state[f"quality_{item_name}"] = default_tier(table, item_name)
                             with col2:
-                                quality = st.select_slider(
+                                st.select_slider(
                                     "Kvalitetsnivå",
-                                    options=["Budget", "Standard", "Premium"],
-                                    value="Standard",
-                                    key=f"quality_{item_name}"
+                                    options=tiers,
+                                    key=f"quality_{item_name}",
+                                    on_change=rerun_plan_sections
                                 )
                             
                             with col3:
                                 if item_details['unit'] == "m²":
-                                    area_percent = st.slider(
+                                    st.session_state.setdefault(f"area_{item_name}", 100)
+                                    st.slider(
                                         "Andel (%)",
-                                        0, 100, 100,
-                                        key=f"area_{item_name}"
+                                        0, 100,
+                                        key=f"area_{item_name}",
+                                        on_change=rerun_plan_sections
                                     )
-                                    area = (total_area * area_percent / 100)
                                 else:  # For items counted in pieces
-                                    area = st.number_input(
+                                    st.session_state.setdefault(f"count_{item_name}", 1)
+                                    st.number_input(
                                         "Antall",
-                                        1, 20, 1,
-                                        key=f"count_{item_name}"
+                                        1, 20,
+                                        key=f"count_{item_name}",
+                                        on_change=rerun_plan_sections
                                     )
-                            
-                            # Calculate cost for this item
-                            unit_cost = item_details[quality]
-                            total_item_cost = unit_cost * area
-                            
-                            # Store selection
-                            st.session_state.renovation_selections[item_name] = {
-                                "quality": quality,
-                                "area": area,
-                                "unit": item_details['unit'],
-                                "unit_cost": unit_cost,
-                                "total_cost": total_item_cost
-                            }
-                            
-                            total_renovation_cost += total_item_cost
-                        else:
-                            # Remove from selections if unchecked
-                            st.session_state.renovation_selections.pop(item_name, None)
+        
+        # Calculate costs for the selected items
+        st.session_state.renovation_selections = current_renovation_selections(total_area)
+        total_renovation_cost = sum(
+            details['total_cost'] for details in st.session_state.renovation_selections.values()
+        )
         
         with summary_col:
             st.markdown("### 💰 Kostnadssammendrag")
             
             # Original property cost
-            original_price = data['total_price'] or data['price'] or 0
             st.metric(
                 "Kjøpspris",
                 f"{original_price:,.0f} NOK",
@@ -507,45 +654,250 @@ with tabs[1]:
                     **{item_name}**
                     - Kvalitet: {details['quality']}
                     - Omfang: {details['area']:.1f} {details['unit']}
-                    - Enhetspris: {details['unit_cost']:,} NOK/{details['unit']}
+                    - Enhetspris: {details['unit_cost']:,.0f} NOK/{details['unit']}
                     - Total: {details['total_cost']:,.0f} NOK
                     """)
             
-            # Download report button
-            if st.button("📥 Last ned kostnadsrapport"):
-                # Create report content
-                report = f"""
-                Kostnadsrapport for {data['address']}
-                
-                Opprinnelig kjøpspris: {original_price:,.0f} NOK
-                Oppussingskostnad: {total_renovation_cost:,.0f} NOK
-                Total investering: {total_investment:,.0f} NOK
-                
-                Spesifisert oppussing:
-                """
-                for item_name, details in st.session_state.renovation_selections.items():
-                    report += f"\n{item_name}:"
-                    report += f"\n- Kvalitet: {details['quality']}"
-                    report += f"\n- Omfang: {details['area']:.1f} {details['unit']}"
-                    report += f"\n- Kostnad: {details['total_cost']:,.0f} NOK"
-                
-                # Convert to PDF or offer as text download
-                st.download_button(
-                    "Last ned rapport",
-                    report,
-                    file_name="kostnadsrapport.txt",
-                    mime="text/plain"
+            # The report is only generated when the download is requested
+            render_report_download(
+                listing_report,
+                dict(data),
+                st.session_state.renovation_selections,
+                key="renovation_report",
+                title=f"Kostnadsrapport for {data['address']}",
+                **loan_terms(),
+                **running_costs(data)
+            )
+
+
+def load_scenarios():
+    """File uploader callback: replace the scenarios with the ones in a saved JSON file"""
+    import json
+    from renovation import scenarios_frame
+
+    upload = st.session_state.get("scenario_upload")
+    if upload is None:
+        return
+    try:
+        saved = json.loads(upload.getvalue())
+        scenarios = [
+            (scenario["name"], {item_name: tuple(choice) for item_name, choice in scenario["items"].items()})
+            for scenario in saved["scenarios"]
+        ]
+        st.session_state.scenarios = scenarios_frame(scenarios)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        st.session_state.scenario_error = f"Kunne ikke lese scenariofilen: {e}"
+        return
+    # The editor keeps its own edits on top of the frame it was given; start from the loaded one
+    st.session_state.pop("scenario_editor", None)
+
+
+def add_scenarios(scenarios):
+    """Append (name, plan) pairs to the scenario table, keeping the edits made in it so far"""
+    import pandas as pd
+    from renovation import scenarios_frame
+
+    table = st.session_state.scenario_table
+    st.session_state.scenarios = pd.concat([table, scenarios_frame(scenarios)], ignore_index=True)
+    st.session_state.pop("scenario_editor", None)
+
+
+def add_current_plan():
+    """Button callback: add the plan chosen above as a scenario"""
+    from renovation import current_table
+    add_scenarios([
+        (f"Scenario {len(st.session_state.scenario_table) + 1}", dict(current_plan(current_table())))
+    ])
+
+
+def add_current_plan_tiers():
+    """Button callback: add the plan chosen above once per quality tier"""
+    from renovation import current_table
+    table = current_table()
+    plan = current_plan(table)
+    add_scenarios([
+        (tier, {
+            item_name: (tier if tier in table.offered_tiers(item_name) else quality, amount)
+            for item_name, (quality, amount) in plan
+        })
+        for tier in table.tiers
+    ])
+
+
+def unique_names(names):
+    """Scenario names for charts: blanks numbered, duplicates suffixed"""
+    labels = []
+    for position, name in enumerate(names, 1):
+        name = name.strip() if isinstance(name, str) and name.strip() else f"Scenario {position}"
+        label, copy = name, 2
+        while label in labels:
+            label, copy = f"{name} ({copy})", copy + 1
+        labels.append(label)
+    return labels
+
+
+@st.fragment(key="scenarios")
+@timed_section("scenarioer")
+def render_scenarios():
+    """Named renovation scenarios priced and compared side by side"""
+    if 'property_data' in st.session_state:
+        import json
+
+        import pandas as pd
+        import plotly.express as px
+        from renovation import (
+            ScenarioCosts,
+            amount_column,
+            current_table,
+            quality_column,
+            scenario_columns,
+            scenario_plans,
+            scenarios_frame,
+        )
+
+        st.markdown("### 🧮 Scenarioer")
+        st.caption("Definer flere navngitte oppussingsplaner og sammenlign dem side om side")
+        data = st.session_state.property_data
+        table = current_table()
+        total_area = data['bra_internal'] or data['size'] or data['bra_total'] or 0
+        original_price = data['total_price'] or data['price'] or 0
+
+        base = st.session_state.get("scenarios")
+        if base is None:
+            base = st.session_state.scenarios = scenarios_frame([], table)
+        elif list(base.columns) != scenario_columns(table):
+            # The catalog gained or lost items since the scenarios were defined
+            base = st.session_state.scenarios = base.reindex(columns=scenario_columns(table))
+            st.session_state.pop("scenario_editor", None)
+
+        column_config = {"name": st.column_config.TextColumn("Scenario", required=True)}
+        for item_name, per_area in zip(table.items, table.per_area):
+            column_config[quality_column(item_name)] = st.column_config.SelectboxColumn(
+                item_name,
+                options=table.offered_tiers(item_name),
+                help="Kvalitetsnivå, tom hvis posten ikke skal oppusses"
+            )
+            column_config[amount_column(item_name)] = st.column_config.NumberColumn(
+                f"{item_name} (%)" if per_area else f"{item_name} (antall)",
+                min_value=0 if per_area else 1,
+                max_value=100 if per_area else 20,
+                step=1,
+                help="Andel av arealet, 100 hvis tom" if per_area else "Antall, 1 hvis tom"
+            )
+        edited = st.data_editor(
+            base,
+            key="scenario_editor",
+            column_config=column_config,
+            num_rows="dynamic",
+            hide_index=True,
+            width="stretch"
+        )
+
+        st.session_state.scenario_table = edited
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.button("➕ Legg til gjeldende plan", on_click=add_current_plan, width="stretch")
+        with col2:
+            st.button(
+                "🎚️ Gjeldende plan i hvert kvalitetsnivå",
+                on_click=add_current_plan_tiers,
+                width="stretch"
+            )
+        with col3:
+            saved = {"scenarios": [
+                {"name": name, "items": {item_name: list(choice) for item_name, choice in plan.items()}}
+                for name, plan in scenario_plans(edited, table)
+            ]}
+            st.download_button(
+                "💾 Lagre scenarioer",
+                json.dumps(saved, ensure_ascii=False, indent=2),
+                file_name="oppussingsscenarioer.json",
+                mime="application/json",
+                width="stretch"
+            )
+        st.file_uploader(
+            "Åpne lagrede scenarioer",
+            type="json",
+            key="scenario_upload",
+            on_change=load_scenarios
+        )
+        if 'scenario_error' in st.session_state:
+            st.error(f"❌ {st.session_state.pop('scenario_error')}")
+
+        scenarios = edited.dropna(how="all")
+        if scenarios.empty:
+            st.info("Legg til scenarioer i tabellen eller fra den gjeldende planen for å sammenligne dem")
+            return
+
+        # Only scenarios whose definition changed since the last run are priced
+        region = st.session_state.get("price_region")
+        engine = st.session_state.get("scenario_costs")
+        if engine is None or not engine.matches(total_area, table, region):
+            engine = st.session_state.scenario_costs = ScenarioCosts(total_area, table, region)
+        costs = engine.costs(scenarios)
+
+        names = unique_names(scenarios["name"])
+        total_investment = original_price + costs["total"].to_numpy()
+        summary = pd.DataFrame({
+            "Scenario": names,
+            "Oppussing": costs["total"].to_numpy(),
+            "Total investering": total_investment,
+            "Ny pris/m²": total_investment / total_area if total_area > 0 else float("nan")
+        })
+
+        chart_col1, chart_col2 = st.columns(2)
+        with chart_col1:
+            breakdown = costs[table.items].assign(Kjøpspris=original_price, Scenario=names).melt(
+                id_vars="Scenario", value_vars=["Kjøpspris", *table.items], var_name="Post", value_name="NOK"
+            )
+            fig = px.bar(
+                breakdown[breakdown["NOK"] > 0],
+                x="Scenario",
+                y="NOK",
+                color="Post",
+                title="Total investering"
+            )
+            st.plotly_chart(fig, width="stretch")
+        with chart_col2:
+            if total_area > 0:
+                fig = px.bar(summary, x="Scenario", y="Ny pris/m²", title="Ny pris per m²")
+                fig.add_hline(
+                    y=original_price / total_area,
+                    line_dash="dash",
+                    annotation_text="Uten oppussing"
                 )
+                st.plotly_chart(fig, width="stretch")
 
-with tabs[2]:
+        st.dataframe(
+            summary.style.format({
+                "Oppussing": "{:,.0f}",
+                "Total investering": "{:,.0f}",
+                "Ny pris/m²": "{:,.0f}"
+            }),
+            width="stretch",
+            hide_index=True
+        )
+
+
+@st.fragment(key="financing")
+@timed_section("finansiering")
+def render_financing():
+    """Loan calculator, monthly costs and analyses"""
     if 'property_data' in st.session_state:
+        import pandas as pd
+        import plotly.express as px
+        import plotly.graph_objects as go
+
         st.markdown("### 💳 Finansieringsplan")
         data = st.session_state.property_data
         
         # Get total investment cost from renovation tab
-        total_investment = (data['total_price'] or data['price'] or 0)
-        if 'renovation_selections' in st.session_state:
-            total_investment += sum(item['total_cost'] for item in st.session_state.renovation_selections.values())
+        total_area = data['bra_internal'] or data['size'] or data['bra_total'] or 0
+        renovation_total = sum(
+            details['total_cost'] for details in current_renovation_selections(total_area).values()
+        )
+        total_investment = (data['total_price'] or data['price'] or 0) + renovation_total
         
         col1, col2 = st.columns([1.5, 1])
         
@@ -558,6 +910,8 @@ with tabs[2]:
                 min_value=0,
                 max_value=100,
                 value=15,
+                key="equity_percent",
+                on_change=rerun_loan_sections,
                 help="Minimum 15% egenkapital er vanlig krav fra banker"
             )
             
@@ -572,6 +926,8 @@ with tabs[2]:
                     min_value=0.0,
                     max_value=15.0,
                     step=0.1,
+                    key="interest_rate",
+                    on_change=rerun_loan_sections,
                     help="Effektiv lånerente"
                 )
             with col2:
@@ -579,22 +935,34 @@ with tabs[2]:
                     "Nedbetalingstid (år)",
                     value=25,
                     min_value=1,
-                    max_value=30
+                    max_value=30,
+                    key="loan_years",
+                    on_change=rerun_loan_sections
                 )
             
             # Monthly costs
             st.markdown("#### Månedlige kostnader")
             
-            # Calculate loan payment
-            monthly_rate = interest_rate / (100 * 12)
-            num_payments = years * 12
-            monthly_loan = loan_amount * (monthly_rate * (1 + monthly_rate)**num_payments) / ((1 + monthly_rate)**num_payments - 1)
+            loan_type_label = st.radio(
+                "Lånetype",
+                list(LOAN_TYPES),
+                horizontal=True,
+                key="loan_type",
+                on_change=rerun_loan_sections,
+                help="Annuitetslån har like terminbeløp, serielån har like avdrag"
+            )
+            loan_type = LOAN_TYPES[loan_type_label]
+
+            # Calculate loan payment (first payment for serial loans)
+            monthly_loan = float(first_payment(loan_amount, interest_rate, years, loan_type))
             
             # Additional monthly costs
             felleskostnader = st.number_input(
                 "Felleskostnader",
                 value=data.get('shared_costs', 2500),
                 step=100,
+                key="felleskostnader",
+                on_change=rerun_loan_sections,
                 help="Månedlige felleskostnader"
             )
             
@@ -602,6 +970,8 @@ with tabs[2]:
                 "Kommunale avgifter",
                 value=500,
                 step=100,
+                key="kommunale_avg",
+                on_change=rerun_loan_sections,
                 help="Månedlige kommunale avgifter"
             )
             
@@ -609,6 +979,8 @@ with tabs[2]:
                 "Forsikring",
                 value=300,
                 step=100,
+                key="forsikring",
+                on_change=rerun_loan_sections,
                 help="Månedlig forsikringskostnad"
             )
             
@@ -616,6 +988,8 @@ with tabs[2]:
                 "Vedlikeholdsavsetning",
                 value=int(total_investment * 0.001),  # 0.1% of property value per month
                 step=100,
+                key="vedlikehold",
+                on_change=rerun_loan_sections,
                 help="Anbefalt månedlig avsetning til vedlikehold"
             )
             
@@ -623,8 +997,30 @@ with tabs[2]:
                 "Strøm/oppvarming (estimat)",
                 value=1500,
                 step=100,
+                key="strom",
+                on_change=rerun_loan_sections,
                 help="Estimerte månedlige strømkostnader"
             )
+
+            with st.expander("📉 Nedbetalingsplan"):
+                schedule = cached_yearly_schedule(loan_amount, interest_rate, years, loan_type)
+                fig = px.bar(
+                    schedule,
+                    x="År",
+                    y=["Renter", "Avdrag"],
+                    labels={"value": "NOK per år", "variable": ""}
+                )
+                st.plotly_chart(fig, width="stretch")
+                st.dataframe(
+                    schedule.style.format({
+                        "Renter": "{:,.0f}",
+                        "Avdrag": "{:,.0f}",
+                        "Terminbeløp": "{:,.0f}",
+                        "Restgjeld": "{:,.0f}"
+                    }),
+                    width="stretch",
+                    hide_index=True
+                )
         
         with col2:
             st.markdown("#### 💰 Kostnadssammendrag")
@@ -713,26 +1109,349 @@ with tabs[2]:
                 help="Årlige kostnader etter skattefradrag"
             )
 
-with tabs[3]:
-    if finn_url:
+        st.markdown("---")
+        if st.toggle("📈 Sensitivitetsanalyse", help="Kostnader for alle kombinasjoner av rente og egenkapital"):
+            grid = cached_sensitivity_grid(
+                total_investment,
+                felleskostnader,
+                kommunale_avg,
+                forsikring,
+                vedlikehold,
+                strom,
+                loan_type
+            )
+            metric_label = st.selectbox("Vis", list(SENSITIVITY_METRICS))
+            years_index = list(SENSITIVITY_YEARS).index(years)
+            values = grid[SENSITIVITY_METRICS[metric_label]][:, :, years_index]
+
+            fig = go.Figure(go.Heatmap(
+                z=values.T,
+                x=SENSITIVITY_RATES,
+                y=SENSITIVITY_EQUITY_PERCENTS,
+                colorscale="Blues",
+                colorbar={"title": "NOK"},
+                hovertemplate="Rente: %{x:.1f}%<br>Egenkapital: %{y}%<br>%{z:,.0f} NOK<extra></extra>"
+            ))
+            # Mark the current choice of rate and equity
+            fig.add_trace(go.Scatter(
+                x=[interest_rate],
+                y=[egenkapital_prosent],
+                mode="markers",
+                marker={"symbol": "x", "size": 12, "color": "#dc2626"},
+                name="Valgt",
+                hoverinfo="skip"
+            ))
+            fig.update_layout(
+                title=f"{metric_label} ved {years} års nedbetaling",
+                xaxis_title="Lånerente (%)",
+                yaxis_title="Egenkapital (%)",
+                showlegend=False
+            )
+            st.plotly_chart(fig, width="stretch")
+
+        if st.toggle("🎲 Simulering av totalkostnad", help="Monte Carlo-simulering av rente, strømpris og overskridelser"):
+            sim_col1, sim_col2, sim_col3, sim_col4 = st.columns(4)
+            with sim_col1:
+                n_paths = st.select_slider(
+                    "Antall simuleringer",
+                    options=[10_000, 25_000, 50_000, 100_000],
+                    value=25_000
+                )
+            with sim_col2:
+                rate_volatility = st.slider(
+                    "Rentevolatilitet (%-poeng/år)",
+                    0.0, 3.0, DEFAULT_MODEL["rate_volatility"], 0.1
+                )
+            with sim_col3:
+                electricity_volatility = st.slider(
+                    "Strømprisvolatilitet",
+                    0.0, 1.0, DEFAULT_MODEL["electricity_volatility"], 0.05
+                )
+            with sim_col4:
+                overrun_mean = st.slider(
+                    "Forventet overskridelse oppussing (%)",
+                    0, 50, int(DEFAULT_MODEL["overrun_mean"] * 100)
+                )
+
+            with st.spinner("Simulerer..."):
+                simulated = cached_cost_simulation(
+                    loan_amount,
+                    interest_rate,
+                    years,
+                    felleskostnader + kommunale_avg + forsikring + vedlikehold,
+                    strom,
+                    renovation_total,
+                    loan_type,
+                    n_paths,
+                    rate_volatility,
+                    electricity_volatility,
+                    overrun_mean / 100
+                )
+
+            sim_years = simulated["months"] / 12
+            bands = simulated["percentiles"]
+            fig = go.Figure()
+            for low, high, opacity in ((5, 95, 0.15), (25, 75, 0.3)):
+                fig.add_trace(go.Scatter(
+                    x=sim_years, y=bands[high], mode="lines",
+                    line={"width": 0}, showlegend=False, hoverinfo="skip"
+                ))
+                fig.add_trace(go.Scatter(
+                    x=sim_years, y=bands[low], mode="lines", line={"width": 0},
+                    fill="tonexty", fillcolor=f"rgba(37, 99, 235, {opacity})",
+                    name=f"{low}.–{high}. persentil"
+                ))
+            fig.add_trace(go.Scatter(
+                x=sim_years, y=bands[50], mode="lines",
+                line={"color": "#2563eb"}, name="Median"
+            ))
+            fig.update_layout(
+                xaxis_title="År",
+                yaxis_title="Akkumulert kostnad (NOK)",
+                hovermode="x unified"
+            )
+            st.plotly_chart(fig, width="stretch")
+
+            sim_col1, sim_col2, sim_col3 = st.columns(3)
+            sim_col1.metric("Median totalkostnad", f"{bands[50][-1]:,.0f} NOK")
+            sim_col2.metric("5. persentil", f"{bands[5][-1]:,.0f} NOK")
+            sim_col3.metric("95. persentil", f"{bands[95][-1]:,.0f} NOK")
+
+
+@st.fragment(key="area")
+@timed_section("omrade")
+def render_area():
+    """Comparable properties in the area"""
+    if st.session_state.get("finn_url") and 'property_data' in st.session_state:
+        import pandas as pd
+        from comparables import DEFAULT_RADIUS_KM
+        from finn import extract_finnkode
+
         # Area analysis like Solgt.no
         st.markdown("### Områdeanalyse")
-        st.info("🔍 Viser sammenlignbare boliger i området")
-        
-        # Mock data for similar properties
-        similar_properties = pd.DataFrame({
-            "Adresse": ["Testveien 1", "Testveien 2", "Testveien 3"],
-            "Pris": [4200000, 4100000, 4300000],
-            "Størrelse": [70, 68, 72],
-            "Pris/m²": [60000, 60294, 59722]
-        })
-        
+        data = st.session_state.property_data
+
+        index = comparables_index()
+        if index is None:
+            st.info("🔍 Ingen boligdatabase er lastet inn ennå, så sammenlignbare boliger kan ikke vises")
+            return
+        if data.get('latitude') is None or data.get('longitude') is None:
+            st.info("🔍 Annonsen mangler koordinater, så sammenlignbare boliger kan ikke finnes")
+            return
+
+        radius = st.slider("Søkeradius (km)", 0.5, 10.0, DEFAULT_RADIUS_KM, 0.5)
+        price = data['total_price'] or data['price'] or 0
+        size = data['bra_internal'] or data['size'] or data['bra_total'] or 0
+        similar_properties, stats = index.query(
+            data['latitude'],
+            data['longitude'],
+            property_type=data['property_type'],
+            area=size or None,
+            radius_km=radius,
+            # The listing itself is in the index once it has been stored
+            exclude_finnkode=data.get('finnkode') or extract_finnkode(st.session_state.finn_url)
+        )
+        if not stats['count']:
+            st.info(f"🔍 Fant ingen sammenlignbare boliger innen {radius:g} km")
+            return
+
+        st.info(
+            f"🔍 Viser {len(similar_properties)} av {stats['count']} sammenlignbare boliger "
+            f"innen {radius:g} km (samme boligtype, ±20% areal)"
+        )
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Median pris/m² i området", f"{stats['median']:,.0f} kr".replace(",", " "))
+        with col2:
+            st.metric(
+                "25.–75. persentil",
+                f"{stats['p25']:,.0f}–{stats['p75']:,.0f} kr".replace(",", " ")
+            )
+        with col3:
+            if price and size:
+                price_per_sqm = price / size
+                st.metric(
+                    "Denne boligen",
+                    f"{price_per_sqm:,.0f} kr/m²".replace(",", " "),
+                    delta=f"{price_per_sqm / stats['median'] - 1:+.1%} mot median",
+                    delta_color="inverse"
+                )
+
         st.dataframe(
-            similar_properties,
-            use_container_width=True,
+            pd.DataFrame({
+                "Adresse": similar_properties["address"],
+                "Pris": similar_properties["price"],
+                "Størrelse": similar_properties["area"],
+                "Pris/m²": similar_properties["price_per_sqm"].round(),
+                "Avstand (km)": similar_properties["distance_km"].round(2)
+            }),
+            width="stretch",
             hide_index=True
         )
 
+
+@st.fragment(key="portfolio")
+@timed_section("portefolje")
+def render_portfolio():
+    """Many listings evaluated at once in one sortable table"""
+    st.markdown("### 📁 Portefølje")
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        st.text_area(
+            "Finn.no-lenker",
+            key="portfolio_urls",
+            placeholder="Én annonse per linje",
+            height=100
+        )
+    with col2:
+        st.button(
+            "Legg til i porteføljen",
+            type="primary",
+            on_click=submit_portfolio_urls,
+            disabled='portfolio_jobs' in st.session_state
+        )
+        if 'property_data' in st.session_state and st.session_state.get("finn_url"):
+            st.button("➕ Legg til gjeldende bolig", on_click=add_current_listing)
+        if 'portfolio_jobs' in st.session_state:
+            render_portfolio_progress()
+        if 'portfolio_notice' in st.session_state:
+            st.success(st.session_state.pop('portfolio_notice'))
+        for error in st.session_state.pop('portfolio_errors', []):
+            st.error(f"❌ {error}")
+
+    holdings = st.session_state.get("portfolio")
+    if not holdings:
+        st.info("Legg til boliger for å sammenligne dem med oppussingsplanen og finansieringen")
+        return
+
+    import pandas as pd
+    from portfolio import evaluate
+    from renovation import current_table
+    from reports import portfolio_report, table_chunks
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        equity_percent = st.slider("Egenkapital (%)", 0, 100, 15, key="portfolio_equity")
+    with col2:
+        interest_rate = st.number_input(
+            "Lånerente (%)", min_value=0.0, max_value=15.0, value=4.5, step=0.1, key="portfolio_rate"
+        )
+    with col3:
+        years = st.number_input("Nedbetalingstid (år)", min_value=1, max_value=30, value=25, key="portfolio_years")
+    with col4:
+        loan_type = LOAN_TYPES[st.radio("Lånetype", list(LOAN_TYPES), key="portfolio_loan_type")]
+
+    # The Oppussing tab's plan applied to every listing, financed with the terms above
+    table = holdings.table()
+    price_table = current_table()
+    plan = dict(current_plan(price_table))
+    market = market_index()
+    results = evaluate(
+        table,
+        plan,
+        market,
+        price_table,
+        equity_percent=equity_percent,
+        interest_rate=interest_rate,
+        years=years,
+        loan_type=loan_type
+    )
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Boliger", len(results))
+    col2.metric("Samlet kjøpesum", f"{results['price'].sum():,.0f} NOK")
+    col3.metric("Samlet investering", f"{results['total_investment'].sum():,.0f} NOK")
+    col4.metric("Median pris/m²", f"{results['price_per_sqm'].median():,.0f} NOK")
+
+    grid = pd.DataFrame({
+        "Adresse": results["address"],
+        "Type": results["property_type"],
+        "Pris": results["price"].round(),
+        "Areal": results["area"],
+        "Pris/m²": results["price_per_sqm"].round(),
+        "Mot markedet": results["vs_market"],
+        "Oppussing": results["renovation_cost"].round(),
+        "Total investering": results["total_investment"].round(),
+        "Ny pris/m²": results["new_price_per_sqm"].round(),
+        "Lån": results["loan_amount"].round(),
+        "Per måned": results["total_monthly"].round(),
+        "Netto per år": results["net_annual_cost"].round(),
+        "Annonse": table["url"],
+    })
+    st.dataframe(
+        grid,
+        column_config={
+            "Areal": st.column_config.NumberColumn(format="%.0f m²"),
+            "Mot markedet": st.column_config.NumberColumn(
+                format="percent", help="Pris/m² mot medianen i boligens marked"
+            ),
+            "Annonse": st.column_config.LinkColumn(display_text="Finn.no"),
+            **{
+                name: st.column_config.NumberColumn(format="localized")
+                for name in ("Pris", "Pris/m²", "Oppussing", "Total investering", "Ny pris/m²",
+                             "Lån", "Per måned", "Netto per år")
+            },
+        },
+        width="stretch",
+        hide_index=True
+    )
+    render_report_download(
+        portfolio_report,
+        table_chunks(table),
+        plan,
+        market,
+        price_table,
+        key="portfolio_report",
+        title=f"Kostnadsrapport for {len(table)} boliger",
+        equity_percent=equity_percent,
+        interest_rate=interest_rate,
+        years=years,
+        loan_type=loan_type
+    )
+
+    labels = dict(zip(results["finnkode"], results["address"]))
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.multiselect(
+            "Fjern boliger",
+            list(labels),
+            format_func=lambda finnkode: f"{labels[finnkode]} ({finnkode})",
+            key="portfolio_remove"
+        )
+    with col2:
+        st.button("Fjern valgte", on_click=remove_from_portfolio)
+    where = "i minnet" if holdings.resident else "lest fra boliglageret"
+    st.caption(f"{len(holdings)} boliger, {where} ({holdings.memory_bytes() / 1024:.0f} KiB)")
+
+
+metrics_endpoint()
+
+# Add navigation tabs like Solgt.no
+tabs = st.tabs([
+    "🏠 Oversikt",
+    "💰 Oppussing",
+    "📊 Finansiering",
+    "📍 Område",
+    "📁 Portefølje"
+])
+
+with tabs[0]:
+    render_overview()
+
+with tabs[1]:
+    render_renovation()
+    render_scenarios()
+
+with tabs[2]:
+    render_financing()
+
+with tabs[3]:
+    render_area()
+
+with tabs[4]:
+    render_portfolio()
+
 # Footer similar to Solgt.no
 st.markdown("---")
 footer_cols = st.columns(4)
@@ -0,0 +1,240 @@
+"""Comparable listings near a property, backed by a grid-bucket spatial index.
+
+Usage:
+    python comparables.py --synthetic 1000000 -o listings.parquet
+    python comparables.py listings.parquet --lat 59.91 --lon 10.75 --type Leilighet --area 65
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+LISTINGS_PATH = os.environ.get(
+    "BOLIGBUDSJETT_LISTINGS",
+    os.path.join("data", "listings.parquet")
+)
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_CELL_KM = 2.0
+DEFAULT_RADIUS_KM = 2.0
+DEFAULT_AREA_TOLERANCE = 0.2
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+
+# Columns of the comparables store; price and area are coalesced from the
+# property_data fields the same way the Oversikt tab does
+COLUMNS = ("finnkode", "address", "price", "area", "year_built", "property_type",
+           "latitude", "longitude")
+PRICE_FIELDS = ("total_price", "price")
+AREA_FIELDS = ("bra_internal", "size", "bra_total", "area")
+
+# Cell coordinates are packed into one int64 key, 21 bits per axis
+_AXIS_BITS = 21
+_AXIS_OFFSET = 1 << (_AXIS_BITS - 1)
+
+
+def _unit_vectors(latitude, longitude):
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _cell_keys(cells):
+    cells = cells.astype(np.int64) + _AXIS_OFFSET
+    return (cells[..., 0] << (2 * _AXIS_BITS)) | (cells[..., 1] << _AXIS_BITS) | cells[..., 2]
+
+
+def _coalesce(frame, columns):
+    result = pd.Series(np.nan, index=frame.index, dtype=np.float64)
+    for column in reversed(columns):
+        if column in frame:
+            values = pd.to_numeric(frame[column], errors="coerce")
+            result = values.where(values.notna() & (values != 0), result)
+    return result
+
+
+def listings_frame(records):
+    """Normalize property_data dicts (or a DataFrame of them) to the comparables columns"""
+    frame = pd.DataFrame(records) if not isinstance(records, pd.DataFrame) else records
+    normalized = pd.DataFrame(index=frame.index)
+    for column in ("finnkode", "address", "property_type"):
+        normalized[column] = frame[column] if column in frame else None
+    normalized["price"] = _coalesce(frame, PRICE_FIELDS)
+    normalized["area"] = _coalesce(frame, AREA_FIELDS)
+    for column in ("year_built", "latitude", "longitude"):
+        normalized[column] = pd.to_numeric(frame[column], errors="coerce") if column in frame else np.nan
+    return normalized
+
+
+class ComparablesIndex:
+    """Listings bucketed into cubic cells of a 3-D (unit sphere x Earth radius) grid
+
+    Rows are sorted by cell key, so a radius query only inspects the cells
+    overlapping the search ball, each found with a binary search.
+    """
+
+    def __init__(self, frame, cell_km=DEFAULT_CELL_KM):
+        frame = listings_frame(frame)
+        frame = frame[frame["latitude"].notna() & frame["longitude"].notna()
+                      & (frame["price"] > 0) & (frame["area"] > 0)]
+        self.cell_km = cell_km
+
+        points = _unit_vectors(frame["latitude"].to_numpy(), frame["longitude"].to_numpy()) * EARTH_RADIUS_KM
+        keys = _cell_keys(np.floor(points / cell_km))
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.points = points[order]
+        self.frame = frame.iloc[order].reset_index(drop=True)
+        self.price = self.frame["price"].to_numpy(dtype=np.float64)
+        self.area = self.frame["area"].to_numpy(dtype=np.float64)
+        self.price_per_sqm = self.price / self.area
+        self.property_type = self.frame["property_type"].to_numpy(dtype=object)
+        self.finnkode = self.frame["finnkode"].to_numpy(dtype=object)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _within(self, latitude, longitude, radius_km):
+        """Row indices within radius_km of a point and their distances in km"""
+        center = _unit_vectors(latitude, longitude) * EARTH_RADIUS_KM
+        reach = int(np.ceil(radius_km / self.cell_km))
+        offsets = np.arange(-reach, reach + 1)
+        neighbours = np.stack(np.meshgrid(offsets, offsets, offsets, indexing="ij"), axis=-1).reshape(-1, 3)
+        cell_keys = np.unique(_cell_keys(np.floor(center / self.cell_km) + neighbours))
+
+        starts = np.searchsorted(self.keys, cell_keys, side="left")
+        ends = np.searchsorted(self.keys, cell_keys, side="right")
+        if not (ends > starts).any():
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        candidates = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends) if e > s])
+
+        # Chord length -> great-circle distance
+        chord = np.linalg.norm(self.points[candidates] - center, axis=1)
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / (2 * EARTH_RADIUS_KM), 1.0))
+        inside = distance <= radius_km
+        return candidates[inside], distance[inside]
+
+    def query(self, latitude, longitude, property_type=None, area=None, k=10,
+              radius_km=DEFAULT_RADIUS_KM, area_tolerance=DEFAULT_AREA_TOLERANCE,
+              percentiles=DEFAULT_PERCENTILES, exclude_finnkode=None):
+        """k nearest comparable listings and price/m² statistics around a point
+
+        Comparables are within radius_km, of the same property_type (when
+        given) and within ±area_tolerance of area (when given), leaving out
+        exclude_finnkode (the listing being compared, when it is indexed
+        itself). Returns
+        (comparables DataFrame sorted by distance, stats dict) where stats
+        covers every match in the radius, not just the k nearest.
+        """
+        rows, distance = self._within(latitude, longitude, radius_km)
+        mask = np.ones(len(rows), dtype=bool)
+        if property_type:
+            mask &= self.property_type[rows] == property_type
+        if area:
+            mask &= np.abs(self.area[rows] - area) <= area_tolerance * area
+        if exclude_finnkode is not None:
+            mask &= self.finnkode[rows].astype(str) != str(exclude_finnkode)
+        rows, distance = rows[mask], distance[mask]
+
+        stats = {"count": int(len(rows))}
+        if len(rows):
+            values = self.price_per_sqm[rows]
+            stats["median"] = float(np.median(values))
+            for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+                stats[f"p{percentile}"] = float(value)
+
+        nearest = np.argsort(distance, kind="stable")[:k]
+        comparables = self.frame.iloc[rows[nearest]].copy()
+        comparables["price_per_sqm"] = self.price_per_sqm[rows[nearest]]
+        comparables["distance_km"] = distance[nearest]
+        return comparables.reset_index(drop=True), stats
+
+
+def load_listings(path):
+    """Read a CSV or Parquet file of listings"""
+    if path.lower().endswith((".parquet", ".pq")):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def synthetic_listings(n, seed=0):
+    """Generate n plausible listings clustered around Norwegian cities"""
+    rng = np.random.default_rng(seed)
+    cities = np.array([
+        # latitude, longitude, price/m², weight
+        (59.91, 10.75, 95000, 0.35),   # Oslo
+        (60.39, 5.32, 60000, 0.15),    # Bergen
+        (63.43, 10.40, 62000, 0.12),   # Trondheim
+        (58.97, 5.73, 55000, 0.10),    # Stavanger
+        (59.89, 10.52, 80000, 0.10),   # Bærum
+        (58.15, 8.00, 45000, 0.08),    # Kristiansand
+        (69.65, 18.96, 50000, 0.10),   # Tromsø
+    ])
+    city = rng.choice(len(cities), size=n, p=cities[:, 3] / cities[:, 3].sum())
+    spread_km = rng.exponential(4.0, n)
+    bearing = rng.uniform(0, 2 * np.pi, n)
+    latitude = cities[city, 0] + spread_km * np.cos(bearing) / 111.2
+    longitude = cities[city, 1] + spread_km * np.sin(bearing) / (111.2 * np.cos(np.radians(cities[city, 0])))
+
+    property_type = rng.choice(["Leilighet", "Enebolig", "Rekkehus", "Tomannsbolig"], n, p=[0.55, 0.2, 0.15, 0.1])
+    base_area = np.where(property_type == "Leilighet", 65, np.where(property_type == "Enebolig", 160, 110))
+    area = np.maximum(np.round(rng.normal(base_area, base_area * 0.3)), 15)
+    price_per_sqm = cities[city, 2] * np.exp(-spread_km / 40) * rng.lognormal(0, 0.15, n)
+
+    return pd.DataFrame({
+        "finnkode": (100000000 + np.arange(n)).astype(str),
+        "address": [f"Syntetisk vei {i % 200 + 1}" for i in range(n)],
+        "price": np.round(area * price_per_sqm, -3),
+        "area": area,
+        "year_built": rng.integers(1900, 2025, n),
+        "property_type": property_type,
+        "latitude": latitude,
+        "longitude": longitude,
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Finn sammenlignbare boliger")
+    parser.add_argument("input", nargs="?", help="CSV- eller Parquet-fil med boliger")
+    parser.add_argument("--synthetic", type=int, help="Generer et syntetisk datasett med så mange rader")
+    parser.add_argument("-o", "--output", help="Skriv det syntetiske datasettet hit")
+    parser.add_argument("--lat", type=float, default=59.91)
+    parser.add_argument("--lon", type=float, default=10.75)
+    parser.add_argument("--type", dest="property_type", default="Leilighet")
+    parser.add_argument("--area", type=float, default=65)
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS_KM)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        frame = synthetic_listings(args.synthetic)
+        if args.output:
+            if args.output.lower().endswith((".parquet", ".pq")):
+                frame.to_parquet(args.output, index=False)
+            else:
+                frame.to_csv(args.output, index=False)
+            print(f"{len(frame)} rader skrevet til {args.output}", file=sys.stderr)
+            return 0
+    elif args.input and os.path.exists(args.input):
+        frame = load_listings(args.input)
+    else:
+        parser.error("oppgi en fil med boliger eller --synthetic")
+
+    start = time.perf_counter()
+    index = ComparablesIndex(frame)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    comparables, stats = index.query(args.lat, args.lon, args.property_type, args.area,
+                                     k=args.k, radius_km=args.radius)
+    queried = time.perf_counter() - start
+
+    print(comparables.to_string(index=False))
+    print(stats)
+    print(f"{len(index)} boliger indeksert på {built:.2f} s, søk tok {queried * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from finn import extract_finnkode, get_finn_data
+
+FETCH_WORKERS = 16
+
+# Job states shown in the UI
+QUEUED = "i kø"
+RUNNING = "henter"
+DONE = "ferdig"
+
+
+class FetchJob:
+    """One upstream fetch, shared by every session that asked for the same listing"""
+
+    def __init__(self, key, url):
+        self.key = key
+        self.url = url
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.waiters = 1
+        self.future = None
+
+    @property
+    def state(self):
+        if self.finished_at is not None:
+            return DONE
+        return RUNNING if self.started_at is not None else QUEUED
+
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.submitted_at
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        """(property_data, success, message), like get_finn_data"""
+        return self.future.result(timeout)
+
+
+class FetchService:
+    """Runs listing fetches on a shared thread pool, off the Streamlit script threads
+
+    Requests for a finnkode that is already being fetched join the in-flight
+    job instead of starting another upstream request (single-flight), so a
+    hot listing opened by many sessions at once is downloaded once.
+    fetch(url) must return (property_data, success, message).
+    """
+
+    def __init__(self, fetch=get_finn_data, workers=FETCH_WORKERS):
+        self._fetch = fetch
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="finn-fetch")
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._stats = {"submitted": 0, "joined": 0, "completed": 0, "failed": 0}
+
+    def submit(self, url):
+        """Start (or join) the fetch of a listing and return its FetchJob"""
+        key = extract_finnkode(url) or url.strip()
+        with self._lock:
+            self._stats["submitted"] += 1
+            job = self._in_flight.get(key)
+            if job is not None:
+                job.waiters += 1
+                self._stats["joined"] += 1
+                return job
+            job = self._in_flight[key] = FetchJob(key, url)
+            job.future = self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        job.started_at = time.monotonic()
+        try:
+            result = self._fetch(job.url)
+        except Exception as e:
+            result = (None, False, f"Feil ved henting: {e}")
+        finally:
+            job.finished_at = time.monotonic()
+            with self._lock:
+                if self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+        with self._lock:
+            self._stats["completed" if result[1] else "failed"] += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._in_flight)}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,89 @@
+import numpy as np
+
+from loans import ANNUITY, first_payment
+
+# Defaults used by the Finansiering tab
+DEFAULT_EQUITY_PERCENT = 15
+DEFAULT_INTEREST_RATE = 4.5
+DEFAULT_YEARS = 25
+DEFAULT_MONTHLY_COSTS = {
+    "felleskostnader": 2500,
+    "kommunale_avg": 500,
+    "forsikring": 300,
+    "strom": 1500,
+}
+MAINTENANCE_RATE = 0.001  # 0.1% of property value per month
+TAX_DEDUCTION_RATE = 0.22
+
+
+def financing(total_investment, equity_percent=DEFAULT_EQUITY_PERCENT,
+              interest_rate=DEFAULT_INTEREST_RATE, years=DEFAULT_YEARS,
+              felleskostnader=None, kommunale_avg=None, forsikring=None,
+              vedlikehold=None, strom=None, loan_type=ANNUITY):
+    """Financing figures from the Finansiering tab for scalars or arrays of inputs
+
+    Running costs left as None use the tab's defaults; vedlikehold defaults
+    to 0.1% of the total investment per month. For serial loans monthly_loan
+    is the first (largest) payment. Returns a dict of arrays.
+    """
+    total_investment = np.asarray(total_investment, dtype=np.float64)
+    egenkapital = total_investment * (np.asarray(equity_percent, dtype=np.float64) / 100)
+    loan_amount = total_investment - egenkapital
+    monthly_loan = first_payment(loan_amount, interest_rate, years, loan_type)
+
+    if vedlikehold is None:
+        vedlikehold = np.floor(total_investment * MAINTENANCE_RATE)
+    running = {
+        "felleskostnader": felleskostnader,
+        "kommunale_avg": kommunale_avg,
+        "forsikring": forsikring,
+        "strom": strom,
+    }
+    monthly_running = np.asarray(vedlikehold, dtype=np.float64)
+    for name, value in running.items():
+        value = DEFAULT_MONTHLY_COSTS[name] if value is None else value
+        monthly_running = monthly_running + np.asarray(value, dtype=np.float64)
+
+    total_monthly = monthly_loan + monthly_running
+    annual_cost = total_monthly * 12
+    tax_deduction = loan_amount * (np.asarray(interest_rate, dtype=np.float64) / 100) * TAX_DEDUCTION_RATE
+
+    return {
+        "egenkapital": egenkapital,
+        "loan_amount": loan_amount,
+        "monthly_loan": monthly_loan,
+        "monthly_running_costs": monthly_running,
+        "total_monthly": total_monthly,
+        "annual_cost": annual_cost,
+        "tax_deduction": tax_deduction,
+        "net_annual_cost": annual_cost - tax_deduction,
+    }
+
+
+# Axes of the Finansiering tab's sensitivity grid
+SENSITIVITY_RATES = np.round(np.arange(0, 15.05, 0.1), 1)
+SENSITIVITY_EQUITY_PERCENTS = np.arange(0, 101, 5)
+SENSITIVITY_YEARS = np.arange(1, 31)
+
+
+def sensitivity_grid(total_investment, rates=SENSITIVITY_RATES,
+                     equity_percents=SENSITIVITY_EQUITY_PERCENTS,
+                     years=SENSITIVITY_YEARS, **costs):
+    """Total monthly, annual and net annual cost over a rate x equity x years grid
+
+    Computed in a single broadcast call to financing(); costs are passed on
+    to it unchanged (running costs and loan_type). Each returned array has
+    shape (len(rates), len(equity_percents), len(years)).
+    """
+    results = financing(
+        total_investment,
+        equity_percent=np.asarray(equity_percents)[None, :, None],
+        interest_rate=np.asarray(rates)[:, None, None],
+        years=np.asarray(years)[None, None, :],
+        **costs
+    )
+    shape = (len(rates), len(equity_percents), len(years))
+    return {
+        name: np.broadcast_to(results[name], shape)
+        for name in ("total_monthly", "annual_cost", "net_annual_cost")
+    }
@@ -0,0 +1,161 @@
+import hashlib
+import re
+from urllib.parse import urlparse, parse_qs
+import requests
+
+from finn_parser import parse_finn_html
+from http_archive import mount_adapters
+from instrumentation import METRICS
+from listing_cache import ListingCache
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'nb-NO,nb;q=0.9,no-NO;q=0.8,no;q=0.6,en-US;q=0.5,en;q=0.4',
+    'Connection': 'keep-alive',
+}
+REQUEST_TIMEOUT = 10
+POOL_SIZE = 32
+
+# Shared by every session in the server process
+LISTING_CACHE = ListingCache()
+
+
+def create_session(pool_size=POOL_SIZE):
+    """Create a requests.Session that keeps connections alive between fetches
+
+    Under BOLIGBUDSJETT_HTTP_MODE=record/replay the session records its
+    responses to, or replays them from, the HTTP archive (see http_archive).
+    """
+    return mount_adapters(requests.Session(), pool_size)
+
+
+SESSION = create_session()
+
+
+def _collect_cache_metrics(metrics):
+    stats = LISTING_CACHE.stats()
+    for name in ("hits", "memory_hits", "disk_hits", "misses", "expired", "evictions"):
+        metrics.set_gauge("listing_cache_events", stats[name], event=name)
+    metrics.set_gauge("listing_cache_entries", stats["memory_entries"], tier="memory")
+    if "disk_entries" in stats:
+        metrics.set_gauge("listing_cache_entries", stats["disk_entries"], tier="disk")
+    metrics.set_gauge("listing_cache_hit_rate", stats["hit_rate"])
+
+
+METRICS.add_collector(_collect_cache_metrics)
+
+FINNKODE_PATTERN = re.compile(r'(\d{6,})')
+
+
+def extract_finnkode(url):
+    """Return the normalized finnkode for a Finn.no URL (or a bare finnkode), or None"""
+    if not url:
+        return None
+    url = url.strip()
+    if url.isdigit():
+        return url
+
+    parsed = urlparse(url)
+    finnkode = parse_qs(parsed.query).get('finnkode')
+    if finnkode and finnkode[0].strip().isdigit():
+        return finnkode[0].strip()
+
+    # Newer URLs carry the finnkode as the last path segment
+    match = FINNKODE_PATTERN.search(parsed.path.rstrip('/').rsplit('/', 1)[-1])
+    if match:
+        return match.group(1)
+    return None
+
+
+def get_finn_data(url, use_cache=True):
+    """Fetch and parse data from Finn.no listing, served from the listing cache when possible
+
+    A fresh cache entry is returned as is (unless use_cache is False); an
+    expired one is revalidated with a conditional request and only downloaded
+    and parsed again when the listing has actually changed.
+    """
+    finnkode = extract_finnkode(url)
+    previous = LISTING_CACHE.lookup(finnkode) if finnkode else None
+    if previous is not None and previous['fresh'] and use_cache:
+        METRICS.increment("listing_fetches_total", result="cache_hit")
+        return previous['data'], True, "Data hentet fra hurtigbuffer"
+
+    property_data, validators, success, message = fetch_finn_data(url, previous=previous)
+    if success and finnkode:
+        LISTING_CACHE.put(finnkode, property_data, validators=validators)
+    return property_data, success, message
+
+
+def fetch_finn_data(url, session=None, previous=None):
+    """Fetch and parse data from Finn.no listing, returning (property_data, validators, success, message)
+
+    previous is a cache entry from ListingCache.lookup(); its validators are
+    sent as If-None-Match/If-Modified-Since, and its property_data is reused
+    on a 304 or when the body hashes the same as last time.
+    """
+    validators = previous['validators'] if previous else {}
+    try:
+        with METRICS.timer("fetch_seconds", stage="download"):
+            html, new_validators = download_listing_conditional(url, validators, session)
+        if html is None:
+            METRICS.increment("listing_fetches_total", result="not_modified")
+            return previous['data'], validators, True, "Data uendret siden forrige henting"
+        if previous and new_validators['content_hash'] == validators.get('content_hash'):
+            METRICS.increment("listing_fetches_total", result="unchanged")
+            return previous['data'], new_validators, True, "Data uendret siden forrige henting"
+        with METRICS.timer("fetch_seconds", stage="parse"):
+            property_data = parse_finn_html(html)
+        METRICS.increment("listing_fetches_total", result="downloaded")
+        return property_data, new_validators, True, "Data hentet successfully"
+
+    except requests.RequestException as e:
+        METRICS.increment("upstream_errors_total", kind=_error_kind(e))
+        return None, validators, False, f"Nettverksfeil: {str(e)}"
+    except Exception as e:
+        METRICS.increment("upstream_errors_total", kind="other")
+        return None, validators, False, f"Feil ved henting av data: {str(e)}"
+
+
+def _error_kind(error):
+    if isinstance(error, requests.Timeout):
+        return "timeout"
+    if isinstance(error, requests.ConnectionError):
+        return "connection"
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f"http_{error.response.status_code}"
+    return "request"
+
+
+def download_listing(url, session=None):
+    """Download the raw listing HTML, raising requests.RequestException on failure"""
+    response = (session or SESSION).get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return _response_text(response)
+
+
+def _response_text(response):
+    # Without a charset in Content-Type requests falls back to ISO-8859-1,
+    # which garbles "m²" and "Byggeår"; HTML5 pages default to UTF-8
+    if 'charset' not in response.headers.get('Content-Type', '').lower():
+        response.encoding = 'utf-8'
+    return response.text
+
+
+def download_listing_conditional(url, validators, session=None):
+    """Download a listing unless it is unchanged, returning (html or None on 304, validators)"""
+    headers = dict(HEADERS)
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    response = (session or SESSION).get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304:
+        return None, validators
+    response.raise_for_status()
+    return _response_text(response), {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'content_hash': hashlib.sha256(response.content).hexdigest(),
+    }
@@ -0,0 +1,194 @@
+"""Concurrent batch ingestion of Finn.no listings.
+
+Usage:
+    python finn_batch.py urls.txt -o listings.jsonl --workers 16 --rate 4
+
+The input holds one Finn.no URL or finnkode per line ("-" reads stdin).
+Parsed listings are written as JSON lines in completion order.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+
+import requests
+
+from finn import (
+    LISTING_CACHE,
+    create_session,
+    download_listing_conditional,
+    extract_finnkode,
+    parse_finn_html,
+)
+
+FINN_AD_URL = "https://www.finn.no/realestate/homes/ad.html?finnkode={}"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+STORE_BATCH_SIZE = 500  # listings per file written to the listing store
+
+
+class HostRateLimiter:
+    """Spaces requests to the same host at least 1/rate seconds apart"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, host, seconds):
+        """Hold back every request to host for the next seconds (e.g. on Retry-After)"""
+        with self._lock:
+            now = time.monotonic()
+            self._next_slot[host] = max(self._next_slot.get(host, now), now + seconds)
+
+
+def normalize_listing_url(value):
+    """Turn a bare finnkode into a listing URL; URLs are returned unchanged"""
+    value = value.strip()
+    return FINN_AD_URL.format(value) if value.isdigit() else value
+
+
+def fetch_with_retry(url, session, limiter, retries=3, backoff=0.5, validators=None):
+    """Download a listing unless unchanged, returning (html or None on 304, validators)
+
+    validators are the cache entry's ETag/Last-Modified, sent as a
+    conditional request. Transient failures are retried with exponential
+    backoff.
+
+    Only connection errors, timeouts and RETRY_STATUS_CODES are retried; an
+    invalid URL or any other error is raised at once. A Retry-After holds
+    back every request to the host, not just this one.
+    """
+    host = urlparse(url).netloc
+    attempt = 0
+    while True:
+        limiter.wait(host)
+        try:
+            return download_listing_conditional(url, validators or {}, session)
+        except requests.RequestException as e:
+            response = getattr(e, 'response', None)
+            if response is not None:
+                retryable = response.status_code in RETRY_STATUS_CODES
+            else:
+                retryable = isinstance(e, (requests.ConnectionError, requests.Timeout))
+            if not retryable or attempt >= retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+                limiter.pause(host, float(retry_after))
+            time.sleep(delay)
+            attempt += 1
+
+
+def fetch_listings(urls, workers=8, rate=4.0, retries=3, backoff=0.5, use_cache=True):
+    """Fetch many listings concurrently, yielding (url, property_data, success, message) as they finish
+
+    At most ``workers * 2`` fetches are in flight at once, so arbitrarily long
+    (or lazy) inputs are consumed without buffering them.
+    """
+    session = create_session(pool_size=workers)
+    limiter = HostRateLimiter(rate)
+
+    def fetch_one(url):
+        finnkode = extract_finnkode(url)
+        previous = LISTING_CACHE.lookup(finnkode) if use_cache and finnkode else None
+        if previous is not None and previous['fresh']:
+            return url, previous['data'], True, "Data hentet fra hurtigbuffer"
+        # An expired entry is revalidated, and its data reused when the listing is unchanged
+        validators = previous['validators'] if previous else {}
+        try:
+            html, new_validators = fetch_with_retry(url, session, limiter, retries, backoff, validators)
+            if html is None or (previous and new_validators['content_hash'] == validators.get('content_hash')):
+                property_data, message = previous['data'], "Data uendret siden forrige henting"
+            else:
+                property_data, message = parse_finn_html(html), "Data hentet successfully"
+        except requests.RequestException as e:
+            return url, None, False, f"Nettverksfeil: {str(e)}"
+        except Exception as e:
+            return url, None, False, f"Feil ved henting av data: {str(e)}"
+        if finnkode:
+            LISTING_CACHE.put(finnkode, property_data, validators=new_validators)
+        return url, property_data, True, message
+
+    urls = (normalize_listing_url(url) for url in urls if url.strip())
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for url in urls:
+                pending.add(executor.submit(fetch_one, url))
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in _as_finished(pending):
+                yield future.result()
+    finally:
+        session.close()
+
+
+def _as_finished(pending):
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        yield from done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hent mange Finn.no-annonser samtidig")
+    parser.add_argument("input", help="Fil med én URL eller finnkode per linje ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSON lines-fil for resultatet ('-' for stdout)")
+    parser.add_argument("--workers", type=int, default=8, help="Antall samtidige nedlastinger")
+    parser.add_argument("--rate", type=float, default=4.0, help="Maks forespørsler per sekund per vert")
+    parser.add_argument("--retries", type=int, default=3, help="Antall nye forsøk ved midlertidige feil")
+    parser.add_argument("--no-cache", action="store_true", help="Ikke bruk hurtigbufferen")
+    parser.add_argument("--store", help="Lagre vellykkede annonser i boliglageret i denne katalogen")
+    args = parser.parse_args(argv)
+
+    store, pending = None, []
+    if args.store:
+        from listing_store import ListingStore
+        store = ListingStore(args.store)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    failures = 0
+    try:
+        for url, property_data, success, message in fetch_listings(
+            source, workers=args.workers, rate=args.rate,
+            retries=args.retries, use_cache=not args.no_cache
+        ):
+            if not success:
+                failures += 1
+            record = {"url": url, "finnkode": extract_finnkode(url), "success": success,
+                      "message": message, "property_data": property_data}
+            sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if store is not None and success:
+                pending.append({**property_data, "url": url, "finnkode": record["finnkode"]})
+                if len(pending) >= STORE_BATCH_SIZE:
+                    store.append(pending)
+                    pending = []
+    finally:
+        if pending:
+            store.append(pending)
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+import json
+import re
+from functools import lru_cache
+
+from bs4 import BeautifulSoup
+
+# Optional faster HTML backends, picked in this order when installed
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+AREA_PATTERN = re.compile(r'(\d+)\s*m²')
+INTERNAL_AREA_PATTERN = re.compile(r'(\d+)\s*m²\s*\(BRA-i\)')
+
+PROPERTY_FIELDS = (
+    'price',
+    'size',
+    'rooms',
+    'bedrooms',
+    'year_built',
+    'address',
+    'property_type',
+    'floor',
+    'total_price',
+    'shared_debt',
+    'ownership_type',
+    'bra_total',
+    'bra_primary',
+    'bra_external',
+    'balcony_size',
+    'energy_rating',
+    'plot_size',
+    'bra_internal',
+    'latitude',
+    'longitude',
+)
+
+
+def empty_property_data():
+    """Return a property_data dict with every field set to None"""
+    return dict.fromkeys(PROPERTY_FIELDS)
+
+
+# Value extractors
+
+def _digits(value_text):
+    return int(''.join(filter(str.isdigit, value_text)))
+
+
+def _optional_digits(value_text):
+    try:
+        return _digits(value_text)
+    except ValueError:
+        return None
+
+
+def _first_int(value_text):
+    try:
+        return int(value_text.split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def _area(value_text):
+    match = AREA_PATTERN.search(value_text)
+    return float(match.group(1)) if match else None
+
+
+def _text(value_text):
+    return value_text
+
+
+def _set(field, extractor):
+    """Handler that stores extractor(value) in field, skipping values it cannot read"""
+    def handler(property_data, key, value_text):
+        value = extractor(value_text)
+        if value is not None:
+            property_data[field] = value
+    return handler
+
+
+def _set_bruksareal(property_data, key, value_text):
+    # Check for internal area first
+    internal_match = INTERNAL_AREA_PATTERN.search(value_text)
+    if internal_match:
+        property_data['bra_internal'] = float(internal_match.group(1))
+    # Then check for total area if no internal area was found
+    elif 'primær' not in key:
+        area = _area(value_text)
+        if area is not None:
+            property_data['bra_total'] = area
+
+
+# Key -> field dispatch table. Rules are tried in order and the first rule
+# whose substrings occur in the (lowercased) key wins, so the order matters:
+# 'soverom' must come before the generic 'rom' rule, and so on.
+DISPATCH_RULES = (
+    (('totalpris',), (), _set('total_price', _digits)),
+    (('prisantydning',), (), _set('price', _digits)),
+    (('fellesgjeld',), (), _set('shared_debt', _digits)),
+    (('bruksareal',), (), _set_bruksareal),
+    (('primærrom', 'p-rom'), (), _set('size', _area)),
+    (('byggeår',), (), _set('year_built', _optional_digits)),
+    (('boligtype',), (), _set('property_type', _text)),
+    (('eieform',), (), _set('ownership_type', _text)),
+    (('etasje',), (), _set('floor', _optional_digits)),
+    (('soverom',), (), _set('bedrooms', _optional_digits)),
+    (('rom',), ('sove',), _set('rooms', _first_int)),
+    (('balkong', 'terrasse'), (), _set('balcony_size', _area)),
+    (('energimerking',), (), _set('energy_rating', _text)),
+    (('tomteareal',), (), _set('plot_size', _area)),
+)
+
+
+@lru_cache(maxsize=1024)
+def resolve_key(key):
+    """Return the handler for a lowercased dt key, or None when the key is not used"""
+    for substrings, excluded, handler in DISPATCH_RULES:
+        if any(s in key for s in substrings) and not any(s in key for s in excluded):
+            return handler
+    return None
+
+
+# Backends: each returns (list of (tag, text) for dt/dd in document order,
+# address text or None, list of JSON-LD script bodies)
+
+def _extract_selectolax(html):
+    tree = HTMLParser(html)
+    pairs = [(node.tag, node.text(deep=True)) for node in tree.root.traverse()
+             if node.tag in ('dt', 'dd')] if tree.root is not None else []
+    address_node = tree.css_first('h1.u-t3') or tree.css_first('h1')
+    address = address_node.text(deep=True) if address_node is not None else None
+    scripts = [node.text(deep=True) for node in tree.css('script[type="application/ld+json"]')]
+    return pairs, address, scripts
+
+
+def _extract_lxml(html):
+    root = lxml.html.fromstring(html)
+    pairs = [(elem.tag, elem.text_content()) for elem in root.iter('dt', 'dd')]
+    address_elems = (
+        root.xpath('//h1[contains(concat(" ", normalize-space(@class), " "), " u-t3 ")]')
+        or root.xpath('//h1')
+    )
+    address = address_elems[0].text_content() if address_elems else None
+    scripts = [elem.text_content() for elem in root.xpath('//script[@type="application/ld+json"]')]
+    return pairs, address, scripts
+
+
+def _extract_html_parser(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    pairs = [(elem.name, elem.text) for elem in soup.find_all(['dt', 'dd'])]
+    address_elem = soup.find('h1', {'class': 'u-t3'}) or soup.find('h1')
+    address = address_elem.text if address_elem else None
+    scripts = [elem.string or '' for elem in soup.find_all('script', {'type': 'application/ld+json'})]
+    return pairs, address, scripts
+
+
+BACKENDS = {}
+if HTMLParser is not None:
+    BACKENDS['selectolax'] = _extract_selectolax
+if lxml is not None:
+    BACKENDS['lxml'] = _extract_lxml
+BACKENDS['html.parser'] = _extract_html_parser
+
+DEFAULT_BACKEND = next(iter(BACKENDS))
+
+
+def _apply_json_ld(property_data, scripts):
+    """Fill fields the dt/dd pass left empty from embedded schema.org JSON-LD"""
+    for script in scripts:
+        try:
+            documents = json.loads(script)
+        except ValueError:
+            continue
+        if not isinstance(documents, list):
+            documents = [documents]
+        for document in documents:
+            if not isinstance(document, dict):
+                continue
+            offers = document.get('offers')
+            if isinstance(offers, list):
+                offers = offers[0] if offers else None
+            candidates = {
+                'price': offers.get('price') if isinstance(offers, dict) else None,
+                'rooms': document.get('numberOfRooms'),
+                'bedrooms': document.get('numberOfBedrooms'),
+                'year_built': document.get('yearBuilt'),
+            }
+            for field, value in candidates.items():
+                if property_data[field] is None and value is not None:
+                    try:
+                        property_data[field] = int(float(value))
+                    except (TypeError, ValueError):
+                        pass
+            geo = document.get('geo')
+            if isinstance(geo, dict) and property_data['latitude'] is None:
+                try:
+                    property_data['latitude'] = float(geo['latitude'])
+                    property_data['longitude'] = float(geo['longitude'])
+                except (KeyError, TypeError, ValueError):
+                    property_data['latitude'] = property_data['longitude'] = None
+            name = document.get('name')
+            if property_data['address'] is None and isinstance(name, str) and name.strip():
+                property_data['address'] = name.strip()
+
+
+def parse_finn_html(html, backend=None):
+    """Parse a Finn.no listing page into a property_data dict"""
+    pairs, address, scripts = BACKENDS[backend or DEFAULT_BACKEND](html)
+    property_data = empty_property_data()
+
+    current_key = None
+    for tag, text in pairs:
+        if tag == 'dt':
+            current_key = text.strip().lower()
+        elif current_key:
+            handler = resolve_key(current_key)
+            if handler is not None:
+                handler(property_data, current_key, text.strip())
+
+    # Get address from breadcrumb or title
+    if address is not None:
+        property_data['address'] = address.strip()
+
+    if scripts:
+        _apply_json_ld(property_data, scripts)
+
+    return property_data
@@ -0,0 +1,274 @@
+"""Record and replay of listing downloads in a compressed, content-addressed archive.
+
+With BOLIGBUDSJETT_HTTP_MODE=record every response that the sessions from
+finn.create_session() receive is also written to the archive in
+BOLIGBUDSJETT_HTTP_ARCHIVE. With BOLIGBUDSJETT_HTTP_MODE=replay the same
+sessions are served from the archive and never touch the network: a URL
+that was not recorded fails like a connection error, and conditional
+requests get a 304 when the recorded ETag matches. The app, finn_batch and
+the watchlist all go through create_session(), so they run unchanged
+against an archive.
+
+An archive is a directory with two append-only files:
+  pages.pack   zlib-compressed response bodies, each stored once per
+               SHA-256 of its content
+  index.jsonl  one line per recorded response: key (the finnkode, else the
+               URL), status, headers and the body's sha256/offset/length
+Replay reads the pack through mmap, so a corpus of 100k pages costs only
+the index in memory and every page is decompressed on demand.
+
+Usage:
+    BOLIGBUDSJETT_HTTP_MODE=record BOLIGBUDSJETT_HTTP_ARCHIVE=corpus python finn_batch.py urls.txt
+    BOLIGBUDSJETT_HTTP_MODE=replay BOLIGBUDSJETT_HTTP_ARCHIVE=corpus python finn_batch.py urls.txt --rate 0
+    python http_archive.py corpus import saved_pages/
+    python http_archive.py corpus stats
+"""
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import os
+import sys
+import threading
+import zlib
+from http.client import responses as HTTP_REASONS
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+ARCHIVE_PATH = os.environ.get("BOLIGBUDSJETT_HTTP_ARCHIVE", "")
+ARCHIVE_MODE = os.environ.get("BOLIGBUDSJETT_HTTP_MODE", "")
+RECORD = "record"
+REPLAY = "replay"
+PACK_FILE = "pages.pack"
+INDEX_FILE = "index.jsonl"
+COMPRESSION_LEVEL = 6
+RECORDED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+def archive_key(url):
+    """Key of a URL in the archive: its finnkode, so every URL form of a listing replays the same page"""
+    from finn import extract_finnkode
+    return extract_finnkode(url) or url.strip()
+
+
+class HttpArchive:
+    """Append-only archive of HTTP responses with content-addressed, compressed bodies
+
+    Safe to share between threads. The latest response recorded for a key
+    wins; bodies that hash the same are stored once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (status, headers, sha256)
+        self._blobs = {}  # sha256 -> (offset, length)
+        self._pack_size = 0
+        self._map = None
+        self._pack = None
+        self._index = None
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    self._entries[entry["key"]] = (entry["status"], entry["headers"], entry["sha256"])
+                    self._blobs[entry["sha256"]] = (entry["offset"], entry["length"])
+        pack_path = os.path.join(path, PACK_FILE)
+        self._pack_size = os.path.getsize(pack_path) if os.path.exists(pack_path) else 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        return list(self._entries)
+
+    def _view(self, end):
+        # The pack is remapped only when a body lies past the current mapping
+        if self._map is None or len(self._map) < end:
+            if self._map is not None:
+                self._map.close()
+            with open(os.path.join(self.path, PACK_FILE), "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def get(self, key):
+        """(status, headers, body) recorded for a key, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        status, headers, sha256 = entry
+        offset, length = self._blobs[sha256]
+        with self._lock:
+            view = self._view(offset + length)
+            compressed = view[offset:offset + length]
+        return status, headers, zlib.decompress(compressed)
+
+    def put(self, url, status, headers, body):
+        """Record a response; returns True when its body was new to the archive"""
+        key = archive_key(url)
+        sha256 = hashlib.sha256(body).hexdigest()
+        headers = {name: headers[name] for name in RECORDED_HEADERS if headers.get(name)}
+        with self._lock:
+            if self._pack is None:
+                self._pack = open(os.path.join(self.path, PACK_FILE), "ab")
+                self._index = open(os.path.join(self.path, INDEX_FILE), "a", encoding="utf-8")
+            new = sha256 not in self._blobs
+            if new:
+                compressed = zlib.compress(body, COMPRESSION_LEVEL)
+                self._pack.write(compressed)
+                self._pack.flush()
+                self._blobs[sha256] = (self._pack_size, len(compressed))
+                self._pack_size += len(compressed)
+            offset, length = self._blobs[sha256]
+            self._entries[key] = (status, headers, sha256)
+            self._index.write(json.dumps({
+                "key": key, "url": url, "status": status, "headers": headers,
+                "sha256": sha256, "offset": offset, "length": length,
+            }, ensure_ascii=False) + "\n")
+            self._index.flush()
+        return new
+
+    def stats(self):
+        with self._lock:
+            return {"responses": len(self._entries), "bodies": len(self._blobs), "pack_bytes": self._pack_size}
+
+    def close(self):
+        with self._lock:
+            for handle in (self._map, self._pack, self._index):
+                if handle is not None:
+                    handle.close()
+            self._map = self._pack = self._index = None
+
+
+class RecordingAdapter(HTTPAdapter):
+    """HTTPAdapter that also writes every final response to an archive"""
+
+    def __init__(self, archive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code != 304:  # a 304 has no body; the archive keeps the full page
+            self.archive.put(request.url, response.status_code, response.headers, response.content)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Serves responses from an archive without any network access"""
+
+    def __init__(self, archive):
+        super().__init__()
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        recorded = self.archive.get(archive_key(request.url))
+        if recorded is None:
+            raise requests.ConnectionError(f"{request.url} finnes ikke i arkivet", request=request)
+        status, headers, body = recorded
+        response = requests.Response()
+        response.headers = CaseInsensitiveDict(headers)
+        etag = headers.get("ETag")
+        if status == 200 and etag and request.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        response.status_code = status
+        response.reason = HTTP_REASONS.get(status, "")
+        response._content = body
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+_ARCHIVE = None
+_ARCHIVE_LOCK = threading.Lock()
+
+
+def current_archive():
+    """The process-wide archive in BOLIGBUDSJETT_HTTP_ARCHIVE, opened on first use"""
+    global _ARCHIVE
+    with _ARCHIVE_LOCK:
+        if _ARCHIVE is None:
+            if not ARCHIVE_PATH:
+                raise RuntimeError("BOLIGBUDSJETT_HTTP_ARCHIVE must name the archive directory")
+            _ARCHIVE = HttpArchive(ARCHIVE_PATH)
+        return _ARCHIVE
+
+
+def mount_adapters(session, pool_size, mode=ARCHIVE_MODE):
+    """Mount the transport of finn.create_session(): plain, recording or replaying"""
+    if mode == RECORD:
+        adapter = RecordingAdapter(current_archive(), pool_connections=pool_size, pool_maxsize=pool_size)
+    elif mode == REPLAY:
+        adapter = ReplayAdapter(current_archive())
+        # Nothing goes over the network, so skip requests' scan of the proxy variables on every call
+        session.trust_env = False
+    elif mode:
+        raise ValueError(f"BOLIGBUDSJETT_HTTP_MODE must be '{RECORD}' or '{REPLAY}', not {mode!r}")
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def import_pages(archive, paths):
+    """Record saved listing pages as 200 responses keyed by the finnkode in their file names"""
+    added = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            body = f.read()
+        key = os.path.splitext(os.path.basename(path))[0]
+        archive.put(key, 200, {"Content-Type": "text/html; charset=utf-8",
+                               "ETag": f'"{hashlib.sha256(body).hexdigest()[:16]}"'}, body)
+        added += 1
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vedlikehold arkivet med lagrede Finn.no-svar")
+    parser.add_argument("archive", help="Katalog for arkivet")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Vis antall svar, unike sider og størrelse")
+    load = commands.add_parser("import", help="Legg til lagrede .html-sider; filnavnet er finnkoden")
+    load.add_argument("directory")
+    show = commands.add_parser("show", help="Skriv ut siden som er lagret for en finnkode eller URL")
+    show.add_argument("key")
+    args = parser.parse_args(argv)
+
+    archive = HttpArchive(args.archive)
+    try:
+        if args.command == "stats":
+            stats = archive.stats()
+            print(f"{stats['responses']} svar, {stats['bodies']} unike sider, "
+                  f"{stats['pack_bytes'] / 1024 / 1024:.1f} MiB komprimert")
+        elif args.command == "import":
+            paths = sorted(glob.glob(os.path.join(args.directory, "*.html")))
+            print(f"{import_pages(archive, paths)} sider importert, {len(archive)} i arkivet")
+        elif args.command == "show":
+            recorded = archive.get(archive_key(args.key))
+            if recorded is None:
+                print(f"{args.key} finnes ikke i arkivet", file=sys.stderr)
+                return 1
+            sys.stdout.buffer.write(recorded[2])
+    finally:
+        archive.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
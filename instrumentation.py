@@ -0,0 +1,256 @@
+import bisect
+import contextlib
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger("boligbudsjett")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(os.environ.get("BOLIGBUDSJETT_LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+METRICS_PORT = os.environ.get("BOLIGBUDSJETT_METRICS_PORT")
+METRICS_PREFIX = "boligbudsjett_"
+PROFILE_DIR = os.environ.get("BOLIGBUDSJETT_PROFILE_DIR", os.path.join(".cache", "profiles"))
+DEFAULT_PROFILE_SECONDS = 30
+DEFAULT_PROFILE_SAMPLE_RATE = 0.1  # share of sections profiled while a profile is running
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """In-process counters, gauges and latency histograms in Prometheus text format
+
+    Updates are a dict lookup and an add under one lock. Collectors registered
+    with add_collector() are called at scrape time for values that are cheaper
+    to read on demand (cache statistics, active sessions).
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def increment(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of a with block in a histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, collector):
+        """Register collector(metrics), called before every scrape to refresh gauges"""
+        self._collectors.append(collector)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        for collector in self._collectors:
+            try:
+                collector(self)
+            except Exception:
+                logger.exception("metrics collector failed")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((key, (list(counts), total)) for key, (counts, total) in self._histograms.items())
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {METRICS_PREFIX}{name} {self._help[name]}")
+                lines.append(f"# TYPE {METRICS_PREFIX}{name} {kind}")
+
+        for (name, key), value in counters:
+            header(name, "counter")
+            lines.append(f"{METRICS_PREFIX}{name}{_format_labels(key)} {value:g}")
+        for (name, key), value in gauges:
+            header(name, "gauge")
+            lines.append(f"{METRICS_PREFIX}{name}{_format_labels(key)} {value:g}")
+        for (name, key), (counts, total) in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f"{METRICS_PREFIX}{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{METRICS_PREFIX}{name}_sum{_format_labels(key)} {total:.6f}")
+            lines.append(f"{METRICS_PREFIX}{name}_count{_format_labels(key)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+class SampledProfiler:
+    """On-demand cProfile of a random sample of instrumented calls, merged into one dump"""
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._until = 0.0
+        self._sample_rate = 0.0
+        self._stats = None
+        self._done = threading.Event()
+
+    @property
+    def active(self):
+        return time.monotonic() < self._until
+
+    def start(self, seconds=DEFAULT_PROFILE_SECONDS, sample_rate=DEFAULT_PROFILE_SAMPLE_RATE):
+        with self._lock:
+            self._until = time.monotonic() + seconds
+            self._sample_rate = sample_rate
+            self._stats = None
+            self._done.clear()
+
+    def call(self, func, *args, **kwargs):
+        """Run func, under cProfile if a profile is running and this call is sampled"""
+        if not self.active or random.random() >= self._sample_rate:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+    def finish(self):
+        """Write the collected samples to a .pstats file; returns (path or None, top functions)"""
+        with self._lock:
+            self._until = 0.0
+            stats, self._stats = self._stats, None
+        if stats is None:
+            return None, "Ingen kall ble profilert"
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime("profile-%Y%m%d-%H%M%S.pstats"))
+        stats.dump_stats(path)
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats("cumulative").print_stats(25)
+        return path, summary.getvalue()
+
+
+METRICS = Metrics()
+METRICS.describe("render_seconds", "Time spent rendering a UI section")
+METRICS.describe("fetch_seconds", "Time spent in get_finn_data by stage (download, parse)")
+METRICS.describe("upstream_errors_total", "Failed Finn.no requests by kind")
+PROFILER = SampledProfiler()
+
+
+def timed_section(name):
+    """Decorator that times each render of a UI section into the render_seconds histogram (logged at DEBUG)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return PROFILER.call(func, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                METRICS.observe("render_seconds", elapsed, section=name)
+                logger.debug("render section=%s ms=%.1f", name, elapsed * 1000)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            self._reply(200, METRICS.render(), "text/plain; version=0.0.4")
+        elif url.path == "/profile":
+            # Blocks this request (not the app) for the duration of the profile
+            query = parse_qs(url.query)
+            seconds = float(query.get("seconds", [DEFAULT_PROFILE_SECONDS])[0])
+            sample_rate = float(query.get("rate", [DEFAULT_PROFILE_SAMPLE_RATE])[0])
+            PROFILER.start(seconds, sample_rate)
+            time.sleep(seconds)
+            path, summary = PROFILER.finish()
+            self._reply(200, f"{path}\n\n{summary}" if path else summary, "text/plain")
+        else:
+            self._reply(404, "Ukjent sti, bruk /metrics eller /profile?seconds=30\n", "text/plain")
+
+    def _reply(self, status, body, content_type):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics %s", format % args)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host="127.0.0.1"):
+    """Serve /metrics and /profile on a local port from a daemon thread, once per process
+
+    Does nothing when no port is given (BOLIGBUDSJETT_METRICS_PORT unset).
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+            logger.info("metrics endpoint on http://%s:%s/metrics", host, port)
+    return _server
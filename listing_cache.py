@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Defaults for the process-wide listing cache
+DEFAULT_TTL = 6 * 60 * 60  # 6 hours
+DEFAULT_MEMORY_ENTRIES = 512
+DEFAULT_DISK_ENTRIES = 50000
+DEFAULT_CACHE_PATH = os.environ.get(
+    "BOLIGBUDSJETT_CACHE",
+    os.path.join(".cache", "listings.sqlite")
+)
+
+
+class ListingCache:
+    """Two-tier (memory LRU + SQLite) cache for parsed listings keyed by finnkode
+
+    Entries past their TTL are not served by get(), but are kept (until size
+    eviction) together with their HTTP validators so that lookup() callers can
+    revalidate them instead of downloading and parsing the listing again.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL,
+                 max_memory_entries=DEFAULT_MEMORY_ENTRIES,
+                 max_disk_entries=DEFAULT_DISK_ENTRIES):
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0,
+                       "misses": 0, "expired": 0, "evictions": 0}
+
+        # The disk tier is optional; path=None keeps everything in memory
+        self._db = None
+        self._disk_entries = 0
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS listings (
+                    key TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(listings)")}
+            if "validators" not in columns:
+                self._db.execute("ALTER TABLE listings ADD COLUMN validators TEXT")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS listings_stored_at ON listings (stored_at)"
+            )
+            self._db.commit()
+            # Counted once here and kept up to date by put/invalidate/clear,
+            # so writes never scan the table
+            self._disk_entries = self._db.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def get(self, key):
+        """Return the cached property_data for key, or None on a miss or expired entry"""
+        entry = self.lookup(key)
+        if entry is None or not entry["fresh"]:
+            return None
+        return entry["data"]
+
+    def lookup(self, key):
+        """Return {"data", "validators", "fresh"} for key, including expired entries, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            tier = "memory_hits"
+            if entry is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute(
+                    "SELECT data, validators, expires_at FROM listings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), json.loads(row[1] or "{}"), row[2])
+                    self._remember(key, *entry)
+                    tier = "disk_hits"
+
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            data, validators, expires_at = entry
+            fresh = expires_at > now
+            if fresh:
+                self._stats["hits"] += 1
+                self._stats[tier] += 1
+            else:
+                self._stats["misses"] += 1
+                self._stats["expired"] += 1
+            return {"data": dict(data), "validators": dict(validators), "fresh": fresh}
+
+    def put(self, key, data, ttl=None, validators=None):
+        """Store property_data (and optional HTTP validators) for key in both tiers"""
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        data = dict(data)
+        validators = dict(validators or {})
+        with self._lock:
+            self._remember(key, data, validators, expires_at)
+            if self._db is not None:
+                new = self._db.execute(
+                    "SELECT 1 FROM listings WHERE key = ?", (key,)
+                ).fetchone() is None
+                self._db.execute(
+                    "INSERT OR REPLACE INTO listings (key, data, validators, stored_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, json.dumps(data), json.dumps(validators), now, expires_at)
+                )
+                if new:
+                    self._disk_entries += 1
+                    self._evict_disk()
+                self._db.commit()
+
+    def invalidate(self, key):
+        """Remove key from both tiers"""
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                deleted = self._db.execute("DELETE FROM listings WHERE key = ?", (key,)).rowcount
+                self._disk_entries -= deleted
+                self._db.commit()
+
+    def clear(self):
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM listings")
+                self._disk_entries = 0
+                self._db.commit()
+
+    def stats(self):
+        """Return hit/miss counters and current tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                stats["disk_entries"] = self._disk_entries
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, data, validators, expires_at):
+        # Caller holds the lock
+        self._memory[key] = (data, validators, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self):
+        # Caller holds the lock; expired rows are kept for revalidation, so
+        # only the least recently stored rows beyond the size bound are dropped
+        overflow = self._disk_entries - self.max_disk_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM listings WHERE key IN ("
+                "SELECT key FROM listings ORDER BY stored_at LIMIT ?)",
+                (overflow,)
+            )
+            self._disk_entries -= overflow
+            self._stats["evictions"] += overflow
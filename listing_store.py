@@ -0,0 +1,381 @@
+"""Append-only columnar store of every ingested listing.
+
+Listings are written as Parquet files partitioned by ingest date and
+municipality (hive layout, e.g. date=2026-10-17/municipality=Oslo/). Files
+are never modified once written: a listing that changes (typically its price)
+gets a new row, which is what price_history() reads back. latest() collapses
+the history to one row per finnkode.
+
+Reads go through a memory-mapped pyarrow dataset with column projection and
+filter pushdown, so analytics over the full history only materialize the
+columns and partitions they ask for. Appends check new rows against an
+in-memory finnkode -> content hash index instead of reading the store back,
+and a partition is compacted once it collects COMPACT_FILES small files.
+
+Usage:
+    python listing_store.py stats
+    python listing_store.py history 123456789
+    python listing_store.py snapshot 2026-q4
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs
+import pyarrow.parquet as pq
+
+from finn_parser import PROPERTY_FIELDS
+
+DEFAULT_STORE_PATH = os.environ.get(
+    "BOLIGBUDSJETT_STORE",
+    os.path.join("data", "listings")
+)
+SNAPSHOT_DIR = "_snapshots"
+UNKNOWN_MUNICIPALITY = "ukjent"
+# Unsnapshotted files a partition may collect before append() compacts it
+COMPACT_FILES = 16
+# latest() folds streamed batches into the running result once this many are pending
+LATEST_REDUCE_ROWS = 1 << 16
+
+# Typed schema of the stored rows; every property_data key plus bookkeeping
+FIELD_TYPES = {
+    'price': pa.int64(),
+    'size': pa.float64(),
+    'rooms': pa.int64(),
+    'bedrooms': pa.int64(),
+    'year_built': pa.int64(),
+    'address': pa.string(),
+    'property_type': pa.string(),
+    'floor': pa.int64(),
+    'total_price': pa.int64(),
+    'shared_debt': pa.int64(),
+    'ownership_type': pa.string(),
+    'bra_total': pa.float64(),
+    'bra_primary': pa.float64(),
+    'bra_external': pa.float64(),
+    'balcony_size': pa.float64(),
+    'energy_rating': pa.string(),
+    'plot_size': pa.float64(),
+    'bra_internal': pa.float64(),
+    'latitude': pa.float64(),
+    'longitude': pa.float64(),
+}
+assert tuple(FIELD_TYPES) == PROPERTY_FIELDS, "FIELD_TYPES must follow PROPERTY_FIELDS"
+
+PARTITION_SCHEMA = pa.schema([("date", pa.date32()), ("municipality", pa.string())])
+FILE_SCHEMA = pa.schema(
+    [("finnkode", pa.string()), ("url", pa.string()), ("fetched_at", pa.timestamp("us", tz="UTC"))]
+    + list(FIELD_TYPES.items())
+)
+SCHEMA = pa.unify_schemas([FILE_SCHEMA, PARTITION_SCHEMA])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+
+# A new row is only written when one of these differs from the stored listing
+TRACKED_FIELDS = PROPERTY_FIELDS
+POSTCODE_PATTERN = re.compile(r'\b\d{4}\s+(.+)$')
+
+
+def municipality_from_address(address):
+    """Poststed of a Finn.no address ("Storgata 12A, 0184 Oslo" -> "Oslo")"""
+    match = POSTCODE_PATTERN.search(address or "")
+    return match.group(1).strip() if match else UNKNOWN_MUNICIPALITY
+
+
+def _content_hashes(table):
+    """Digest of the tracked fields of every row, from the Arrow-typed values"""
+    rows = zip(*(table.column(field).to_pylist() for field in TRACKED_FIELDS))
+    return [hashlib.blake2b(repr(row).encode(), digest_size=16).digest() for row in rows]
+
+
+def _fetched_at(table):
+    return table.column("fetched_at").cast(pa.int64()).to_numpy(zero_copy_only=False)
+
+
+def _newest(table, batches, schema):
+    """table with batches appended, reduced to the last-fetched row of every finnkode"""
+    tables = [table] if table is not None else []
+    if batches or not tables:
+        tables.append(pa.Table.from_batches(batches, schema=schema))
+    combined = pa.concat_tables(tables)
+    combined = combined.take(pc.sort_indices(combined, [("fetched_at", "ascending")]))
+    duplicate = combined.column("finnkode").to_pandas().duplicated(keep="last").to_numpy()
+    return combined.filter(pa.array(~duplicate))
+
+
+class ListingStore:
+    """Append-only, partitioned Parquet history of parsed listings keyed by finnkode"""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.join(self.path, SNAPSHOT_DIR), exist_ok=True)
+        self._filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+        self._lock = threading.Lock()
+        # finnkode -> (fetched_at in µs, content hash) of its latest stored row,
+        # covering the files in _indexed; files written elsewhere are picked up
+        # on the next append
+        self._index = {}
+        self._indexed = set()
+
+    # Reading
+
+    def files(self):
+        """Stored Parquet files relative to the store directory, excluding snapshot manifests"""
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.path)
+            for directory, _, names in os.walk(self.path)
+            if not os.path.relpath(directory, self.path).startswith(SNAPSHOT_DIR)
+            for name in names
+            if name.endswith(".parquet")
+        )
+
+    def _dataset(self, files):
+        return ds.dataset(
+            [os.path.join(self.path, name) for name in files],
+            schema=SCHEMA,
+            format="parquet",
+            filesystem=self._filesystem,
+            partitioning=PARTITIONING,
+            partition_base_dir=self.path
+        )
+
+    def dataset(self, snapshot=None, files=None):
+        """Memory-mapped pyarrow dataset of all rows, or of the files in a snapshot or list"""
+        if files is None:
+            files = self.snapshot_files(snapshot) if snapshot else self.files()
+        return self._dataset(files)
+
+    def scan(self, columns=None, filter=None, snapshot=None):
+        """Stream record batches of the requested columns and rows"""
+        return self.dataset(snapshot).to_batches(columns=columns, filter=filter)
+
+    def history(self, columns=None, filter=None, snapshot=None, files=None):
+        """Every stored row (of the given files, if any) as a DataFrame, oldest first"""
+        if columns is not None and "fetched_at" not in columns:
+            columns = list(columns) + ["fetched_at"]
+        table = self.dataset(snapshot, files).to_table(columns=columns, filter=filter)
+        return table.sort_by("fetched_at").to_pandas()
+
+    def latest(self, columns=None, filter=None, snapshot=None):
+        """The most recent row of every listing as a DataFrame
+
+        Batches are streamed and folded into the running result, so memory
+        follows the number of listings rather than the length of the history.
+        """
+        if columns is not None:
+            columns = list(dict.fromkeys(["finnkode", *columns, "fetched_at"]))
+        scanner = self.dataset(snapshot).scanner(columns=columns, filter=filter)
+        latest, pending, pending_rows = None, [], 0
+        for batch in scanner.to_batches():
+            if not batch.num_rows:
+                continue
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= max(LATEST_REDUCE_ROWS, latest.num_rows if latest is not None else 0):
+                latest, pending, pending_rows = _newest(latest, pending, scanner.projected_schema), [], 0
+        latest = _newest(latest, pending, scanner.projected_schema)
+        return latest.to_pandas().reset_index(drop=True)
+
+    def price_history(self, finnkode, snapshot=None):
+        """Observed prices of one listing over time, one row per price change"""
+        frame = self.history(
+            ["fetched_at", "price", "total_price"],
+            filter=ds.field("finnkode") == str(finnkode),
+            snapshot=snapshot
+        )
+        changed = frame[["price", "total_price"]].ne(frame[["price", "total_price"]].shift()).any(axis=1)
+        return frame[changed].reset_index(drop=True)
+
+    def __len__(self):
+        return self.dataset().count_rows()
+
+    # Writing
+
+    def _normalize(self, records, fetched_at):
+        rows = []
+        for record in records:
+            finnkode = record.get("finnkode")
+            if not finnkode:
+                continue
+            row = {field: record.get(field) for field in PROPERTY_FIELDS}
+            row["finnkode"] = str(finnkode)
+            row["url"] = record.get("url")
+            row["fetched_at"] = record.get("fetched_at") or fetched_at
+            rows.append(row)
+        if not rows:
+            return pd.DataFrame(columns=["finnkode", *PROPERTY_FIELDS])
+        # Within one batch the last occurrence of a listing wins
+        return pd.DataFrame(rows).drop_duplicates("finnkode", keep="last")
+
+    def _refresh_index(self):
+        """Add files not yet in the content hash index, e.g. ones written by another process"""
+        files = [name for name in self.files() if name not in self._indexed]
+        if not files:
+            return
+        columns = ["finnkode", "fetched_at", *TRACKED_FIELDS]
+        for batch in self._dataset(files).to_batches(columns=columns):
+            table = pa.Table.from_batches([batch])
+            for finnkode, fetched_at, digest in zip(
+                    table.column("finnkode").to_pylist(), _fetched_at(table), _content_hashes(table)):
+                stored = self._index.get(finnkode)
+                if stored is None or fetched_at >= stored[0]:
+                    self._index[finnkode] = (fetched_at, digest)
+        self._indexed.update(files)
+
+    def append(self, records, fetched_at=None):
+        """Store property_data dicts that carry a finnkode (and optionally url, fetched_at)
+
+        Listings whose fields are unchanged since they were last stored are
+        skipped. Returns the number of rows written.
+        """
+        fetched_at = fetched_at or datetime.now(timezone.utc)
+        frame = self._normalize(records, fetched_at)
+        if frame.empty:
+            return 0
+
+        frame = frame.copy()
+        frame["fetched_at"] = pd.to_datetime(frame["fetched_at"], utc=True)
+        frame["date"] = frame["fetched_at"].dt.date
+        frame["municipality"] = frame["address"].map(municipality_from_address)
+        table = pa.Table.from_pandas(frame, schema=SCHEMA, preserve_index=False)
+        digests = _content_hashes(table)
+
+        with self._lock:
+            self._refresh_index()
+            changed = [
+                self._index.get(finnkode, (None, None))[1] != digest
+                for finnkode, digest in zip(table.column("finnkode").to_pylist(), digests)
+            ]
+            table = table.filter(pa.array(changed, pa.bool_()))
+            if not table.num_rows:
+                return 0
+
+            written = []
+            ds.write_dataset(
+                table,
+                self.path,
+                format="parquet",
+                partitioning=PARTITIONING,
+                basename_template=f"part-{int(time.time())}-{uuid.uuid4().hex}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+                file_visitor=lambda written_file: written.append(os.path.relpath(written_file.path, self.path))
+            )
+            self._indexed.update(written)
+            digests = [digest for digest, keep in zip(digests, changed) if keep]
+            for finnkode, at, digest in zip(table.column("finnkode").to_pylist(), _fetched_at(table), digests):
+                stored = self._index.get(finnkode)
+                if stored is None or at >= stored[0]:
+                    self._index[finnkode] = (at, digest)
+
+            self._compact({os.path.dirname(name) for name in written}, min_files=COMPACT_FILES)
+        return table.num_rows
+
+    # Snapshots
+
+    def _snapshot_path(self, name):
+        return os.path.join(self.path, SNAPSHOT_DIR, f"{name}.json")
+
+    def snapshot(self, name=None):
+        """Record the current set of files under a name; returns the name
+
+        Because files are immutable, a snapshot is just the list of files that
+        existed when it was taken, and reading it later is cheap.
+        """
+        name = name or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        with self._lock:
+            manifest = {"created_at": time.time(), "files": self.files()}
+            with open(self._snapshot_path(name), "w", encoding="utf-8") as handle:
+                json.dump(manifest, handle, indent=1)
+        return name
+
+    def snapshots(self):
+        return sorted(
+            name[:-len(".json")]
+            for name in os.listdir(os.path.join(self.path, SNAPSHOT_DIR))
+            if name.endswith(".json")
+        )
+
+    def snapshot_files(self, name):
+        with open(self._snapshot_path(name), encoding="utf-8") as handle:
+            return json.load(handle)["files"]
+
+    # Maintenance
+
+    def compact(self):
+        """Merge the small files of each partition into one
+
+        Files referenced by a snapshot are left as they are. Returns the
+        number of files removed.
+        """
+        with self._lock:
+            return self._compact()
+
+    def _compact(self, directories=None, min_files=2):
+        referenced = {name for snapshot in self.snapshots() for name in self.snapshot_files(snapshot)}
+        partitions = {}
+        for name in self.files():
+            directory = os.path.dirname(name)
+            if name not in referenced and (directories is None or directory in directories):
+                partitions.setdefault(directory, []).append(name)
+
+        removed = 0
+        for directory, names in partitions.items():
+            if len(names) < min_files:
+                continue
+            table = ds.dataset(
+                [os.path.join(self.path, name) for name in names],
+                schema=FILE_SCHEMA,
+                format="parquet",
+                filesystem=self._filesystem
+            ).to_table()
+            target = os.path.join(directory, f"part-{int(time.time())}-{uuid.uuid4().hex}-0.parquet")
+            pq.write_table(table.sort_by("fetched_at"), os.path.join(self.path, target))
+            for name in names:
+                os.remove(os.path.join(self.path, name))
+            removed += len(names)
+            # The merged rows are already indexed
+            if self._indexed.issuperset(names):
+                self._indexed.add(target)
+            self._indexed.difference_update(names)
+        return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vedlikehold boliglageret")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Katalog for boliglageret")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Vis antall rader, boliger og filer")
+    history = commands.add_parser("history", help="Vis prishistorikk for en finnkode")
+    history.add_argument("finnkode")
+    snapshot = commands.add_parser("snapshot", help="Ta et øyeblikksbilde av lageret")
+    snapshot.add_argument("name", nargs="?")
+    commands.add_parser("compact", help="Slå sammen små filer i hver partisjon")
+    args = parser.parse_args(argv)
+
+    store = ListingStore(args.store)
+    if args.command == "stats":
+        latest = store.latest(["municipality"])
+        print(f"{len(store)} rader, {len(latest)} boliger, {len(store.files())} filer, "
+              f"{len(store.snapshots())} øyeblikksbilder")
+        print(latest["municipality"].value_counts().head(20).to_string())
+    elif args.command == "history":
+        print(store.price_history(args.finnkode).to_string(index=False))
+    elif args.command == "snapshot":
+        print(store.snapshot(args.name))
+    elif args.command == "compact":
+        print(f"{store.compact()} filer fjernet")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import numpy as np
+
+ANNUITY = "annuity"
+SERIAL = "serial"
+
+# Column layout of the last axis of an amortization schedule
+INTEREST, PRINCIPAL, BALANCE = 0, 1, 2
+
+
+def _loan_arrays(loan_amount, interest_rate, years):
+    loan_amount, interest_rate, years = np.broadcast_arrays(
+        np.asarray(loan_amount, dtype=np.float64),
+        np.asarray(interest_rate, dtype=np.float64),
+        np.asarray(years, dtype=np.float64),
+    )
+    monthly_rate = interest_rate / (100 * 12)
+    num_payments = np.maximum(np.rint(years * 12), 1)
+    return loan_amount, monthly_rate, num_payments
+
+
+def annuity_payment(loan_amount, interest_rate, years):
+    """Monthly annuity payment for annual interest_rate in percent; works on scalars and arrays"""
+    loan_amount, monthly_rate, num_payments = _loan_arrays(loan_amount, interest_rate, years)
+    growth = (1 + monthly_rate) ** num_payments
+    with np.errstate(divide="ignore", invalid="ignore"):
+        payment = loan_amount * (monthly_rate * growth) / (growth - 1)
+    # A zero-rate loan is repaid in equal instalments
+    return np.where(monthly_rate == 0, loan_amount / num_payments, payment)
+
+
+def serial_payment(loan_amount, interest_rate, years, month=1):
+    """Payment in the given month (1-based) of a serial loan (serielån)"""
+    loan_amount, monthly_rate, num_payments = _loan_arrays(loan_amount, interest_rate, years)
+    instalment = loan_amount / num_payments
+    opening_balance = np.maximum(loan_amount - instalment * (month - 1), 0)
+    return np.where(month <= num_payments, instalment + opening_balance * monthly_rate, 0.0)
+
+
+def first_payment(loan_amount, interest_rate, years, kind=ANNUITY):
+    """First monthly payment for an annuity or serial loan"""
+    if kind == SERIAL:
+        return serial_payment(loan_amount, interest_rate, years)
+    return annuity_payment(loan_amount, interest_rate, years)
+
+
+def amortization_schedule(loan_amount, interest_rate, years, kind=ANNUITY):
+    """Month-by-month (interest, principal, balance) for one or many loans
+
+    Inputs broadcast against each other; the result has shape
+    ``inputs.shape + (months, 3)`` with months = the longest term, and is
+    zero after a shorter loan has been repaid. Balances come from the closed
+    form for each loan type, so every month is computed in one pass and
+    zero-rate loans are exact.
+    """
+    loan_amount, monthly_rate, num_payments = _loan_arrays(loan_amount, interest_rate, years)
+    months = int(num_payments.max()) if num_payments.size else 0
+    k = np.arange(months + 1, dtype=np.float64)  # 0 = opening balance
+
+    principal_0 = loan_amount[..., None]
+    rate = monthly_rate[..., None]
+    n = num_payments[..., None]
+    elapsed = np.minimum(k, n)
+
+    if kind == SERIAL:
+        balance = principal_0 * (1 - elapsed / n)
+    elif kind == ANNUITY:
+        growth_n = (1 + rate) ** n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            balance = principal_0 * (growth_n - (1 + rate) ** elapsed) / (growth_n - 1)
+        balance = np.where(rate == 0, principal_0 * (1 - elapsed / n), balance)
+    else:
+        raise ValueError(f"Ukjent lånetype: {kind}")
+
+    schedule = np.empty(loan_amount.shape + (months, 3), dtype=np.float64)
+    opening = balance[..., :-1]
+    schedule[..., BALANCE] = balance[..., 1:]
+    schedule[..., PRINCIPAL] = opening - balance[..., 1:]
+    schedule[..., INTEREST] = opening * rate
+    return schedule
+
+
+def schedule_frame(schedule, yearly=False):
+    """Turn one loan's (months, 3) schedule into a DataFrame, optionally summed per year"""
+    # pandas is only needed for display; the schedule math above is numpy only
+    import pandas as pd
+
+    frame = pd.DataFrame({
+        "Måned": np.arange(1, len(schedule) + 1),
+        "Renter": schedule[:, INTEREST],
+        "Avdrag": schedule[:, PRINCIPAL],
+        "Restgjeld": schedule[:, BALANCE],
+    })
+    frame["Terminbeløp"] = frame["Renter"] + frame["Avdrag"]
+    if yearly:
+        frame["År"] = (frame["Måned"] - 1) // 12 + 1
+        frame = frame.groupby("År").agg(
+            Renter=("Renter", "sum"),
+            Avdrag=("Avdrag", "sum"),
+            Terminbeløp=("Terminbeløp", "sum"),
+            Restgjeld=("Restgjeld", "last"),
+        ).reset_index()
+    return frame
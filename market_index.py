@@ -0,0 +1,415 @@
+"""Rolling price/m² market index per municipality, property type and build year.
+
+Each observation goes into a mergeable log-bucket quantile sketch (relative
+error bounded by RELATIVE_ACCURACY) for its month. A market's rolling window
+is the sum of its last WINDOW_MONTHS monthly sketches, so adding a listing is
+O(1) and looking up a market never re-reads the listing history. Months and
+listings that have left the window of the newest observation are dropped, so
+the index stays the size of one window.
+
+Usage:
+    python market_index.py                      # catch up from the listing store
+    python market_index.py --municipality Oslo --type Leilighet --year 1936
+"""
+import argparse
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from listing_store import UNKNOWN_MUNICIPALITY, municipality_from_address
+
+DEFAULT_INDEX_PATH = os.environ.get(
+    "BOLIGBUDSJETT_MARKET_INDEX",
+    os.path.join(".cache", "market_index.npz")
+)
+FORMAT_VERSION = 2
+SAVE_INTERVAL = 5 * 60  # seconds between autosaves of a changed index
+SUMMARY_CACHE_SIZE = 4096
+RELATIVE_ACCURACY = 0.01
+MIN_PRICE_PER_SQM = 1_000
+MAX_PRICE_PER_SQM = 1_000_000
+WINDOW_MONTHS = 12
+MIN_MARKET_SIZE = 10  # fewer observations than this falls back to a wider market
+DEFAULT_QUANTILES = (0.25, 0.5, 0.75)
+
+# Build-year buckets as (upper bound exclusive, label)
+YEAR_BUCKETS = (
+    (1940, "før 1940"),
+    (1970, "1940–1969"),
+    (2000, "1970–1999"),
+    (2015, "2000–2014"),
+    (10000, "2015 og nyere"),
+)
+ANY = "*"
+PLURALS = {"Leilighet": "leiligheter", "Enebolig": "eneboliger", "Tomannsbolig": "tomannsboliger"}
+
+# Sketch bucket boundaries are powers of GAMMA between the price limits
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = np.log(GAMMA)
+_OFFSET = int(np.floor(np.log(MIN_PRICE_PER_SQM) / _LOG_GAMMA))
+SKETCH_BUCKETS = int(np.ceil(np.log(MAX_PRICE_PER_SQM) / _LOG_GAMMA)) - _OFFSET + 1
+
+
+def sketch_bucket(price_per_sqm):
+    """Sketch bucket index of price/m² values, clipped to the supported range"""
+    values = np.clip(np.asarray(price_per_sqm, dtype=np.float64), MIN_PRICE_PER_SQM, MAX_PRICE_PER_SQM)
+    return np.ceil(np.log(values) / _LOG_GAMMA).astype(np.int64) - _OFFSET
+
+
+def bucket_value(bucket):
+    """Representative price/m² of a bucket, within RELATIVE_ACCURACY of every value in it"""
+    return 2 * GAMMA ** (np.asarray(bucket) + _OFFSET) / (GAMMA + 1)
+
+
+def year_bucket(year_built):
+    if not year_built or pd.isna(year_built):
+        return ANY
+    for upper, label in YEAR_BUCKETS:
+        if year_built < upper:
+            return label
+    return ANY
+
+
+def market_keys(municipality, property_type, year_built):
+    """Markets an observation belongs to, from the narrowest to the widest"""
+    return _widen((municipality or UNKNOWN_MUNICIPALITY, property_type or ANY, year_bucket(year_built)))
+
+
+def _widen(key):
+    municipality, property_type, years = key
+    return tuple(dict.fromkeys((
+        (municipality, property_type, years),
+        (municipality, property_type, ANY),
+        (municipality, ANY, ANY),
+        (ANY, property_type, ANY),
+    )))
+
+
+def month_number(timestamp):
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.year * 12 + timestamp.month - 1
+
+
+def observations(frame):
+    """Price/m², municipality and build year per row of a property_data DataFrame"""
+    def coalesce(columns):
+        result = pd.Series(np.nan, index=frame.index, dtype=np.float64)
+        for column in reversed(columns):
+            if column in frame:
+                values = pd.to_numeric(frame[column], errors="coerce")
+                result = values.where(values.notna() & (values != 0), result)
+        return result
+
+    price = coalesce(("total_price", "price"))
+    area = coalesce(("bra_internal", "size", "bra_total"))
+    result = pd.DataFrame({
+        "finnkode": frame["finnkode"].astype(str) if "finnkode" in frame else None,
+        "municipality": (frame["municipality"] if "municipality" in frame
+                         else frame["address"].map(municipality_from_address)),
+        "property_type": frame["property_type"] if "property_type" in frame else None,
+        "year_built": pd.to_numeric(frame.get("year_built"), errors="coerce"),
+        "price_per_sqm": price / area,
+    }, index=frame.index)
+    fetched_at = (pd.to_datetime(frame["fetched_at"], utc=True) if "fetched_at" in frame
+                  else pd.Series(pd.Timestamp.now(tz="UTC"), index=frame.index))
+    result["month"] = fetched_at.dt.year * 12 + fetched_at.dt.month - 1
+    result["fetched_at"] = fetched_at.dt.as_unit("us").astype(np.int64)
+    return result[result["price_per_sqm"].notna() & (result["price_per_sqm"] > 0)]
+
+
+class MarketIndex:
+    """Monthly quantile sketches of price/m² per market, with a rolling window
+
+    A listing seen again (after a price change) replaces its earlier
+    observation, so each listing counts once; an observation older than the
+    one it would replace is ignored, so rows can be folded in more than once
+    and in any order.
+    """
+
+    def __init__(self, window_months=WINDOW_MONTHS):
+        self.window_months = window_months
+        self.watermark = None  # newest fetched_at folded in from the listing store
+        self._ingested = set()    # listing store files folded in
+        self.newest_month = None  # month of the newest observation; the window ends here
+        self._months = {}         # market key -> {month: bucket counts}
+        self._contributions = {}  # finnkode -> (month, bucket, narrowest market key, fetched_at in µs)
+        self._versions = {}       # market key -> number of updates
+        self._summaries = OrderedDict()  # (market key, last month) -> (version, cumulative counts), LRU
+        self._changed = False     # since the last save
+        self._autosaving = False
+        self._lock = threading.Lock()
+
+    def _bump(self, keys, month, bucket, delta):
+        for key in keys:
+            counts = self._months.setdefault(key, {}).get(month)
+            if counts is None:
+                counts = self._months[key][month] = np.zeros(SKETCH_BUCKETS, dtype=np.int64)
+            counts[bucket] += delta
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _prune(self):
+        """Drop the months, and the listings observed in them, that left the window"""
+        cutoff = self.newest_month - self.window_months
+        for key, months in list(self._months.items()):
+            expired = [month for month in months if month <= cutoff]
+            for month in expired:
+                del months[month]
+            if expired:
+                self._versions[key] = self._versions.get(key, 0) + 1
+            if not months:
+                del self._months[key]
+        self._contributions = {
+            finnkode: contribution for finnkode, contribution in self._contributions.items()
+            if contribution[0] > cutoff
+        }
+
+    def add(self, frame):
+        """Fold listings (a DataFrame or property_data dicts) into the index
+
+        Rows need price and area fields plus address (or municipality); the
+        optional finnkode and fetched_at columns enable replacement and
+        month bucketing. Rows from months before the window, and rows
+        already folded in, are skipped. Returns the number of observations
+        added.
+        """
+        frame = frame if isinstance(frame, pd.DataFrame) else pd.DataFrame(frame)
+        rows = observations(frame)
+        buckets = sketch_bucket(rows["price_per_sqm"].to_numpy())
+        with self._lock:
+            if len(rows):
+                newest = int(rows["month"].max())
+                if self.newest_month is None or newest > self.newest_month:
+                    self.newest_month = newest
+                    self._prune()
+            cutoff = self.newest_month - self.window_months if self.newest_month is not None else None
+            added = 0
+            for row, bucket in zip(rows.itertuples(index=False), buckets):
+                if row.month <= cutoff:
+                    continue
+                keys = market_keys(row.municipality, row.property_type, row.year_built)
+                if row.finnkode is not None:
+                    contribution = (row.month, int(bucket), keys[0], row.fetched_at)
+                    previous = self._contributions.get(row.finnkode)
+                    if previous is not None:
+                        if previous == contribution or row.fetched_at < previous[3]:
+                            continue
+                        self._bump(_widen(previous[2]), previous[0], previous[1], -1)
+                    self._contributions[row.finnkode] = contribution
+                self._bump(keys, row.month, bucket, 1)
+                added += 1
+            self._changed = self._changed or added > 0
+        return added
+
+    def update_from_store(self, store):
+        """Fold in the listing store files written since the last update
+
+        Progress is tracked by file rather than by fetched_at, so rows
+        another writer stores with an older fetched_at are still picked up.
+        Compacted files are read again, which add() makes harmless.
+        """
+        columns = ["finnkode", "fetched_at", "municipality", "property_type", "year_built",
+                   "total_price", "price", "bra_internal", "size", "bra_total"]
+        stored = store.files()
+        files = [name for name in stored if name not in self._ingested]
+        if not files:
+            return 0
+        frame = store.history(columns, files=files)
+        added = self.add(frame)
+        with self._lock:
+            self._ingested = (self._ingested & set(stored)) | set(files)
+            if len(frame):
+                newest = pd.Timestamp(frame["fetched_at"].max())
+                if self.watermark is None or newest > self.watermark:
+                    self.watermark = newest
+            self._changed = True
+        return added
+
+    def _window(self, key, last_month):
+        """Cumulative bucket counts of a market over the window ending at last_month"""
+        version = self._versions.get(key, 0)
+        cached = self._summaries.get((key, last_month))
+        if cached is None or cached[0] != version:
+            counts = np.zeros(SKETCH_BUCKETS, dtype=np.int64)
+            for month, month_counts in self._months.get(key, {}).items():
+                if last_month - self.window_months < month <= last_month:
+                    counts += month_counts
+            cached = self._summaries[(key, last_month)] = (version, np.cumsum(counts))
+            if len(self._summaries) > SUMMARY_CACHE_SIZE:
+                self._summaries.popitem(last=False)
+        self._summaries.move_to_end((key, last_month))
+        return cached[1]
+
+    def market(self, municipality, property_type=None, year_built=None, at=None, min_count=MIN_MARKET_SIZE):
+        """The narrowest market with at least min_count observations, as (key, cumulative counts)"""
+        last_month = month_number(at or datetime.now(timezone.utc))
+        with self._lock:
+            for key in market_keys(municipality, property_type, year_built):
+                cumulative = self._window(key, last_month)
+                if cumulative[-1] >= min_count:
+                    return key, cumulative
+        return None, None
+
+    def lookup(self, municipality, property_type=None, year_built=None, at=None,
+               quantiles=DEFAULT_QUANTILES, min_count=MIN_MARKET_SIZE):
+        """Rolling price/m² quantiles of a listing's local market, or None without enough data"""
+        key, cumulative = self.market(municipality, property_type, year_built, at, min_count)
+        if key is None:
+            return None
+        count = int(cumulative[-1])
+        result = {"market": key, "count": count}
+        for quantile in quantiles:
+            bucket = int(np.searchsorted(cumulative, quantile * count, side="left"))
+            result[quantile] = float(bucket_value(bucket))
+        return result
+
+    def compare(self, price_per_sqm, municipality, property_type=None, year_built=None, at=None,
+                min_count=MIN_MARKET_SIZE):
+        """Share of the local market priced below price_per_sqm, plus the market's median"""
+        key, cumulative = self.market(municipality, property_type, year_built, at, min_count)
+        if key is None:
+            return None
+        count = int(cumulative[-1])
+        bucket = int(sketch_bucket(price_per_sqm))
+        below = cumulative[bucket - 1] if bucket > 0 else 0
+        return {
+            "market": key,
+            "count": count,
+            "rank": float((below + (cumulative[bucket] - below) / 2) / count),
+            "median": float(bucket_value(int(np.searchsorted(cumulative, 0.5 * count, side="left")))),
+        }
+
+    def save(self, path=DEFAULT_INDEX_PATH, if_changed=False):
+        """Write the index to an .npz file; returns False if if_changed and nothing changed"""
+        with self._lock:
+            if if_changed and not self._changed:
+                return False
+            keys = list({key: None for key in self._months} | {c[2]: None for c in self._contributions.values()})
+            positions = {key: position for position, key in enumerate(keys)}
+            cells = [(positions[key], month, counts)
+                     for key, months in self._months.items() for month, counts in months.items()]
+            meta = {
+                "format": FORMAT_VERSION,
+                "sketch_buckets": SKETCH_BUCKETS,
+                "window_months": self.window_months,
+                "watermark": self.watermark.isoformat() if self.watermark is not None else None,
+                "newest_month": self.newest_month,
+                "ingested": sorted(self._ingested),
+                "keys": keys,
+            }
+            arrays = {
+                "meta": np.array(json.dumps(meta, ensure_ascii=False)),
+                "market": np.array([cell[0] for cell in cells], dtype=np.int64),
+                "month": np.array([cell[1] for cell in cells], dtype=np.int64),
+                "counts": (np.stack([cell[2] for cell in cells]) if cells
+                           else np.zeros((0, SKETCH_BUCKETS), dtype=np.int64)),
+                "finnkode": np.array(list(self._contributions), dtype=str),
+                "contribution_month": np.array([c[0] for c in self._contributions.values()], dtype=np.int64),
+                "contribution_bucket": np.array([c[1] for c in self._contributions.values()], dtype=np.int64),
+                "contribution_fetched_at": np.array([c[3] for c in self._contributions.values()], dtype=np.int64),
+                "contribution_market": np.array([positions[c[2]] for c in self._contributions.values()],
+                                                dtype=np.int64),
+            }
+            self._changed = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            with open(path + ".tmp", "wb") as handle:
+                np.savez_compressed(handle, **arrays)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            self._changed = True
+            raise
+        return True
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_PATH):
+        """Load a saved index, or start an empty one if there is none (or it is unreadable)"""
+        try:
+            with np.load(path, allow_pickle=False) as saved:
+                arrays = dict(saved)
+            meta = json.loads(arrays["meta"].item())
+        except (FileNotFoundError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+            return cls()
+        if meta.get("format") != FORMAT_VERSION or meta.get("sketch_buckets") != SKETCH_BUCKETS:
+            return cls()
+
+        index = cls(meta["window_months"])
+        index.watermark = pd.Timestamp(meta["watermark"]) if meta["watermark"] else None
+        index.newest_month = meta["newest_month"]
+        index._ingested = set(meta["ingested"])
+        keys = [tuple(key) for key in meta["keys"]]
+        for market, month, counts in zip(arrays["market"], arrays["month"], arrays["counts"]):
+            index._months.setdefault(keys[market], {})[int(month)] = counts.copy()
+        index._contributions = {
+            str(finnkode): (int(month), int(bucket), keys[market], int(fetched_at))
+            for finnkode, month, bucket, market, fetched_at in zip(
+                arrays["finnkode"], arrays["contribution_month"], arrays["contribution_bucket"],
+                arrays["contribution_market"], arrays["contribution_fetched_at"])
+        }
+        return index
+
+    def autosave(self, path=DEFAULT_INDEX_PATH, interval=SAVE_INTERVAL):
+        """Save a changed index every interval seconds on a daemon thread, and at exit"""
+        if self._autosaving:
+            return
+        self._autosaving = True
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.save(path, if_changed=True)
+
+        threading.Thread(target=run, name="market-index-autosave", daemon=True).start()
+        atexit.register(self.save, path, True)
+
+
+def market_label(key):
+    """Human-readable Norwegian description of a market key"""
+    municipality, property_type, years = key
+    parts = [PLURALS.get(property_type, property_type.lower()) if property_type != ANY else "boliger"]
+    if years != ANY:
+        parts.append(f"bygget {years}")
+    if municipality != ANY:
+        parts.append(f"i {municipality}")
+    return " ".join(parts)
+
+
+def main(argv=None):
+    from listing_store import DEFAULT_STORE_PATH, ListingStore
+
+    parser = argparse.ArgumentParser(description="Oppdater og vis markedsindeksen for pris/m²")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Katalog for boliglageret")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Fil for markedsindeksen")
+    parser.add_argument("--municipality", help="Vis markedet i dette poststedet")
+    parser.add_argument("--type", dest="property_type")
+    parser.add_argument("--year", type=int)
+    args = parser.parse_args(argv)
+
+    index = MarketIndex.load(args.index)
+    added = index.update_from_store(ListingStore(args.store))
+    index.save(args.index)
+    print(f"{added} nye observasjoner, oppdatert til {index.watermark}", file=sys.stderr)
+
+    if args.municipality:
+        summary = index.lookup(args.municipality, args.property_type, args.year)
+        if summary is None:
+            print("For få observasjoner i dette markedet")
+            return 1
+        print(f"{market_label(summary['market'])} (n={summary['count']}): "
+              f"median {summary[0.5]:,.0f} kr/m², 25–75 % {summary[0.25]:,.0f}–{summary[0.75]:,.0f}".replace(",", " "))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Renovation plan with the largest estimated value uplift within a budget.
+
+Every catalog item is a group of mutually exclusive options: leave it, or
+renovate it in one quality tier at one of its candidate amounts. Choosing
+at most one option per group under a cost limit is a multiple-choice
+knapsack, solved exactly by dynamic programming over the budget in steps
+of at least MIN_BUDGET_STEP NOK. Costs are rounded up to whole steps, so a
+plan never exceeds the budget; the whole catalog takes a few milliseconds.
+
+The uplift of an option is the catalog's ``uplift`` share for the tier
+times the local market price per m² times the renovated quantity.
+
+Usage:
+    python optimizer.py --area 62 --budget 400000 --price-per-sqm 95000 --region Oslo
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from renovation import current_table
+
+MAX_BUDGET_STEPS = 20_000
+MIN_BUDGET_STEP = 100  # NOK
+
+
+def plan_options(total_area, price_per_sqm, table=None, region=None, price_date=None):
+    """Candidate options per item as (item name, tiers, amounts, costs, uplifts)
+
+    Only options with a price and a positive uplift are included; the last
+    four entries are aligned sequences with one element per option.
+    """
+    table = table or current_table()
+    factor = table.factor(region, price_date)
+    options = []
+    for i, item_name in enumerate(table.items):
+        tiers, amounts, costs, uplifts = [], [], [], []
+        for j, tier in enumerate(table.tiers):
+            price, uplift = table.prices[i, j], table.uplift[i, j]
+            if np.isnan(price) or np.isnan(uplift) or uplift <= 0:
+                continue
+            for amount in table.amounts[i]:
+                quantity = total_area * amount / 100 if table.per_area[i] else amount
+                if quantity <= 0:
+                    continue
+                tiers.append(tier)
+                amounts.append(amount)
+                costs.append(price * factor * quantity)
+                uplifts.append(uplift * price_per_sqm * quantity)
+        if tiers:
+            options.append((item_name, tiers, amounts, np.array(costs), np.array(uplifts)))
+    return options
+
+
+def optimize_plan(total_area, budget, price_per_sqm, table=None, region=None, price_date=None,
+                  max_steps=MAX_BUDGET_STEPS):
+    """Plan within budget with the largest estimated value uplift
+
+    Returns (plan, cost, uplift), where plan maps item name -> (quality,
+    amount) as in renovation.plan_selections() and cost is the exact cost
+    of the plan at the region's prices.
+    """
+    table = table or current_table()
+    if budget <= 0 or total_area <= 0 or price_per_sqm <= 0:
+        return {}, 0.0, 0.0
+    options = plan_options(total_area, price_per_sqm, table, region, price_date)
+    # No plan costs more than the most expensive option of every item
+    budget = min(budget, sum(costs.max() for *_, costs, _ in options))
+    step = max(MIN_BUDGET_STEP, budget / max_steps)
+    steps = int(budget // step)
+
+    # best[c] is the largest uplift of the items so far with at most c steps of cost
+    best = np.zeros(steps + 1)
+    capacity = np.arange(steps + 1)
+    decisions = []
+    for item_name, tiers, amounts, costs, uplifts in options:
+        cells = np.ceil(costs / step - 1e-9).astype(np.int64)
+        fitting = np.flatnonzero(cells <= steps)
+        candidates = np.full((len(fitting) + 1, steps + 1), -np.inf)
+        candidates[0] = best  # leave the item as it is
+        for row, option in enumerate(fitting, 1):
+            candidates[row, cells[option]:] = best[:steps + 1 - cells[option]] + uplifts[option]
+        choice = candidates.argmax(axis=0)
+        best = candidates[choice, capacity]
+        decisions.append((item_name, tiers, amounts, costs, uplifts, cells, fitting, choice))
+
+    plan, cost, uplift = {}, 0.0, 0.0
+    remaining = steps
+    for item_name, tiers, amounts, costs, uplifts, cells, fitting, choice in reversed(decisions):
+        row = choice[remaining]
+        if row:
+            option = fitting[row - 1]
+            plan[item_name] = (tiers[option], amounts[option])
+            cost += costs[option]
+            uplift += uplifts[option]
+            remaining -= cells[option]
+    plan = {item_name: plan[item_name] for item_name in table.items if item_name in plan}
+    return plan, float(cost), float(uplift)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Finn oppussingsplanen med størst verdiøkning innenfor budsjettet")
+    parser.add_argument("--area", type=float, required=True, help="Boligens areal i m²")
+    parser.add_argument("--budget", type=float, required=True, help="Oppussingsbudsjett i NOK")
+    parser.add_argument("--price-per-sqm", type=float, required=True, help="Markedets pris per m²")
+    parser.add_argument("--region", help="Prisregion i katalogen")
+    args = parser.parse_args(argv)
+
+    plan, cost, uplift = optimize_plan(args.area, args.budget, args.price_per_sqm, region=args.region)
+    for item_name, (quality, amount) in plan.items():
+        print(f"{item_name}: {quality}, {amount:g}")
+    print(f"Kostnad {cost:,.0f} NOK; anslått verdiøkning {uplift:,.0f} NOK".replace(",", " "))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
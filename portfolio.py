@@ -0,0 +1,268 @@
+"""Portfolios of many listings per session, held as compact columnar tables.
+
+A Portfolio keeps its listings in one DataFrame with narrow dtypes instead
+of a property_data dict per listing. Every added listing is also written to
+the listing store, so the in-memory table is only a cache: the rows held
+by all portfolios in the process share one budget (RESIDENT_ROWS), and when
+it is exceeded the least recently used portfolios drop their tables and
+keep just their finnkodes. A dropped table is read back from the store the
+next time it is used. A portfolio larger than SESSION_RESIDENT_ROWS is
+never held in memory at all.
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from listing_store import municipality_from_address
+
+RESIDENT_ROWS = int(os.environ.get("BOLIGBUDSJETT_PORTFOLIO_ROWS", 50_000))
+SESSION_RESIDENT_ROWS = 2_000
+
+# Columns of a portfolio table and their in-memory dtypes
+COLUMNS = {
+    "finnkode": "string",
+    "url": "string",
+    "address": "string",
+    "municipality": "category",
+    "property_type": "category",
+    "price": "float64",    # total price, else asking price
+    "area": "float32",     # BRA-i, else P-ROM, else BRA
+    "year_built": "Int16",
+}
+# Listing store columns a portfolio table is built from
+STORE_COLUMNS = ["url", "address", "property_type", "total_price", "price",
+                 "bra_internal", "size", "bra_total", "year_built"]
+
+
+def _first(frame, columns):
+    # First non-missing, non-zero value across columns, like `a or b or 0`
+    result = pd.Series(np.nan, index=frame.index, dtype=np.float64)
+    for column in reversed(columns):
+        if column in frame:
+            values = pd.to_numeric(frame[column], errors="coerce")
+            result = values.where(values.notna() & (values != 0), result)
+    return result.fillna(0.0)
+
+
+def compact_frame(frame):
+    """Portfolio table from property_data rows that carry finnkode and url"""
+    result = pd.DataFrame({
+        "finnkode": frame["finnkode"].astype(str),
+        "url": frame["url"] if "url" in frame else None,
+        "address": frame["address"],
+        "municipality": frame["address"].map(municipality_from_address),
+        "property_type": frame["property_type"],
+        "price": _first(frame, ("total_price", "price")),
+        "area": _first(frame, ("bra_internal", "size", "bra_total", "area")),
+        "year_built": pd.to_numeric(frame["year_built"], errors="coerce"),
+    }, index=frame.index)
+    return result.astype(COLUMNS).reset_index(drop=True)
+
+
+class ResidentBudget:
+    """Process-wide limit on the portfolio rows held in memory
+
+    Portfolios report their resident rows on every use; when the total goes
+    over the limit the least recently used ones are spilled.
+    """
+
+    def __init__(self, rows=RESIDENT_ROWS):
+        self.rows = rows
+        self._lock = threading.Lock()
+        self._resident = OrderedDict()  # id(portfolio) -> (weak reference, rows)
+
+    def touch(self, portfolio, rows):
+        """Record that portfolio now holds rows in memory and was just used"""
+        victims = []
+        with self._lock:
+            key = id(portfolio)
+            self._resident.pop(key, None)
+            for other in [other for other, (ref, _) in self._resident.items() if ref() is None]:
+                del self._resident[other]
+            if rows:
+                self._resident[key] = (weakref.ref(portfolio), rows)
+            total = sum(count for _, count in self._resident.values())
+            while total > self.rows and len(self._resident) > 1:
+                other, (ref, count) = next(iter(self._resident.items()))
+                del self._resident[other]
+                total -= count
+                victims.append(ref)
+        # Outside the lock: spilling takes the victim's own lock
+        for ref in victims:
+            victim = ref()
+            if victim is not None:
+                victim.spill()
+
+    def resident_rows(self):
+        with self._lock:
+            return sum(count for ref, count in self._resident.values() if ref() is not None)
+
+
+BUDGET = ResidentBudget()
+
+
+class Portfolio:
+    """Listings of one session, in a compact table backed by the listing store"""
+
+    def __init__(self, store, budget=BUDGET, max_resident_rows=SESSION_RESIDENT_ROWS):
+        self.store = store
+        self.budget = budget
+        self.max_resident_rows = max_resident_rows
+        self.finnkodes = []
+        self.spills = 0
+        self._table = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in COLUMNS.items()})
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.finnkodes)
+
+    @property
+    def resident(self):
+        return self._table is not None
+
+    def _read(self):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        if not self.finnkodes:
+            return compact_frame(pd.DataFrame(columns=["finnkode", *STORE_COLUMNS]))
+        stored = self.store.latest(
+            STORE_COLUMNS,
+            filter=pc.is_in(pc.field("finnkode"), pa.array(self.finnkodes))
+        )
+        table = compact_frame(stored)
+        order = pd.Series(range(len(self.finnkodes)), index=self.finnkodes)
+        return table.iloc[np.argsort(order[table["finnkode"]].to_numpy(), kind="stable")].reset_index(drop=True)
+
+    def _keep(self, table):
+        self._table = table if len(table) <= self.max_resident_rows else None
+        return 0 if self._table is None else len(self._table)
+
+    def add(self, records):
+        """Add or update listings from property_data dicts with finnkode and url; returns the number added"""
+        records = [record for record in records if record.get("finnkode")]
+        if not records:
+            return 0
+        self.store.append(records)
+        frame = compact_frame(pd.DataFrame(records).drop_duplicates("finnkode", keep="last"))
+        with self._lock:
+            known = set(self.finnkodes)
+            added = [finnkode for finnkode in frame["finnkode"] if finnkode not in known]
+            self.finnkodes.extend(added)
+            if self._table is None:
+                rows = 0
+            else:
+                table = pd.concat(
+                    [self._table[~self._table["finnkode"].isin(frame["finnkode"])], frame],
+                    ignore_index=True
+                ).astype(COLUMNS)
+                position = {finnkode: i for i, finnkode in enumerate(self.finnkodes)}
+                table = table.iloc[np.argsort(table["finnkode"].map(position).to_numpy(), kind="stable")]
+                rows = self._keep(table.reset_index(drop=True))
+        self.budget.touch(self, rows)
+        return len(added)
+
+    def remove(self, finnkodes):
+        finnkodes = set(finnkodes)
+        with self._lock:
+            self.finnkodes = [finnkode for finnkode in self.finnkodes if finnkode not in finnkodes]
+            if self._table is not None:
+                self._table = self._table[~self._table["finnkode"].isin(finnkodes)].reset_index(drop=True)
+            rows = 0 if self._table is None else len(self._table)
+        self.budget.touch(self, rows)
+
+    def table(self):
+        """The portfolio as a compact DataFrame (see COLUMNS), read from the store if spilled"""
+        with self._lock:
+            table = self._table
+            if table is None:
+                table = self._read()
+                self._keep(table)
+            rows = 0 if self._table is None else len(self._table)
+        self.budget.touch(self, rows)
+        return table
+
+    def spill(self):
+        """Drop the in-memory table; the listings stay in the store"""
+        with self._lock:
+            if self._table is not None:
+                self._table = None
+                self.spills += 1
+
+    def memory_bytes(self):
+        table = self._table
+        return 0 if table is None else int(table.memory_usage(deep=True).sum())
+
+
+def plan_frame(table, plan, price_table):
+    """renovation_costs() input pricing plan for every listing of a portfolio table in its own region"""
+    from renovation import amount_column, quality_column
+
+    plans = pd.DataFrame({"area": table["area"].to_numpy(dtype=np.float64).round(2)}, index=table.index)
+    for item_name, (quality, amount) in (plan or {}).items():
+        plans[quality_column(item_name)] = quality
+        plans[amount_column(item_name)] = amount
+    municipality = table["municipality"].astype(object)
+    plans["region"] = municipality.where(municipality.isin(list(price_table.regions)), price_table.default_region)
+    return plans
+
+
+def evaluate(table, plan=None, market=None, price_table=None, **financing_args):
+    """Oversikt, Oppussing and Finansiering figures for every listing of a portfolio table at once
+
+    plan (item name -> (quality, amount)) is applied to every listing and
+    priced in the listing's municipality when that is a catalog region.
+    market is an optional MarketIndex for the local median price/m².
+    financing_args are passed to finance.financing(). Returns a DataFrame
+    aligned with table.
+    """
+    from finance import financing
+    from renovation import current_table, renovation_costs
+
+    price_table = price_table or current_table()
+    price = table["price"].to_numpy(dtype=np.float64)
+    area = table["area"].to_numpy(dtype=np.float64).round(2)  # undo float32 noise
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_per_sqm = np.where(area > 0, price / area, np.nan)
+
+    renovation_cost = renovation_costs(plan_frame(table, plan, price_table), price_table)["total"].to_numpy()
+
+    total_investment = price + renovation_cost
+    results = financing(total_investment, **financing_args)
+
+    municipality = table["municipality"].astype(object)
+    market_median = np.full(len(table), np.nan)
+    if market is not None and len(table):
+        # One lookup per distinct market rather than per listing
+        keys = pd.DataFrame({
+            "municipality": municipality,
+            "property_type": table["property_type"].astype(object),
+            "year_built": table["year_built"].astype("Float64").astype(object),
+        }).where(lambda frame: frame.notna(), None)
+        medians = {}
+        for key in set(keys.itertuples(index=False, name=None)):
+            summary = market.lookup(*key)
+            medians[key] = summary[0.5] if summary else np.nan
+        market_median = np.array([medians[key] for key in keys.itertuples(index=False, name=None)])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.DataFrame({
+            "finnkode": table["finnkode"],
+            "address": table["address"],
+            "property_type": table["property_type"],
+            "price": price,
+            "area": area,
+            "price_per_sqm": price_per_sqm,
+            "market_median": market_median,
+            "vs_market": price_per_sqm / market_median - 1,
+            "renovation_cost": renovation_cost,
+            "total_investment": total_investment,
+            "new_price_per_sqm": np.where(area > 0, total_investment / area, np.nan),
+            "loan_amount": results["loan_amount"],
+            "total_monthly": results["total_monthly"],
+            "net_annual_cost": results["net_annual_cost"],
+        }, index=table.index)
@@ -0,0 +1,376 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import logger
+
+# Prices live in an external catalog; edits are picked up without a restart
+CATALOG_PATH = os.environ.get(
+    "BOLIGBUDSJETT_PRICE_CATALOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog", "renovation_prices.json")
+)
+RELOAD_CHECK_INTERVAL = 1.0  # seconds between checks of the catalog's modification time
+DEFAULT_AREA_SHARES = (25, 50, 75, 100)  # candidate amounts of m² items without "amounts"
+
+
+class CostTable:
+    """A renovation price catalog compiled into a dense item x quality tier price matrix
+
+    Items, tiers and regions are mapped to array positions once, so a unit
+    price lookup is a couple of dict lookups and an array index. Prices are
+    quoted at base_date; factor() scales them by a regional multiplier and
+    the price index. The optional per-item ``uplift`` (value gained per unit
+    as a share of the market price per m²) and ``amounts`` (candidate
+    amounts) are what the plan optimizer works from.
+    """
+
+    def __init__(self, costs, tiers, regions=None, default_region=None,
+                 price_index=None, base_date=None, version=None):
+        self.tiers = tuple(tiers)
+        self.tier_index = {tier: j for j, tier in enumerate(self.tiers)}
+        self.costs = costs
+        self.categories = []
+        self.items = []
+        self.units = []
+        self.details = {}
+        self.amounts = []
+        rows = []
+        uplift_rows = []
+        for category, items in costs.items():
+            for item_name, item_details in items.items():
+                if item_details.get('unit') not in ("m²", "stk"):
+                    raise ValueError(f"Ukjent enhet for {item_name}: {item_details.get('unit')}")
+                self.details[item_name] = item_details
+                self.categories.append(category)
+                self.items.append(item_name)
+                self.units.append(item_details['unit'])
+                # A tier an item is not offered in is NaN
+                rows.append([item_details.get(tier, np.nan) for tier in self.tiers])
+                uplift = item_details.get('uplift', {})
+                uplift_rows.append([uplift.get(tier, np.nan) for tier in self.tiers])
+                default_amounts = DEFAULT_AREA_SHARES if item_details['unit'] == "m²" else (1,)
+                self.amounts.append(tuple(item_details.get('amounts', default_amounts)))
+        self.item_index = {item_name: i for i, item_name in enumerate(self.items)}
+        self.prices = np.array(rows, dtype=np.float64).reshape(len(self.items), len(self.tiers))
+        self.uplift = np.array(uplift_rows, dtype=np.float64).reshape(len(self.items), len(self.tiers))
+        self.per_area = np.array([unit == "m²" for unit in self.units], dtype=bool)
+
+        self.regions = dict(regions or {})
+        self.default_region = default_region
+        self.base_date = base_date
+        self.price_index = dict(sorted((price_index or {}).items()))
+        self._index_dates = list(self.price_index)
+        self.version = version
+
+    @classmethod
+    def from_catalog(cls, catalog, version=None):
+        """Build a table from a parsed catalog (see catalog/renovation_prices.json)"""
+        return cls(
+            catalog["categories"],
+            catalog["tiers"],
+            regions=catalog.get("regions"),
+            default_region=catalog.get("default_region"),
+            price_index=catalog.get("price_index"),
+            base_date=catalog.get("base_date"),
+            version=version
+        )
+
+    @property
+    def index_date(self):
+        """Latest date of the price index, which prices are adjusted to by default"""
+        return self._index_dates[-1] if self._index_dates else self.base_date
+
+    def offered_tiers(self, item_name):
+        """Quality tiers the item has a price for"""
+        row = self.prices[self.item_index[item_name]]
+        return [tier for tier, price in zip(self.tiers, row) if not np.isnan(price)]
+
+    def offers(self, item_name, tier):
+        """Whether the item has a price in the tier"""
+        j = self.tier_index.get(tier)
+        return j is not None and not np.isnan(self.prices[self.item_index[item_name], j])
+
+    def factor(self, region=None, date=None):
+        """Price multiplier for a region (default region if unknown) at a date (latest index point)"""
+        multiplier = self.regions.get(region, self.regions.get(self.default_region, 1.0))
+        if not self.price_index or self.base_date not in self.price_index:
+            return multiplier
+        if date is None:
+            index = self.price_index[self._index_dates[-1]]
+        else:
+            # Latest index point on or before the date (ISO dates sort as strings)
+            position = max(bisect.bisect_right(self._index_dates, str(date)) - 1, 0)
+            index = self.price_index[self._index_dates[position]]
+        return multiplier * index / self.price_index[self.base_date]
+
+    def unit_price(self, item_name, tier, region=None, date=None):
+        return float(self.prices[self.item_index[item_name], self.tier_index[tier]] * self.factor(region, date))
+
+    def frame(self):
+        """Return the price matrix as a DataFrame indexed by category, item and unit"""
+        index = pd.MultiIndex.from_arrays(
+            [self.categories, self.items, self.units],
+            names=["category", "item", "unit"]
+        )
+        return pd.DataFrame(self.prices, index=index, columns=list(self.tiers))
+
+
+def load_catalog(path=CATALOG_PATH):
+    """Read and compile a JSON price catalog"""
+    with open(path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    return CostTable.from_catalog(catalog, version=os.stat(path).st_mtime_ns)
+
+
+class CatalogReloader:
+    """Process-wide CostTable that is rebuilt when the catalog file changes
+
+    The file's modification time is checked at most every check_interval
+    seconds. A catalog that fails to load is logged and the previous table
+    stays in use.
+    """
+
+    def __init__(self, path=CATALOG_PATH, check_interval=RELOAD_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._table = load_catalog(path)
+        self._checked_at = time.monotonic()
+
+    def table(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._table
+        with self._lock:
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                try:
+                    if os.stat(self.path).st_mtime_ns != self._table.version:
+                        self._table = load_catalog(self.path)
+                        logger.info("price catalog reloaded from %s", self.path)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning("price catalog %s not reloaded: %s", self.path, e)
+        return self._table
+
+
+CATALOG = CatalogReloader()
+
+
+def current_table():
+    """The current price table, reloaded if the catalog file has changed"""
+    return CATALOG.table()
+
+
+def quality_column(item_name):
+    return f"quality:{item_name}"
+
+
+def amount_column(item_name):
+    return f"amount:{item_name}"
+
+
+def load_plan(path, table=None):
+    """Read a renovation plan JSON file as item name -> (quality, amount)
+
+    Items are {"quality": ..., "amount": ...} objects or [quality, amount]
+    pairs. quality defaults to "Standard" and amount to the
+    renovation_costs() default (100 % for m² items, else 1 piece).
+    """
+    table = table or current_table()
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    plan = {}
+    for item_name, choice in saved.items():
+        if isinstance(choice, dict):
+            quality, amount = choice.get("quality", "Standard"), choice.get("amount")
+        else:
+            quality, amount = (list(choice) + [None])[:2]
+        if amount is None:
+            per_area = item_name in table.details and table.details[item_name]['unit'] == "m²"
+            amount = 100 if per_area else 1
+        plan[item_name] = (quality, amount)
+    return plan
+
+
+def renovation_costs(plans, table=None, region=None, price_date=None):
+    """Compute per-item and total renovation costs for every row in plans
+
+    plans has one row per property with an ``area`` column (m²) and, per
+    renovation item, ``quality:<item>`` holding the chosen tier (missing or
+    NaN when the item is not renovated) and optionally ``amount:<item>``:
+    the share of the area in percent for m² items (default 100) or the
+    number of pieces for stk items (default 1). A ``region`` column, else
+    the region argument, picks the regional price multiplier (the default
+    region's when missing or unknown); prices are index-adjusted to
+    price_date (default: the latest index point). A tier the catalog does
+    not know, or that the item is not offered in, raises ValueError.
+    Returns a DataFrame with one cost column per item plus ``total``,
+    aligned with plans.index. table defaults to the current catalog.
+    """
+    table = table or current_table()
+    n_rows, n_items = len(plans), len(table.items)
+    area = plans["area"].to_numpy(dtype=np.float64, na_value=0.0) if "area" in plans else np.zeros(n_rows)
+
+    # Tier codes (-1 = not selected) and amounts as (rows x items) matrices
+    tier_codes = np.full((n_rows, n_items), -1, dtype=np.int64)
+    amounts = np.where(table.per_area, 100.0, 1.0) * np.ones((n_rows, 1))
+    for j, item_name in enumerate(table.items):
+        column = quality_column(item_name)
+        if column in plans:
+            codes = pd.Categorical(plans[column], categories=table.tiers).codes
+            unknown = (codes < 0) & plans[column].notna().to_numpy()
+            if unknown.any():
+                raise ValueError(f"Ukjent kvalitetsnivå for {item_name}: {plans[column][unknown].iloc[0]}")
+            tier_codes[:, j] = codes
+        column = amount_column(item_name)
+        if column in plans:
+            values = plans[column].to_numpy(dtype=np.float64, na_value=np.nan)
+            amounts[:, j] = np.where(np.isnan(values), amounts[:, j], values)
+
+    selected = tier_codes >= 0
+    unit_costs = table.prices[np.arange(n_items), np.where(selected, tier_codes, 0)]
+    unoffered = selected & np.isnan(unit_costs)
+    if unoffered.any():
+        row, j = np.argwhere(unoffered)[0]
+        raise ValueError(f"{table.items[j]} tilbys ikke i kvalitetsnivået {table.tiers[tier_codes[row, j]]}")
+    quantities = np.where(table.per_area, area[:, None] * amounts / 100, amounts)
+    if "region" in plans:
+        # Missing (NaN) regions are one factorized value too, priced like any unknown region
+        codes, regions = pd.factorize(plans["region"], use_na_sentinel=False)
+        factor = np.array([table.factor(value, price_date) for value in regions], dtype=np.float64)[codes][:, None]
+    else:
+        factor = table.factor(region, price_date)
+    costs = np.where(selected, unit_costs * quantities * factor, 0.0)
+
+    result = pd.DataFrame(costs, index=plans.index, columns=table.items)
+    result["total"] = costs.sum(axis=1)
+    return result
+
+
+def plan_selections(total_area, plan, table=None, region=None, price_date=None):
+    """Cost breakdown of one renovation plan in the Oppussing tab's selection format
+
+    plan maps item name -> (quality, amount) with amount as in renovation_costs().
+    """
+    table = table or current_table()
+    row = {"area": total_area}
+    for item_name, (quality, amount) in plan.items():
+        row[quality_column(item_name)] = quality
+        row[amount_column(item_name)] = amount
+    costs = renovation_costs(pd.DataFrame([row]), table, region, price_date).iloc[0]
+
+    selections = {}
+    for item_name, (quality, amount) in plan.items():
+        item_details = table.details[item_name]
+        selections[item_name] = {
+            "quality": quality,
+            "area": total_area * amount / 100 if item_details['unit'] == "m²" else amount,
+            "unit": item_details['unit'],
+            "unit_cost": table.unit_price(item_name, quality, region, price_date),
+            "total_cost": float(costs[item_name])
+        }
+    return selections
+
+
+def scenario_columns(table):
+    """Columns of a scenario frame: the name, then quality and amount per catalog item"""
+    columns = ["name"]
+    for item_name in table.items:
+        columns += [quality_column(item_name), amount_column(item_name)]
+    return columns
+
+
+def scenarios_frame(scenarios, table=None):
+    """Scenario frame (one row per scenario) from (name, plan) pairs, plans as in plan_selections()"""
+    table = table or current_table()
+    rows = []
+    for name, plan in scenarios:
+        row = {"name": name}
+        for item_name, (quality, amount) in plan.items():
+            if item_name in table.item_index:
+                row[quality_column(item_name)] = quality
+                row[amount_column(item_name)] = amount
+        rows.append(row)
+    frame = pd.DataFrame(rows, columns=scenario_columns(table))
+    for item_name in table.items:
+        frame[amount_column(item_name)] = frame[amount_column(item_name)].astype(np.float64)
+    return frame
+
+
+def scenario_plans(frame, table=None):
+    """(name, plan) pairs of a scenario frame, the inverse of scenarios_frame()"""
+    table = table or current_table()
+    scenarios = []
+    for _, row in frame.iterrows():
+        plan = {}
+        for item_name, per_area in zip(table.items, table.per_area):
+            quality = row.get(quality_column(item_name))
+            if isinstance(quality, str) and table.offers(item_name, quality):
+                amount = row.get(amount_column(item_name))
+                plan[item_name] = (quality, (100 if per_area else 1) if pd.isna(amount) else float(amount))
+        scenarios.append((row.get("name"), plan))
+    return scenarios
+
+
+class ScenarioCosts:
+    """Scenario x item cost matrix for one property that only prices scenarios it has not seen
+
+    Cost rows are memoized on each scenario's definition (the tier and
+    amount of every selected item), so editing, adding or renaming one
+    scenario leaves the other rows alone. The scenarios that did change are
+    priced together in one vectorized renovation_costs() pass.
+    """
+
+    def __init__(self, total_area, table=None, region=None, price_date=None):
+        self.table = table or current_table()
+        self.total_area = total_area
+        self.region = region
+        self.price_date = price_date
+        self.priced = 0  # scenario definitions priced so far
+        self._rows = {}
+
+    def matches(self, total_area, table, region=None, price_date=None):
+        """Whether the memoized rows are valid for this area, catalog version, region and date"""
+        return (total_area, table.version, region, price_date) == \
+            (self.total_area, self.table.version, self.region, self.price_date)
+
+    def _definition(self, row):
+        key = []
+        for item_name, per_area in zip(self.table.items, self.table.per_area):
+            quality = row.get(quality_column(item_name))
+            if not isinstance(quality, str) or not self.table.offers(item_name, quality):
+                key.append(None)
+                continue
+            amount = row.get(amount_column(item_name))
+            key.append((quality, (100.0 if per_area else 1.0) if pd.isna(amount) else float(amount)))
+        return tuple(key)
+
+    def costs(self, scenarios):
+        """Cost per item plus ``total`` for every row of a scenario frame, aligned with its index"""
+        keys = [self._definition(row) for row in scenarios.to_dict("records")]
+        new = [key for key in dict.fromkeys(keys) if key not in self._rows]
+        if new:
+            rows = []
+            for key in new:
+                row = {"area": self.total_area}
+                for item_name, choice in zip(self.table.items, key):
+                    if choice is not None:
+                        row[quality_column(item_name)], row[amount_column(item_name)] = choice
+                rows.append(row)
+            priced = renovation_costs(pd.DataFrame(rows), self.table, self.region, self.price_date)
+            self._rows.update(zip(new, priced.to_numpy()))
+            self.priced += len(new)
+
+        # Definitions no longer in use were edited away or deleted
+        live = set(keys)
+        for key in [key for key in self._rows if key not in live]:
+            del self._rows[key]
+
+        columns = [*self.table.items, "total"]
+        matrix = np.array([self._rows[key] for key in keys]).reshape(len(keys), len(columns))
+        return pd.DataFrame(matrix, index=scenarios.index, columns=columns)
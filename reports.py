@@ -0,0 +1,536 @@
+"""Cost reports as CSV, Excel (XLSX) or PDF, written row by row.
+
+A report is a sequence of sections, each a (title, columns, rows) tuple
+whose rows are produced lazily. The writers consume the rows as they come
+and write them straight to a binary file, so a report over thousands of
+listings never exists in memory as a whole. XLSX and PDF are produced with
+the standard library (zipfile, and a minimal PDF writer using the built-in
+Helvetica font), so no extra dependencies are needed.
+
+Usage:
+    python reports.py listings.csv -o rapport.xlsx --plan plan.json --rate 4.5 --years 25
+"""
+import argparse
+import codecs
+import csv
+import io
+import re
+import sys
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from finance import DEFAULT_EQUITY_PERCENT, DEFAULT_INTEREST_RATE, DEFAULT_YEARS, financing
+from loans import ANNUITY, BALANCE, INTEREST, PRINCIPAL, SERIAL, amortization_schedule
+
+# Format -> (MIME type, file extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "pdf": ("application/pdf", "pdf"),
+}
+LOAN_TYPE_LABELS = {ANNUITY: "Annuitetslån", SERIAL: "Serielån"}
+CHUNK_ROWS = 500  # listings per vectorized pass in portfolio reports
+
+
+def _value(value):
+    """A cell value as None, a float/int or a string"""
+    if isinstance(value, float):  # also numpy.float64
+        return round(float(value), 2) if value == value else None
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (bool, np.bool_)):
+        return "Ja" if value else "Nei"
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, np.floating):
+        return _value(float(value))
+    try:
+        if value != value:  # pandas NA and other missing markers
+            return None
+    except TypeError:
+        return None
+    return str(value)
+
+
+class CsvReportWriter:
+    """Sections one after another, each as a title line, a header and its rows"""
+
+    def __init__(self, output, title=None):
+        output.write(codecs.BOM_UTF8)  # so that Excel opens the file as UTF-8
+        self._text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+        self._csv = csv.writer(self._text)
+        self._sections = 0
+        if title:
+            self._csv.writerow([title])
+            self._sections += 1  # blank line before the first section
+
+    def section(self, title, columns):
+        if self._sections:
+            self._csv.writerow([])
+        self._csv.writerow([title])
+        self._csv.writerow(columns)
+        self._sections += 1
+
+    def row(self, values):
+        self._csv.writerow(["" if value is None else value for value in map(_value, values)])
+
+    def close(self):
+        self._text.flush()
+        self._text.detach()
+
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{sheets}</Types>'
+)
+_XLSX_SHEET_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{n}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}<Relationship Id="rIdStyles" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/></Relationships>'
+)
+# Cell styles: 0 plain, 1 bold header, 2 number with thousands separator
+_XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="3" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '</styleSheet>'
+)
+_XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" state="frozen"/>'
+    '</sheetView></sheetViews><sheetData>'
+)
+_XML_INVALID = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+class XlsxReportWriter:
+    """One worksheet per section, with each sheet's XML streamed into the zip as rows arrive
+
+    The title is not written; the sheets are named after the sections.
+    """
+
+    def __init__(self, output, title=None):
+        self._zip = zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED)
+        self._names = []
+        self._sheet = None
+
+    def _sheet_name(self, title):
+        name = re.sub(r"[\[\]:*?/\\]", " ", title).strip()[:31] or "Ark"
+        base, copy = name, 2
+        while name.lower() in (existing.lower() for existing in self._names):
+            suffix = f" ({copy})"
+            name, copy = base[:31 - len(suffix)] + suffix, copy + 1
+        return name
+
+    def _end_sheet(self):
+        if self._sheet is not None:
+            self._sheet.write("</sheetData></worksheet>")
+            self._sheet.close()
+            self._sheet = None
+
+    def section(self, title, columns):
+        self._end_sheet()
+        self._names.append(self._sheet_name(title))
+        member = self._zip.open(f"xl/worksheets/sheet{len(self._names)}.xml", "w", force_zip64=True)
+        self._sheet = io.TextIOWrapper(member, encoding="utf-8")
+        self._sheet.write(_XLSX_SHEET_START)
+        self._write_row(columns, style=1)
+
+    def _write_row(self, values, style=None):
+        # Strings inline, numbers with a thousands separator unless the row has its own style
+        text_style = f' s="{style}"' if style else ""
+        number_style = f' s="{style or 2}"'
+        cells = []
+        for value in map(_value, values):
+            if value is None:
+                cells.append("<c/>")
+            elif isinstance(value, str):
+                text = escape(_XML_INVALID.sub("", value))
+                cells.append(f'<c t="inlineStr"{text_style}><is><t xml:space="preserve">{text}</t></is></c>')
+            else:
+                cells.append(f"<c{number_style}><v>{value!r}</v></c>")
+        self._sheet.write(f"<row>{''.join(cells)}</row>")
+
+    def row(self, values):
+        self._write_row(values)
+
+    def close(self):
+        self._end_sheet()
+        if not self._names:
+            self.section("Rapport", [])
+            self._end_sheet()
+        count = range(1, len(self._names) + 1)
+        self._zip.writestr("[Content_Types].xml", _XLSX_CONTENT_TYPES.format(
+            sheets="".join(_XLSX_SHEET_TYPE.format(n=n) for n in count)))
+        self._zip.writestr("_rels/.rels", _XLSX_ROOT_RELS)
+        self._zip.writestr("xl/workbook.xml", _XLSX_WORKBOOK.format(sheets="".join(
+            f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{n}" r:id="rId{n}"/>'
+            for n, name in zip(count, self._names))))
+        self._zip.writestr("xl/_rels/workbook.xml.rels", _XLSX_WORKBOOK_RELS.format(sheets="".join(
+            f'<Relationship Id="rId{n}" '
+            f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{n}.xml"/>' for n in count)))
+        self._zip.writestr("xl/styles.xml", _XLSX_STYLES)
+        self._zip.close()
+
+
+# Helvetica advance widths (1/1000 em) of the characters that matter for alignment
+_HELVETICA_WIDTHS = {**dict.fromkeys("0123456789", 556), " ": 278, ",": 278, ".": 278, "-": 333,
+                     "%": 889, "i": 222, "l": 222, "j": 222, "I": 278, "f": 278, "t": 278, "r": 333,
+                     "m": 833, "w": 722, "M": 833, "W": 944}
+
+
+def _text_width(text, size):
+    return sum(_HELVETICA_WIDTHS.get(char, 556) for char in text) * size / 1000
+
+
+class PdfReportWriter:
+    """Tables on A4 landscape pages in Helvetica, each page written out as soon as it is full
+
+    Numbers are right-aligned with spaces as thousands separators, text is
+    cut to its column. The page tree, cross-reference table and trailer are
+    written on close(), so only the current page is held in memory.
+    """
+
+    PAGE_WIDTH, PAGE_HEIGHT = 842, 595
+    MARGIN = 36
+    FONT_SIZE = 8
+    TITLE_SIZE = 12
+    LINE_HEIGHT = 11
+
+    def __init__(self, output, title=None):
+        self._output = output
+        self._position = 0
+        self._offsets = {}
+        self._next_id = 5  # 1 catalog, 2 page tree, 3 regular and 4 bold font
+        self._pages = []
+        self._content = None
+        self._columns = None
+        self._y = 0
+        self.title = title
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        for object_id, font in ((3, "Helvetica"), (4, "Helvetica-Bold")):
+            self._object(object_id, f"<< /Type /Font /Subtype /Type1 /BaseFont /{font} "
+                                    f"/Encoding /WinAnsiEncoding >>".encode("ascii"))
+
+    def _write(self, data):
+        self._output.write(data)
+        self._position += len(data)
+
+    def _object(self, object_id, body):
+        self._offsets[object_id] = self._position
+        self._write(f"{object_id} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+
+    def _allocate(self):
+        self._next_id += 1
+        return self._next_id - 1
+
+    @staticmethod
+    def _escape(text):
+        encoded = text.encode("cp1252", errors="replace")
+        return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+    def _text(self, x, text, bold=False, size=None):
+        size = size or self.FONT_SIZE
+        self._content.append(b"BT /F%d %d Tf %.2f %.2f Td (%s) Tj ET" % (
+            2 if bold else 1, size, x, self._y, self._escape(text)))
+
+    def _end_page(self):
+        if self._content is None:
+            return
+        self._y = self.MARGIN / 2
+        self._text(self.PAGE_WIDTH - self.MARGIN - 30, f"Side {len(self._pages) + 1}")
+        stream = zlib.compress(b"\n".join(self._content))
+        content_id, page_id = self._allocate(), self._allocate()
+        self._object(content_id, b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream"
+                     % (len(stream), stream))
+        self._object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.PAGE_WIDTH} {self.PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode("ascii"))
+        self._pages.append(page_id)
+        self._content = None
+
+    def _new_page(self):
+        self._end_page()
+        self._content = []
+        self._y = self.PAGE_HEIGHT - self.MARGIN
+        if self.title:
+            self._text(self.MARGIN, self.title, bold=True)
+            self._y -= self.LINE_HEIGHT * 1.5
+
+    def _cells(self, values, bold=False):
+        # One text object per row, built as text and encoded once
+        width = (self.PAGE_WIDTH - 2 * self.MARGIN) / max(len(values), 1)
+        scale = self.FONT_SIZE / 1000
+        y = self._y
+        commands = [f"BT /F{2 if bold else 1} {self.FONT_SIZE} Tf"]
+        for column, value in enumerate(values):
+            left = self.MARGIN + column * width
+            if isinstance(value, (int, float)):
+                text = f"{value:,.0f}".replace(",", " ") if abs(value) >= 100 else f"{value:g}"
+                # Digits are 556 wide in Helvetica; spaces and points 278, minus 333
+                text_width = (556 * len(text) - 278 * (text.count(" ") + text.count("."))
+                              - 223 * text.count("-")) * scale
+                commands.append(f"1 0 0 1 {left + width - 4 - text_width:.2f} {y:.2f} Tm ({text}) Tj")
+            elif value is not None:
+                text = str(value)
+                # No Helvetica character is wider than 1015/1000 em, so short texts fit unmeasured
+                while text and len(text) * 1.015 * self.FONT_SIZE > width - 6 and (
+                        _text_width(text, self.FONT_SIZE) > width - 6):
+                    text = text[:-2] + "…" if len(text) > 1 else ""
+                text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+                commands.append(f"1 0 0 1 {left:.2f} {y:.2f} Tm ({text}) Tj")
+        commands.append("ET")
+        self._content.append(" ".join(commands).encode("cp1252", errors="replace"))
+        self._y -= self.LINE_HEIGHT
+
+    def section(self, title, columns):
+        if self._content is None or self._y < self.MARGIN + 4 * self.LINE_HEIGHT:
+            self._new_page()
+        elif self._columns is not None:
+            self._y -= self.LINE_HEIGHT
+        self._y -= self.TITLE_SIZE - self.FONT_SIZE
+        self._text(self.MARGIN, title, bold=True, size=self.TITLE_SIZE)
+        self._y -= self.LINE_HEIGHT * 1.5
+        self._columns = list(columns)
+        self._cells(self._columns, bold=True)
+
+    def row(self, values):
+        if self._content is None or self._y < self.MARGIN:
+            self._new_page()
+            if self._columns:
+                self._cells(self._columns, bold=True)  # repeat the header on every page
+        self._cells([_value(value) for value in values])
+
+    def close(self):
+        if self._content is None and not self._pages:
+            self._new_page()
+        self._end_page()
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._pages)
+        self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>".encode("ascii"))
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self._position
+        lines = [f"xref\n0 {self._next_id}\n", "0000000000 65535 f \n"]
+        lines += [f"{self._offsets[object_id]:010d} 00000 n \n" for object_id in range(1, self._next_id)]
+        lines.append(f"trailer\n<< /Size {self._next_id} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n")
+        self._write("".join(lines).encode("ascii"))
+
+
+WRITERS = {"csv": CsvReportWriter, "xlsx": XlsxReportWriter, "pdf": PdfReportWriter}
+
+
+def write_report(sections, format, output, title=None):
+    """Write (title, columns, rows) sections to a binary file in the given format"""
+    writer = WRITERS[format](output, title)
+    try:
+        for section_title, columns, rows in sections:
+            writer.section(section_title, columns)
+            for values in rows:
+                writer.row(values)
+    finally:
+        writer.close()
+    return output
+
+
+def report_bytes(format, build, *args, title=None, **kwargs):
+    """The report built by build(*args, **kwargs) as bytes
+
+    Meant to be handed to st.download_button as deferred data, which keeps
+    the finished file in memory anyway; the CLI streams to disk instead.
+    """
+    return write_report(build(*args, **kwargs), format, io.BytesIO(), title).getvalue()
+
+
+# Report contents
+
+def schedule_rows(loan_amount, interest_rate, years, loan_type):
+    """Monthly amortization schedule rows of one loan"""
+    schedule = amortization_schedule(loan_amount, interest_rate, years, loan_type)
+    for month, (interest, principal, balance) in enumerate(schedule, 1):
+        yield month, interest, principal, interest + principal, balance
+
+
+def listing_report(data, selections, equity_percent=DEFAULT_EQUITY_PERCENT,
+                   interest_rate=DEFAULT_INTEREST_RATE, years=DEFAULT_YEARS, loan_type=ANNUITY,
+                   felleskostnader=None, kommunale_avg=None, forsikring=None, vedlikehold=None, strom=None):
+    """Summary, renovation breakdown and amortization schedule of one listing
+
+    data is the listing's property_data and selections the Oppussing tab's
+    cost breakdown (renovation.plan_selections()). The monthly running
+    costs are passed to finance.financing(), so None uses its defaults.
+    """
+    price = data['total_price'] or data['price'] or 0
+    area = data['bra_internal'] or data['size'] or data['bra_total'] or 0
+    renovation_cost = sum(details['total_cost'] for details in selections.values())
+    total_investment = price + renovation_cost
+    figures = {name: float(value) for name, value in financing(
+        total_investment, equity_percent, interest_rate, years, felleskostnader=felleskostnader,
+        kommunale_avg=kommunale_avg, forsikring=forsikring, vedlikehold=vedlikehold, strom=strom,
+        loan_type=loan_type).items()}
+
+    summary = [
+        ("Adresse", data['address']),
+        ("Boligtype", data['property_type']),
+        ("Areal (m²)", area or None),
+        ("Kjøpspris", price),
+        ("Oppussingskostnad", renovation_cost),
+        ("Total investering", total_investment),
+        ("Ny pris per m²", total_investment / area if area else None),
+        ("Egenkapital (%)", equity_percent),
+        ("Lånebeløp", figures["loan_amount"]),
+        ("Lånerente (%)", interest_rate),
+        ("Nedbetalingstid (år)", years),
+        ("Lånetype", LOAN_TYPE_LABELS.get(loan_type, loan_type)),
+        ("Første terminbeløp", figures["monthly_loan"]),
+        ("Månedlige driftskostnader", figures["monthly_running_costs"]),
+        ("Totale månedlige kostnader", figures["total_monthly"]),
+        ("Netto årlig kostnad", figures["net_annual_cost"]),
+    ]
+    yield "Sammendrag", ["Post", "Verdi"], summary
+    yield "Oppussing", ["Post", "Kvalitet", "Omfang", "Enhet", "Enhetspris", "Kostnad"], (
+        (item_name, details['quality'], details['area'], details['unit'], details['unit_cost'],
+         details['total_cost'])
+        for item_name, details in selections.items()
+    )
+    yield "Nedbetalingsplan", ["Måned", "Renter", "Avdrag", "Terminbeløp", "Restgjeld"], schedule_rows(
+        figures["loan_amount"], interest_rate, years, loan_type)
+
+
+def portfolio_report(chunks, plan=None, market=None, price_table=None, equity_percent=DEFAULT_EQUITY_PERCENT,
+                     interest_rate=DEFAULT_INTEREST_RATE, years=DEFAULT_YEARS, loan_type=ANNUITY):
+    """Listings, renovation breakdown and yearly amortization of many listings
+
+    chunks() returns an iterable of portfolio tables (portfolio.COLUMNS) and
+    is called once per section, so the listings can be streamed from disk
+    and never have to be in memory all at once.
+    """
+    from portfolio import evaluate, plan_frame
+    from renovation import current_table, renovation_costs
+
+    price_table = price_table or current_table()
+    # Items missing from the catalog are not priced, so they get no breakdown column either
+    plan = {item_name: choice for item_name, choice in (plan or {}).items() if item_name in price_table.item_index}
+    terms = {"equity_percent": equity_percent, "interest_rate": interest_rate, "years": years,
+             "loan_type": loan_type}
+
+    def listings():
+        for table in chunks():
+            results = evaluate(table, plan, market, price_table, **terms)
+            yield from results[[
+                "finnkode", "address", "property_type", "price", "area", "price_per_sqm", "market_median",
+                "renovation_cost", "total_investment", "new_price_per_sqm", "loan_amount", "total_monthly",
+                "net_annual_cost"
+            ]].itertuples(index=False, name=None)
+
+    def renovation():
+        for table in chunks():
+            costs = renovation_costs(plan_frame(table, plan, price_table), price_table)
+            item_costs = np.column_stack([costs[item_name].to_numpy() for item_name in plan]).tolist()
+            for finnkode, address, row_costs in zip(table["finnkode"], table["address"], item_costs):
+                for (item_name, (quality, amount)), cost in zip(plan.items(), row_costs):
+                    yield finnkode, address, item_name, quality, amount, cost
+
+    def amortization():
+        for table in chunks():
+            loans = evaluate(table, plan, None, price_table, **terms)["loan_amount"].to_numpy()
+            schedule = amortization_schedule(loans, interest_rate, years, loan_type)
+            months = schedule.shape[1]
+            yearly = np.zeros((len(loans), -(-months // 12), 3))
+            np.add.at(yearly, (slice(None), np.arange(months) // 12), schedule)
+            balance = schedule[:, np.minimum(np.arange(12, months + 12, 12), months) - 1, BALANCE]
+            for finnkode, loan_years, loan_balance in zip(table["finnkode"], yearly, balance):
+                for year, (values, remaining) in enumerate(zip(loan_years, loan_balance), 1):
+                    yield (finnkode, year, values[INTEREST], values[PRINCIPAL],
+                           values[INTEREST] + values[PRINCIPAL], remaining)
+
+    yield "Boliger", ["Finnkode", "Adresse", "Type", "Pris", "Areal", "Pris/m²", "Markedsmedian",
+                      "Oppussing", "Total investering", "Ny pris/m²", "Lån", "Per måned",
+                      "Netto per år"], listings()
+    if plan:
+        yield "Oppussing", ["Finnkode", "Adresse", "Post", "Kvalitet", "Omfang", "Kostnad"], renovation()
+    yield "Nedbetalingsplan", ["Finnkode", "År", "Renter", "Avdrag", "Terminbeløp", "Restgjeld"], amortization()
+
+
+def table_chunks(table, size=CHUNK_ROWS):
+    """chunks() for portfolio_report over an in-memory portfolio table"""
+    return lambda: (table.iloc[start:start + size] for start in range(0, len(table), size))
+
+
+def main(argv=None):
+    from batch_pricing import read_chunks
+    from portfolio import compact_frame
+    from renovation import load_plan
+
+    parser = argparse.ArgumentParser(description="Lag kostnadsrapport for mange boliger som CSV, XLSX eller PDF")
+    parser.add_argument("input", help="CSV- eller Parquet-fil med boliger (finnkode, adresse, pris og areal)")
+    parser.add_argument("-o", "--output", required=True, help="Rapportfil; formatet følger filendelsen")
+    parser.add_argument("--plan", help="JSON-fil med oppussingsplan, f.eks. "
+                        "{\"Nytt bad\": {\"quality\": \"Standard\", \"amount\": 10}}")
+    parser.add_argument("--equity-percent", type=float, default=DEFAULT_EQUITY_PERCENT)
+    parser.add_argument("--rate", type=float, default=DEFAULT_INTEREST_RATE)
+    parser.add_argument("--years", type=int, default=DEFAULT_YEARS)
+    parser.add_argument("--serial", action="store_true", help="Serielån i stedet for annuitetslån")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    format = args.output.rsplit(".", 1)[-1].lower()
+    if format not in FORMATS:
+        parser.error(f"Ukjent format: {format} (bruk {', '.join(FORMATS)})")
+    plan = load_plan(args.plan) if args.plan else {}
+
+    def chunks():
+        for chunk in read_chunks(args.input, args.chunksize):
+            for column in ("url", "property_type", "year_built"):
+                if column not in chunk:
+                    chunk[column] = None
+            yield compact_frame(chunk)
+
+    sections = portfolio_report(chunks, plan, equity_percent=args.equity_percent, interest_rate=args.rate,
+                                years=args.years, loan_type=SERIAL if args.serial else ANNUITY)
+    with open(args.output, "wb") as output:
+        write_report(sections, format, output, title="Kostnadsrapport")
+    print(f"Rapport skrevet til {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from loans import ANNUITY, SERIAL
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+HISTOGRAM_BINS = 1024
+PILOT_PATHS = 2000
+
+# Stochastic model defaults; rates and volatilities are annual and in percent
+# points where they concern the interest rate
+DEFAULT_MODEL = {
+    "long_run_rate": None,          # defaults to the starting interest rate
+    "rate_mean_reversion": 0.25,    # share of the gap to the long-run rate closed per year
+    "rate_volatility": 1.0,         # percent points per sqrt(year)
+    "electricity_mean_reversion": 0.5,
+    "electricity_volatility": 0.35,  # log-price volatility per sqrt(year)
+    "overrun_mean": 0.15,           # expected renovation overrun as share of budget
+    "overrun_volatility": 0.25,
+}
+
+
+def _simulate_paths(params, n_paths, rng):
+    """Cumulative cost per path and month, shape (n_paths, months)"""
+    months = params["months"]
+    dt = 1 / 12
+    model = params["model"]
+    long_run_rate = model["long_run_rate"]
+    if long_run_rate is None:
+        long_run_rate = params["interest_rate"]
+
+    balance = np.full(n_paths, float(params["loan_amount"]))
+    rate = np.full(n_paths, float(params["interest_rate"]))
+    log_electricity = np.zeros(n_paths)
+    instalment = params["loan_amount"] / months
+
+    # Renovation overruns are paid up front, so they start the cumulative cost
+    overrun_sigma = model["overrun_volatility"]
+    overrun_factor = rng.lognormal(np.log1p(model["overrun_mean"]) - overrun_sigma ** 2 / 2,
+                                   overrun_sigma, n_paths)
+    cumulative = params["renovation_total"] * np.maximum(overrun_factor - 1, 0)
+
+    result = np.empty((n_paths, months))
+    rate_shocks = rng.standard_normal((months, n_paths))
+    electricity_shocks = rng.standard_normal((months, n_paths))
+    for month in range(months):
+        # Floating rate: the payment is re-amortized over the remaining term
+        monthly_rate = rate / 1200
+        interest = balance * monthly_rate
+        if params["loan_type"] == SERIAL:
+            principal = np.minimum(instalment, balance)
+        else:
+            remaining = months - month
+            growth = (1 + monthly_rate) ** remaining
+            with np.errstate(divide="ignore", invalid="ignore"):
+                payment = balance * monthly_rate * growth / (growth - 1)
+            payment = np.where(monthly_rate > 0, payment, balance / remaining)
+            principal = payment - interest
+        balance = balance - principal
+
+        electricity = params["strom"] * np.exp(log_electricity)
+        cumulative = cumulative + interest + principal + params["fixed_monthly"] + electricity
+        result[:, month] = cumulative
+
+        rate = np.maximum(
+            rate + model["rate_mean_reversion"] * (long_run_rate - rate) * dt
+            + model["rate_volatility"] * np.sqrt(dt) * rate_shocks[month],
+            0.0
+        )
+        log_electricity = (
+            log_electricity * (1 - model["electricity_mean_reversion"] * dt)
+            + model["electricity_volatility"] * np.sqrt(dt) * electricity_shocks[month]
+        )
+    return result
+
+
+class HistogramAccumulator:
+    """Per-month fixed-bin histograms of cumulative cost for streaming percentiles
+
+    Memory is O(months x bins) however many paths are added. Values outside
+    the edges land in the outermost bins, so the percentiles are accurate to
+    one bin width inside the pilot range.
+    """
+
+    def __init__(self, low, high, bins=HISTOGRAM_BINS):
+        self.low = np.asarray(low, dtype=np.float64)
+        self.width = np.maximum(np.asarray(high, dtype=np.float64) - self.low, 1e-9) / bins
+        self.bins = bins
+        self.counts = np.zeros((len(self.low), bins), dtype=np.int64)
+        self.total = np.zeros(len(self.low))
+        self.paths = 0
+
+    def add(self, values):
+        months = values.shape[1]
+        index = np.clip(((values - self.low) / self.width).astype(np.int64), 0, self.bins - 1)
+        flat = index + np.arange(months) * self.bins
+        self.counts += np.bincount(flat.ravel(), minlength=months * self.bins).reshape(months, self.bins)
+        self.total += values.sum(axis=0)
+        self.paths += len(values)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total += other.total
+        self.paths += other.paths
+
+    def mean(self):
+        return self.total / max(self.paths, 1)
+
+    def percentiles(self, percentiles):
+        cumulative = np.cumsum(self.counts, axis=1)
+        result = {}
+        for percentile in percentiles:
+            target = percentile / 100 * self.paths
+            bin_index = np.minimum((cumulative < target).sum(axis=1), self.bins - 1)
+            below = np.where(
+                bin_index > 0,
+                np.take_along_axis(cumulative, np.maximum(bin_index - 1, 0)[:, None], axis=1)[:, 0],
+                0
+            )
+            in_bin = np.take_along_axis(self.counts, bin_index[:, None], axis=1)[:, 0]
+            fraction = np.where(in_bin > 0, (target - below) / np.maximum(in_bin, 1), 0.5)
+            result[percentile] = self.low + (bin_index + np.clip(fraction, 0, 1)) * self.width
+        return result
+
+
+def _simulate_chunk(params, low, high, n_paths, seed):
+    accumulator = HistogramAccumulator(low, high)
+    accumulator.add(_simulate_paths(params, n_paths, np.random.default_rng(seed)))
+    return accumulator
+
+
+def simulate_costs(loan_amount, interest_rate, years, fixed_monthly, strom,
+                   renovation_total=0, loan_type=ANNUITY, n_paths=100_000,
+                   chunk_size=10_000, workers=None, seed=0,
+                   percentiles=DEFAULT_PERCENTILES, **model):
+    """Monte Carlo percentile bands of cumulative cost of ownership over the loan term
+
+    fixed_monthly is the sum of the deterministic monthly costs
+    (felleskostnader, kommunale avgifter, forsikring, vedlikehold); strom is
+    the expected monthly electricity cost. Model parameters default to
+    DEFAULT_MODEL. Paths are simulated chunk_size at a time, optionally on a
+    process pool of `workers`, and folded into streaming histograms so
+    memory does not grow with n_paths.
+
+    Returns {"months": array, "mean": array, "percentiles": {p: array}}.
+    Raises ValueError for fewer than one path, a chunk_size below one or a
+    loan term shorter than one month.
+    """
+    months = int(round(years * 12))
+    if months < 1:
+        raise ValueError(f"Nedbetalingstiden må være minst én måned, ikke {years:g} år")
+    if n_paths < 1:
+        raise ValueError(f"Antall simuleringer må være minst 1, ikke {n_paths}")
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size må være minst 1, ikke {chunk_size}")
+    unknown = set(model) - set(DEFAULT_MODEL)
+    if unknown:
+        raise ValueError(f"Ukjente modellparametre: {', '.join(sorted(unknown))}")
+    params = {
+        "loan_amount": float(loan_amount),
+        "interest_rate": float(interest_rate),
+        "months": months,
+        "fixed_monthly": float(fixed_monthly),
+        "strom": float(strom),
+        "renovation_total": float(renovation_total),
+        "loan_type": loan_type,
+        "model": {**DEFAULT_MODEL, **model},
+    }
+
+    # A small pilot run fixes the histogram range for every chunk
+    seeds = np.random.SeedSequence(seed).spawn(1 + -(-n_paths // chunk_size))
+    pilot = _simulate_paths(params, min(PILOT_PATHS, n_paths), np.random.default_rng(seeds[0]))
+    spread = pilot.max(axis=0) - pilot.min(axis=0)
+    low = np.maximum(pilot.min(axis=0) - spread, 0)
+    high = pilot.max(axis=0) + spread
+
+    sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    accumulator = HistogramAccumulator(low, high)
+    if workers and workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_simulate_chunk, params, low, high, size, chunk_seed)
+                for size, chunk_seed in zip(sizes, seeds[1:])
+            ]
+            for future in futures:
+                accumulator.merge(future.result())
+    else:
+        for size, chunk_seed in zip(sizes, seeds[1:]):
+            accumulator.add(_simulate_paths(params, size, np.random.default_rng(chunk_seed)))
+
+    return {
+        "months": np.arange(1, params["months"] + 1),
+        "mean": accumulator.mean(),
+        "percentiles": accumulator.percentiles(percentiles),
+    }
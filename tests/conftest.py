@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep the listing cache in memory, so tests never read or write .cache/
+os.environ["BOLIGBUDSJETT_CACHE"] = ""
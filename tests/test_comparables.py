@@ -0,0 +1,121 @@
+"""ComparablesIndex.query against a brute-force search over synthetic listings"""
+import numpy as np
+import pytest
+
+from comparables import EARTH_RADIUS_KM, ComparablesIndex, synthetic_listings
+
+LISTINGS = synthetic_listings(20000, seed=7)
+
+
+def brute_force(latitude, longitude, radius_km, property_type=None, area=None, area_tolerance=0.2):
+    """finnkode -> haversine distance for every listing matching the query"""
+    lat = np.radians(LISTINGS["latitude"].to_numpy())
+    lon = np.radians(LISTINGS["longitude"].to_numpy())
+    lat0, lon0 = np.radians(latitude), np.radians(longitude)
+    h = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * np.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+    distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h))
+    mask = distance <= radius_km
+    if property_type:
+        mask &= LISTINGS["property_type"].to_numpy() == property_type
+    if area:
+        mask &= np.abs(LISTINGS["area"].to_numpy() - area) <= area_tolerance * area
+    return dict(zip(LISTINGS["finnkode"][mask], distance[mask]))
+
+
+def on_cell_boundary(latitude, cell_km):
+    """Latitude whose z coordinate lies exactly on a cell face of the index grid"""
+    z = np.round(EARTH_RADIUS_KM * np.sin(np.radians(latitude)) / cell_km) * cell_km
+    return float(np.degrees(np.arcsin(z / EARTH_RADIUS_KM)))
+
+
+def assert_matches(index, latitude, longitude, radius_km, **filters):
+    expected = brute_force(latitude, longitude, radius_km, **filters)
+    comparables, stats = index.query(latitude, longitude, k=len(LISTINGS), radius_km=radius_km, **filters)
+
+    # Listings a rounding error away from the radius may land on either side
+    found = dict(zip(comparables["finnkode"], comparables["distance_km"]))
+    edge = {code for code, d in {**expected, **found}.items() if abs(d - radius_km) < 1e-9}
+    assert set(found) - edge == set(expected) - edge
+    assert stats["count"] == len(found)
+    for code in set(found) & set(expected):
+        assert found[code] == pytest.approx(expected[code], abs=1e-6)
+    assert comparables["distance_km"].is_monotonic_increasing
+    return comparables, stats
+
+
+@pytest.mark.parametrize("cell_km", [0.5, 2.0, 5.0])
+@pytest.mark.parametrize("radius_km", [0.3, 2.0, 7.5])
+def test_query_matches_brute_force(cell_km, radius_km):
+    index = ComparablesIndex(LISTINGS, cell_km=cell_km)
+    rng = np.random.default_rng(int(cell_km * 10 + radius_km * 100))
+    for row in rng.choice(len(LISTINGS), 5, replace=False):
+        assert_matches(index, LISTINGS["latitude"][row] + rng.normal(0, 0.01),
+                       LISTINGS["longitude"][row] + rng.normal(0, 0.01), radius_km)
+
+
+@pytest.mark.parametrize("cell_km", [0.5, 2.0])
+def test_query_centred_on_a_cell_boundary(cell_km):
+    index = ComparablesIndex(LISTINGS, cell_km=cell_km)
+    latitude = on_cell_boundary(59.91, cell_km)
+    for radius_km in (cell_km / 2, cell_km, cell_km * 1.5):
+        comparables, _ = assert_matches(index, latitude, 10.75, radius_km)
+        assert len(comparables)
+
+
+def test_radius_through_a_listing_includes_it():
+    index = ComparablesIndex(LISTINGS)
+    first, second = LISTINGS.iloc[0], LISTINGS.iloc[1]
+    exact = brute_force(first["latitude"], first["longitude"], np.inf)[second["finnkode"]]
+    comparables, _ = index.query(first["latitude"], first["longitude"], k=len(LISTINGS),
+                                 radius_km=exact + 1e-9)
+    assert second["finnkode"] in set(comparables["finnkode"])
+
+
+def test_filters_match_brute_force():
+    index = ComparablesIndex(LISTINGS)
+    assert_matches(index, 59.91, 10.75, 3.0, property_type="Leilighet", area=65)
+    assert_matches(index, 60.39, 5.32, 3.0, property_type="Enebolig")
+    assert_matches(index, 63.43, 10.40, 3.0, area=110, area_tolerance=0.1)
+
+
+def test_k_nearest_are_the_closest():
+    index = ComparablesIndex(LISTINGS)
+    expected = brute_force(59.91, 10.75, 2.0)
+    comparables, stats = index.query(59.91, 10.75, k=10, radius_km=2.0)
+
+    assert stats["count"] == len(expected)
+    assert list(comparables["distance_km"]) == pytest.approx(sorted(expected.values())[:10], abs=1e-6)
+
+
+def test_empty_cells_give_no_comparables():
+    index = ComparablesIndex(LISTINGS)
+    # The North Sea, far from every synthetic city
+    comparables, stats = index.query(57.5, 3.0, radius_km=5.0)
+
+    assert comparables.empty
+    assert stats == {"count": 0}
+    assert not brute_force(57.5, 3.0, 5.0)
+
+
+def test_filters_can_empty_a_populated_radius():
+    index = ComparablesIndex(LISTINGS)
+    comparables, stats = index.query(59.91, 10.75, property_type="Hytte", radius_km=5.0)
+
+    assert comparables.empty
+    assert stats["count"] == 0
+
+
+def test_the_subject_listing_can_be_excluded():
+    index = ComparablesIndex(LISTINGS)
+    subject = LISTINGS.iloc[0]
+    query = dict(property_type=subject["property_type"], area=subject["area"], k=len(LISTINGS))
+
+    comparables, stats = index.query(subject["latitude"], subject["longitude"], **query)
+    assert comparables["finnkode"][0] == subject["finnkode"]
+    assert comparables["distance_km"][0] == pytest.approx(0, abs=1e-6)
+
+    without, without_stats = index.query(subject["latitude"], subject["longitude"],
+                                         exclude_finnkode=int(subject["finnkode"]), **query)
+    assert subject["finnkode"] not in set(without["finnkode"])
+    assert without_stats["count"] == stats["count"] - 1
+    assert list(without["finnkode"]) == list(comparables["finnkode"][1:])
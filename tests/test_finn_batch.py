@@ -0,0 +1,192 @@
+"""finn_batch against a local HTTP stand-in for Finn.no"""
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import finn_batch
+from finn import LISTING_CACHE, create_session
+from finn_batch import HostRateLimiter, fetch_listings, fetch_with_retry
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "benchmarks", "fixtures", "listings", "leilighet_oslo.html")
+
+
+class StandIn:
+    """Serves the fixture listing for every path; failures[path] scripts its first responses"""
+
+    def __init__(self):
+        with open(FIXTURE, "rb") as f:
+            self.body = f.read()
+        self.lock = threading.Lock()
+        self.requests = []  # (path, time.monotonic())
+        self.failures = {}  # path -> [(status, headers)]
+        self.delay = 0.0
+        self.etag = None  # sent with every page; a matching If-None-Match gets a 304
+        self.not_modified = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.url = None
+
+    def listing(self, finnkode):
+        return f"{self.url}/realestate/homes/ad.html?finnkode={finnkode}"
+
+
+@pytest.fixture
+def finn():
+    stand_in = StandIn()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with stand_in.lock:
+                stand_in.requests.append((self.path, time.monotonic()))
+                scripted = stand_in.failures.get(self.path)
+                failure = scripted.pop(0) if scripted else None
+                stand_in.in_flight += 1
+                stand_in.max_in_flight = max(stand_in.max_in_flight, stand_in.in_flight)
+            try:
+                time.sleep(stand_in.delay)
+                status, headers = failure or (200, {"Content-Type": "text/html; charset=utf-8"})
+                body = b"" if failure else stand_in.body
+                if not failure and stand_in.etag:
+                    headers = {**headers, "ETag": stand_in.etag}
+                    if self.headers.get("If-None-Match") == stand_in.etag:
+                        status, body = 304, b""
+                        with stand_in.lock:
+                            stand_in.not_modified += 1
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if status != 304:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with stand_in.lock:
+                    stand_in.in_flight -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stand_in.url = f"http://127.0.0.1:{server.server_port}"
+    yield stand_in
+    server.shutdown()
+    server.server_close()
+
+
+def test_rate_limit_spaces_requests_to_a_host(finn):
+    urls = [finn.listing(100000 + i) for i in range(6)]
+    results = list(fetch_listings(urls, workers=4, rate=10, use_cache=False))
+
+    assert all(success for _, _, success, _ in results)
+    times = sorted(at for _, at in finn.requests)
+    assert len(times) == 6
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.09
+
+
+def test_retry_after_holds_back_the_retry(finn):
+    url = finn.listing(200000)
+    path = url[len(finn.url):]
+    finn.failures[path] = [(429, {"Retry-After": "1"})]
+
+    html, _ = fetch_with_retry(url, create_session(), HostRateLimiter(0), backoff=0.01)
+
+    assert "Storgata 12A" in html
+    (_, first), (_, second) = finn.requests
+    assert second - first >= 0.95
+
+
+def test_server_errors_are_retried_with_backoff(finn):
+    url = finn.listing(300000)
+    finn.failures[url[len(finn.url):]] = [(503, {}), (503, {})]
+
+    fetch_with_retry(url, create_session(), HostRateLimiter(0), backoff=0.05)
+
+    assert len(finn.requests) == 3
+
+
+def test_client_errors_are_not_retried(finn):
+    url = finn.listing(400000)
+    finn.failures[url[len(finn.url):]] = [(404, {})]
+
+    with pytest.raises(requests.HTTPError):
+        fetch_with_retry(url, create_session(), HostRateLimiter(0), backoff=5)
+    assert len(finn.requests) == 1
+
+
+@pytest.mark.parametrize("url", ["finnkode-uten-skjema", "ftp://www.finn.no/ad.html", "http://"])
+def test_invalid_urls_fail_fast(url):
+    start = time.monotonic()
+    with pytest.raises(requests.RequestException) as raised:
+        fetch_with_retry(url, create_session(), HostRateLimiter(0), backoff=5)
+    assert not isinstance(raised.value, (requests.ConnectionError, requests.Timeout))
+    assert time.monotonic() - start < 1
+
+
+def test_in_flight_fetches_are_bounded(finn):
+    finn.delay = 0.05
+    workers = 2
+    consumed = 0
+
+    def urls():
+        nonlocal consumed
+        for i in range(20):
+            consumed += 1
+            yield finn.listing(500000 + i)
+
+    received = 0
+    for _, _, success, _ in fetch_listings(urls(), workers=workers, rate=0, use_cache=False):
+        assert success
+        assert consumed - received <= workers * 2
+        received += 1
+
+    assert received == 20
+    assert finn.max_in_flight <= workers
+
+
+def test_session_is_closed_when_the_consumer_stops(finn, monkeypatch):
+    sessions = []
+
+    def tracked_session(pool_size):
+        session = create_session(pool_size)
+        close = session.close
+        session.closed = False
+
+        def mark_closed():
+            session.closed = True
+            close()
+        session.close = mark_closed
+        sessions.append(session)
+        return session
+
+    monkeypatch.setattr(finn_batch, "create_session", tracked_session)
+    results = fetch_listings([finn.listing(600000 + i) for i in range(10)], workers=2, rate=0, use_cache=False)
+    next(results)
+    results.close()
+
+    assert sessions and sessions[0].closed
+
+
+def test_batch_keeps_validators_and_revalidates(finn):
+    finn.etag = '"v1"'
+    url = finn.listing(700000)
+
+    [(_, data, success, _)] = fetch_listings([url], rate=0)
+    assert success
+    entry = LISTING_CACHE.lookup("700000")
+    assert entry["validators"]["etag"] == '"v1"'
+    assert entry["validators"]["content_hash"]
+
+    # Once expired, the entry is revalidated instead of downloaded again
+    LISTING_CACHE.put("700000", entry["data"], ttl=-1, validators=entry["validators"])
+    [(_, again, success, message)] = fetch_listings([url], rate=0)
+
+    assert success and again == data
+    assert finn.not_modified == 1
+    assert message == "Data uendret siden forrige henting"
+    assert LISTING_CACHE.lookup("700000")["validators"]["etag"] == '"v1"'
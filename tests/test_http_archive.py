@@ -0,0 +1,142 @@
+"""Recording and replaying listing downloads through http_archive"""
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+import http_archive
+from http_archive import REPLAY, HttpArchive, RecordingAdapter, ReplayAdapter, mount_adapters
+
+PAGES = {
+    "111111111": b"<html>Storgata 12A</html>",
+    "222222222": b"<html>Storgata 12A</html>",  # same page body as 111111111
+    "333333333": b"<html>Bryggen 2</html>",
+}
+
+
+def listing_url(finnkode):
+    return f"https://www.finn.no/realestate/homes/ad.html?finnkode={finnkode}"
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    """Stub for the network below RecordingAdapter: serves PAGES and counts the requests"""
+    sent = []
+
+    def send(adapter, request, **kwargs):
+        sent.append(request.url)
+        finnkode = request.url.rsplit("=", 1)[-1]
+        response = requests.Response()
+        response.status_code = 200 if finnkode in PAGES else 404
+        response._content = PAGES.get(finnkode, b"")
+        response.headers = requests.structures.CaseInsensitiveDict({
+            "Content-Type": "text/html; charset=utf-8",
+            "ETag": f'"{finnkode}"',
+            "Set-Cookie": "session=1",
+        })
+        response.url = request.url
+        response.request = request
+        return response
+
+    monkeypatch.setattr(HTTPAdapter, "send", send)
+    return sent
+
+
+def session_with(adapter):
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def record(path, finnkodes):
+    archive = HttpArchive(str(path))
+    session = session_with(RecordingAdapter(archive))
+    for finnkode in finnkodes:
+        session.get(listing_url(finnkode))
+    archive.close()
+
+
+def test_recorded_pages_replay_with_and_without_if_none_match(tmp_path, transport):
+    record(tmp_path, PAGES)
+    archive = HttpArchive(str(tmp_path))
+    session = session_with(ReplayAdapter(archive))
+
+    for finnkode, body in PAGES.items():
+        response = session.get(listing_url(finnkode))
+        assert response.status_code == 200
+        assert response.content == body
+        assert response.headers["ETag"] == f'"{finnkode}"'
+        assert "Set-Cookie" not in response.headers
+        assert response.text == body.decode()
+
+        unchanged = session.get(listing_url(finnkode), headers={"If-None-Match": f'"{finnkode}"'})
+        assert (unchanged.status_code, unchanged.content) == (304, b"")
+        changed = session.get(listing_url(finnkode), headers={"If-None-Match": '"eldre"'})
+        assert (changed.status_code, changed.content) == (200, body)
+
+    # Every URL form of a listing replays the same page
+    assert session.get("https://www.finn.no/333333333").content == PAGES["333333333"]
+    assert len(transport) == len(PAGES)
+
+
+def test_unrecorded_urls_fail_like_a_connection_error(tmp_path, transport):
+    record(tmp_path, ["111111111"])
+    session = session_with(ReplayAdapter(HttpArchive(str(tmp_path))))
+
+    with pytest.raises(requests.ConnectionError):
+        session.get(listing_url("999999999"))
+    assert transport == [listing_url("111111111")]
+
+
+def test_identical_bodies_are_stored_once(tmp_path, transport):
+    record(tmp_path, PAGES)
+    archive = HttpArchive(str(tmp_path))
+
+    assert archive.stats()["responses"] == 3
+    assert archive.stats()["bodies"] == 2
+    assert archive.get("111111111")[2] == archive.get("222222222")[2]
+    assert not archive.put(listing_url("444444444"), 200, {}, PAGES["333333333"])
+    assert archive.stats()["pack_bytes"] == (tmp_path / http_archive.PACK_FILE).stat().st_size
+
+
+def test_pages_recorded_after_a_read_are_remapped(tmp_path):
+    archive = HttpArchive(str(tmp_path))
+    archive.put(listing_url("111111111"), 200, {"ETag": '"v1"'}, b"<html>v1</html>")
+    assert archive.get("111111111")[2] == b"<html>v1</html>"
+
+    # The pack grows past the current mapping; the latest response for a key wins
+    body = b"<html>" + b"v2" * 10_000 + b"</html>"
+    archive.put(listing_url("111111111"), 200, {"ETag": '"v2"'}, body)
+    archive.put(listing_url("555555555"), 404, {}, b"")
+    assert archive.get("111111111") == (200, {"ETag": '"v2"'}, body)
+    assert archive.get("555555555") == (404, {}, b"")
+    archive.close()
+
+    reopened = HttpArchive(str(tmp_path))
+    assert reopened.get("111111111") == (200, {"ETag": '"v2"'}, body)
+    assert len(reopened) == 2
+
+
+def test_recording_skips_not_modified_responses(tmp_path, monkeypatch):
+    def not_modified(adapter, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 304
+        response._content = b""
+        response.request = request
+        return response
+
+    monkeypatch.setattr(HTTPAdapter, "send", not_modified)
+    archive = HttpArchive(str(tmp_path))
+    session_with(RecordingAdapter(archive)).get(listing_url("111111111"))
+    assert len(archive) == 0
+
+
+def test_mount_adapters_modes(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_archive, "_ARCHIVE", HttpArchive(str(tmp_path)))
+
+    replaying = mount_adapters(requests.Session(), 1, mode=REPLAY)
+    assert isinstance(replaying.get_adapter(listing_url("1")), ReplayAdapter)
+    assert not replaying.trust_env
+    assert type(mount_adapters(requests.Session(), 1, mode="").get_adapter(listing_url("1"))) is HTTPAdapter
+    with pytest.raises(ValueError):
+        mount_adapters(requests.Session(), 1, mode="opptak")
@@ -0,0 +1,40 @@
+"""ListingCache disk bound and the row count kept alongside it"""
+from listing_cache import ListingCache
+
+
+def disk_rows(cache):
+    return cache._db.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+
+def test_disk_tier_keeps_the_most_recent_entries(tmp_path):
+    cache = ListingCache(str(tmp_path / "listings.sqlite"), max_memory_entries=1, max_disk_entries=3)
+    for finnkode in range(5):
+        cache.put(str(finnkode), {"price": finnkode})
+
+    assert disk_rows(cache) == cache.stats()["disk_entries"] == 3
+    assert cache.stats()["evictions"] == 4 + 2  # memory tier and disk tier
+    assert cache.get("0") is None
+    assert cache.get("2") == {"price": 2}
+
+
+def test_row_count_follows_replacements_and_removals(tmp_path):
+    path = str(tmp_path / "listings.sqlite")
+    cache = ListingCache(path, max_disk_entries=3)
+    cache.put("1", {"price": 1})
+    cache.put("1", {"price": 2})
+    cache.put("2", {"price": 3})
+    cache.invalidate("2")
+    cache.invalidate("9")
+    assert disk_rows(cache) == cache.stats()["disk_entries"] == 1
+
+    # Rewriting a stored key must not push others out
+    cache.put("2", {"price": 4})
+    cache.put("3", {"price": 5})
+    cache.put("1", {"price": 6})
+    assert disk_rows(cache) == cache.stats()["disk_entries"] == 3
+    assert cache.stats()["evictions"] == 0
+
+    assert ListingCache(path).stats()["disk_entries"] == 3
+    cache.clear()
+    cache.put("4", {"price": 7})
+    assert disk_rows(cache) == cache.stats()["disk_entries"] == 1
@@ -0,0 +1,64 @@
+"""ListingStore writes, deduplication and compaction"""
+from datetime import datetime, timedelta, timezone
+
+import listing_store
+from listing_store import ListingStore
+
+START = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+def listing(finnkode, price, **fields):
+    return {"finnkode": finnkode, "price": price, "size": 65, "address": "Storgata 12A, 0184 Oslo", **fields}
+
+
+def test_unchanged_listings_are_skipped(tmp_path):
+    store = ListingStore(tmp_path)
+
+    assert store.append([listing("1", 4000000), listing("2", 5000000)], START) == 2
+    assert store.append([listing("1", 4000000), listing("2", 5000000)], START + timedelta(hours=1)) == 0
+    assert store.append([listing("1", 3900000), listing("2", 5000000)], START + timedelta(hours=2)) == 1
+    assert len(store) == 3
+
+    # A new instance rebuilds the index from the files on disk
+    again = ListingStore(tmp_path)
+    assert again.append([listing("1", 3900000), listing("2", 5000000.0)], START + timedelta(hours=3)) == 0
+    assert again.append([listing("1", 4000000)], START + timedelta(hours=4)) == 1
+
+
+def test_latest_streams_to_the_newest_row(tmp_path, monkeypatch):
+    monkeypatch.setattr(listing_store, "LATEST_REDUCE_ROWS", 2)
+    store = ListingStore(tmp_path)
+    for hour in range(6):
+        store.append([listing(str(code), 4000000 + hour * 1000 + code) for code in range(3)],
+                     START + timedelta(hours=hour))
+
+    latest = store.latest(["price"])
+    assert sorted(latest["finnkode"]) == ["0", "1", "2"]
+    assert set(latest["price"]) == {4005000, 4005001, 4005002}
+    assert latest["fetched_at"].is_monotonic_increasing
+    assert store.latest(filter=listing_store.ds.field("finnkode") == "9").empty
+    assert list(store.price_history("1")["price"]) == [4000000 + hour * 1000 + 1 for hour in range(6)]
+
+
+def test_partitions_are_compacted_as_files_collect(tmp_path, monkeypatch):
+    monkeypatch.setattr(listing_store, "COMPACT_FILES", 4)
+    store = ListingStore(tmp_path)
+    for price in range(10):
+        store.append([listing("1", 4000000 + price)], START + timedelta(minutes=price))
+
+    assert len(store.files()) < 4
+    assert len(store) == 10
+    assert store.append([listing("1", 4000009)], START + timedelta(hours=1)) == 0
+    assert list(store.latest()["price"]) == [4000009]
+
+
+def test_snapshotted_files_survive_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(listing_store, "COMPACT_FILES", 2)
+    store = ListingStore(tmp_path)
+    store.append([listing("1", 4000000)], START)
+    store.snapshot("før")
+    for price in range(1, 4):
+        store.append([listing("1", 4000000 + price)], START + timedelta(minutes=price))
+
+    assert store.latest(snapshot="før")["price"].tolist() == [4000000]
+    assert store.latest()["price"].tolist() == [4000003]
@@ -0,0 +1,115 @@
+"""MarketIndex windowing, persistence and caching"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import market_index
+from market_index import MarketIndex
+
+
+def listings(n, month="2026-10-15", seed=0, prefix="a"):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "finnkode": [f"{prefix}{i}" for i in range(n)],
+        "address": rng.choice(["Storgata 1, 0184 Oslo", "Bryggen 2, 5003 Bergen"], n),
+        "property_type": rng.choice(["Leilighet", "Enebolig"], n),
+        "year_built": rng.integers(1900, 2025, n),
+        "price": rng.integers(3_000_000, 9_000_000, n),
+        "size": rng.integers(40, 160, n),
+        "fetched_at": pd.Timestamp(month, tz="UTC"),
+    })
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = MarketIndex()
+    index.add(listings(500))
+    path = str(tmp_path / "index.npz")
+    assert index.save(path)
+    assert not index.save(path, if_changed=True)
+
+    loaded = MarketIndex.load(path)
+    assert loaded.watermark == index.watermark
+    for args in (("Oslo", "Leilighet", 1936), ("Bergen", None, None), ("Tromsø", "Enebolig", 2001)):
+        assert loaded.lookup(*args, at="2026-10-31") == index.lookup(*args, at="2026-10-31")
+
+    # Replacing a listing after loading removes its earlier observation
+    moved = listings(1).assign(address="Torget 1, 9008 Tromsø")
+    loaded.add(moved)
+    assert loaded.lookup("Oslo", min_count=1, at="2026-10-31")["count"] + \
+        loaded.lookup("Bergen", min_count=1, at="2026-10-31")["count"] == 499
+
+
+def test_unreadable_files_start_empty(tmp_path):
+    path = tmp_path / "index.npz"
+    path.write_bytes(b"\x80\x04 not an index")
+    assert MarketIndex.load(str(path)).lookup("Oslo", min_count=1) is None
+    assert MarketIndex.load(str(tmp_path / "missing.npz")).lookup("Oslo", min_count=1) is None
+
+
+def test_months_and_listings_outside_the_window_are_dropped():
+    index = MarketIndex(window_months=3)
+    index.add(listings(100, month="2026-01-10", prefix="old"))
+    index.add(listings(100, month="2026-06-10", prefix="new"))
+
+    assert all(month > index.newest_month - 3 for months in index._months.values() for month in months)
+    assert all(finnkode.startswith("new") for finnkode in index._contributions)
+    assert index.add(listings(10, month="2026-02-10", prefix="late")) == 0
+    assert index.lookup(market_index.ANY, "Leilighet", min_count=1, at="2026-06-30")["count"] <= 100
+
+
+def test_summary_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(market_index, "SUMMARY_CACHE_SIZE", 8)
+    index = MarketIndex()
+    index.add(listings(200))
+    for months in range(30):
+        index.lookup("Oslo", at=pd.Timestamp("2024-01-01") + pd.DateOffset(months=months))
+
+    assert len(index._summaries) <= 8
+
+
+def observed(index):
+    """Observations in the index, counted once each through the municipality-wide markets"""
+    return sum(int(counts.sum()) for (municipality, property_type, years), months in index._months.items()
+               if municipality != market_index.ANY and property_type == years == market_index.ANY
+               for counts in months.values())
+
+
+def test_store_rows_older_than_a_direct_add_are_still_folded_in(tmp_path):
+    from listing_store import ListingStore
+
+    store = ListingStore(tmp_path / "store")
+    index = MarketIndex()
+    app_fetch = listings(2, month="2026-10-15", prefix="app")
+    batch_fetch = listings(3, month="2026-10-10", prefix="batch")
+
+    # The app stores and adds its fetch directly; a batch run stores older rows afterwards
+    store.append(app_fetch.to_dict("records"))
+    assert index.add(app_fetch) == 2
+    store.append(batch_fetch.to_dict("records"))
+
+    assert index.update_from_store(store) == 3
+    assert index.update_from_store(store) == 0
+    assert observed(index) == 5
+
+    # A compacted store is read again without counting anything twice
+    store.compact()
+    assert index.update_from_store(store) == 0
+    assert observed(index) == 5
+
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    loaded = MarketIndex.load(path)
+    assert loaded.update_from_store(store) == 0
+    assert observed(loaded) == 5
+
+
+def test_older_observations_do_not_replace_newer_ones():
+    index = MarketIndex()
+    newer = listings(1, month="2026-10-15").assign(address="Storgata 1, 0184 Oslo", price=6_000_000, size=60)
+    older = newer.assign(price=3_000_000, fetched_at=pd.Timestamp("2026-09-15", tz="UTC"))
+
+    assert index.add(newer) == 1
+    assert index.add(older) == 0
+    assert index.add(newer) == 0
+    assert observed(index) == 1
+    assert index.lookup("Oslo", min_count=1, at="2026-10-31")[0.5] == pytest.approx(100000, rel=0.01)
@@ -0,0 +1,56 @@
+"""Report contents of reports.listing_report and reports.portfolio_report"""
+import io
+import json
+
+import pandas as pd
+
+from portfolio import compact_frame
+from renovation import load_plan
+from reports import listing_report, portfolio_report, table_chunks, write_report
+
+LISTING = {"total_price": 4000000, "price": None, "bra_internal": 60, "size": None, "bra_total": None,
+           "address": "Storgata 12A, 0184 Oslo", "property_type": "Leilighet"}
+
+
+def summary(**kwargs):
+    title, _, rows = next(listing_report(LISTING, {}, **kwargs))
+    assert title == "Sammendrag"
+    return dict(rows)
+
+
+def test_listing_report_uses_the_running_costs():
+    default = summary()
+    custom = summary(felleskostnader=5000, strom=0)
+
+    assert custom["Månedlige driftskostnader"] - default["Månedlige driftskostnader"] == 1000
+    assert custom["Totale månedlige kostnader"] - default["Totale månedlige kostnader"] == 1000
+
+
+def test_portfolio_report_skips_items_missing_from_the_catalog():
+    table = compact_frame(pd.DataFrame({
+        "finnkode": ["1", "2"],
+        "address": ["Storgata 1, 0184 Oslo", "Bryggen 2, 5003 Bergen"],
+        "price": [4000000, 5000000],
+        "area": [60, 80],
+        "url": None,
+        "property_type": None,
+        "year_built": None,
+    }))
+    output = io.BytesIO()
+    write_report(portfolio_report(table_chunks(table), {"Nytt bad": ("Standard", 10), "Boblebad": ("Standard", 1)}),
+                 "csv", output)
+
+    report = output.getvalue().decode("utf-8-sig")
+    assert "Nytt bad" in report
+    assert "Boblebad" not in report
+
+
+def test_plan_files_are_read_in_both_cli_forms(tmp_path):
+    objects, pairs = tmp_path / "objects.json", tmp_path / "pairs.json"
+    objects.write_text(json.dumps({"Nytt bad": {"quality": "Standard", "amount": 10},
+                                   "Maling av vegger": {"quality": "Budget"}, "Nye dører": {}}))
+    pairs.write_text(json.dumps({"Nytt bad": ["Standard", 10], "Maling av vegger": ["Budget"],
+                                 "Nye dører": ["Standard", 1]}))
+
+    expected = {"Nytt bad": ("Standard", 10), "Maling av vegger": ("Budget", 100), "Nye dører": ("Standard", 1)}
+    assert load_plan(objects) == load_plan(pairs) == expected
@@ -0,0 +1,20 @@
+"""Input validation of simulation.simulate_costs"""
+import pytest
+
+from simulation import simulate_costs
+
+
+@pytest.mark.parametrize("arguments", [
+    {"years": 0},
+    {"years": 1 / 30},
+    {"n_paths": 0},
+    {"chunk_size": 0},
+])
+def test_invalid_inputs_raise_value_error(arguments):
+    with pytest.raises(ValueError):
+        simulate_costs(3_000_000, 4.5, fixed_monthly=5000, strom=1000, **{"years": 25, "n_paths": 100, **arguments})
+
+
+def test_a_one_month_loan_is_simulated():
+    result = simulate_costs(3_000_000, 4.5, 1 / 12, 5000, 1000, n_paths=100)
+    assert len(result["months"]) == len(result["mean"]) == 1
@@ -0,0 +1,246 @@
+"""Watchlist scheduling and change events with an injected fetch and clock"""
+import pytest
+import requests
+
+import watchlist
+from watchlist import (
+    ACTIVE,
+    CHANGE,
+    DEFAULT_INTERVAL,
+    MAX_INTERVAL,
+    MAX_RETRY_DELAY,
+    MIN_INTERVAL,
+    PRICE_DROP,
+    REMOVED,
+    Watchlist,
+    refresh_listing,
+)
+
+FINNKODE = "123456789"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Finn:
+    """fetch() stand-in serving whatever version of each listing the test sets"""
+
+    def __init__(self):
+        self.listings = {}  # finnkode -> (property_data, status) or an exception to raise
+
+    def set(self, price, total_price=None, shared_debt=0, status=ACTIVE, finnkode=FINNKODE):
+        data = {"price": price, "total_price": total_price or price, "shared_debt": shared_debt,
+                "address": "Storgata 12A, 0184 Oslo"}
+        self.listings[finnkode] = (None if status == REMOVED else data, status)
+
+    def fail(self, error, finnkode=FINNKODE):
+        self.listings[finnkode] = error
+
+    def __call__(self, url, session):
+        result = self.listings[url.rsplit("=", 1)[-1]]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@pytest.fixture
+def finn():
+    return Finn()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def make_watchlist(tmp_path, finn, clock):
+    def make(**kwargs):
+        return Watchlist(str(tmp_path / "watchlist.sqlite"), fetch=finn, rate=0, clock=clock, **kwargs)
+    return make
+
+
+def watched(wl, finnkode=FINNKODE):
+    [watch] = [watch for watch in wl.watches() if watch.finnkode == finnkode]
+    return watch
+
+
+def test_interval_halves_on_change_and_grows_without_one(make_watchlist, finn):
+    wl = make_watchlist()
+    wl.add([FINNKODE])
+    watch = watched(wl)
+    finn.set(4_000_000)
+
+    assert wl.refresh(watch) is None  # the first refresh only records the listing
+    assert watch.interval == DEFAULT_INTERVAL * 1.5
+    wl.refresh(watch)
+    assert watch.interval == DEFAULT_INTERVAL * 1.5 ** 2
+
+    finn.set(4_100_000)
+    assert wl.refresh(watch)["kind"] == CHANGE
+    assert watch.interval == DEFAULT_INTERVAL * 1.5 ** 2 / 2
+
+    for price in range(10):
+        finn.set(4_200_000 + price)
+        wl.refresh(watch)
+    assert watch.interval == MIN_INTERVAL
+
+    for _ in range(20):
+        wl.refresh(watch)
+    assert watch.interval == MAX_INTERVAL
+
+
+def test_due_time_follows_the_interval_with_jitter(make_watchlist, finn, clock):
+    wl = make_watchlist()
+    wl.add([FINNKODE])
+    watch = watched(wl)
+    finn.set(4_000_000)
+
+    wl.refresh(watch)
+    assert clock.now + 0.9 * watch.interval <= watch.due_at <= clock.now + watch.interval
+
+
+def test_due_listings_are_popped_once_and_in_order(make_watchlist, finn, clock):
+    wl = make_watchlist()
+    codes = [str(100000000 + i) for i in range(5)]
+    wl.add(codes)
+    for code in codes:
+        finn.set(4_000_000, finnkode=code)
+
+    assert wl.refresh_due() == []
+    assert all(watch.checked_at is None for watch in wl.watches())
+
+    clock.now += MIN_INTERVAL
+    with wl._lock:
+        first, _ = wl._pop_due(clock.now)
+        second, _ = wl._pop_due(clock.now)
+    assert first.due_at <= second.due_at and first is not second
+    wl.refresh(first)
+    wl.refresh(second)
+
+    assert wl.refresh_due() == []
+    assert all(watch.checked_at == clock.now for watch in wl.watches())
+    with wl._lock:
+        watch, wait = wl._pop_due(clock.now)
+    assert watch is None and 0 < wait <= DEFAULT_INTERVAL * 1.5
+
+
+@pytest.mark.parametrize("status_code", [404, 410])
+def test_gone_listings_are_reported_as_removed(monkeypatch, status_code):
+    response = requests.Response()
+    response.status_code = status_code
+
+    def gone(url, validators, session):
+        raise requests.HTTPError(response=response)
+
+    monkeypatch.setattr(watchlist, "download_listing_conditional", gone)
+    assert refresh_listing(f"https://www.finn.no/realestate/homes/ad.html?finnkode={FINNKODE}") == (None, REMOVED)
+
+
+def test_removed_listing_yields_a_single_event(make_watchlist, finn):
+    wl = make_watchlist()
+    wl.add([FINNKODE])
+    watch = watched(wl)
+    finn.set(4_000_000)
+    wl.refresh(watch)
+
+    finn.set(None, status=REMOVED)
+    event = wl.refresh(watch)
+    assert event["kind"] == CHANGE
+    assert event["changes"] == {"status": [ACTIVE, REMOVED]}
+    assert watch.status == REMOVED
+    assert watch.data["price"] == 4_000_000  # the last known version is kept
+    assert watch.interval == MAX_INTERVAL
+
+    assert wl.refresh(watch) is None
+    assert wl.events.qsize() == 1
+    assert wl._stats["removed"] == 1
+
+
+def test_price_drop_only_on_a_decrease(make_watchlist, finn):
+    wl = make_watchlist()
+    wl.add([FINNKODE])
+    watch = watched(wl)
+    finn.set(4_000_000)
+    wl.refresh(watch)
+
+    finn.set(4_200_000)
+    assert wl.refresh(watch)["kind"] == CHANGE
+    finn.set(4_200_000, shared_debt=50_000)
+    assert wl.refresh(watch)["kind"] == CHANGE
+    finn.set(3_900_000, shared_debt=50_000)
+    event = wl.refresh(watch)
+    assert event["kind"] == PRICE_DROP
+    assert event["changes"]["price"] == [4_200_000, 3_900_000]
+    finn.set(None, total_price=3_800_000, shared_debt=50_000)
+    assert wl.refresh(watch)["kind"] == PRICE_DROP  # total price fell, price went missing
+    assert wl._stats["price_drops"] == 2
+
+
+def test_failing_sink_does_not_stop_the_refresh(make_watchlist, finn):
+    received = []
+
+    def broken(event):
+        raise RuntimeError("webhook nede")
+
+    wl = make_watchlist(sinks=[broken, received.append])
+    wl.add([FINNKODE])
+    watch = watched(wl)
+    finn.set(4_000_000)
+    wl.refresh(watch)
+
+    finn.set(3_500_000)
+    event = wl.refresh(watch)
+    assert received == [event]
+    assert wl.events.get_nowait() == event
+    assert watch.checked_at is not None and watch.failures == 0
+
+
+def test_failed_fetches_back_off_and_keep_the_interval(make_watchlist, finn, clock):
+    wl = make_watchlist()
+    wl.add([FINNKODE])
+    watch = watched(wl)
+    finn.fail(requests.ConnectionError("nede"))
+
+    for failures in range(1, 8):
+        assert wl.refresh(watch) is None
+        assert watch.failures == failures
+        assert watch.interval == DEFAULT_INTERVAL
+        delay = min(60 * 2 ** failures, MAX_RETRY_DELAY)
+        assert clock.now + 0.9 * delay <= watch.due_at <= clock.now + delay
+
+    finn.set(4_000_000)
+    wl.refresh(watch)
+    assert watch.failures == 0
+
+
+def test_full_event_queue_drops_the_oldest(monkeypatch, make_watchlist, finn):
+    monkeypatch.setattr(watchlist, "EVENT_QUEUE_SIZE", 2)
+    wl = make_watchlist()
+    wl.add([FINNKODE])
+    watch = watched(wl)
+    finn.set(4_000_000)
+    wl.refresh(watch)
+
+    for price in (4_100_000, 4_200_000, 4_300_000):
+        finn.set(price)
+        wl.refresh(watch)
+
+    queued = [wl.events.get_nowait()["changes"]["price"][1] for _ in range(wl.events.qsize())]
+    assert queued == [4_200_000, 4_300_000]
+
+
+def test_schedule_survives_a_restart(make_watchlist, finn):
+    wl = make_watchlist()
+    wl.add([FINNKODE])
+    finn.set(4_000_000)
+    wl.refresh(watched(wl))
+    before = watched(wl)
+
+    after = watched(make_watchlist())
+    assert (after.interval, after.due_at, after.data) == (before.interval, before.due_at, before.data)
@@ -0,0 +1,525 @@
+"""Background refresh of a watchlist of Finn.no listings, with change events.
+
+Every watched listing is re-fetched on its own schedule with a conditional
+request (as in finn.get_finn_data), and the result is compared with the
+version stored in the watchlist database. When the price, total price,
+shared debt or status (aktiv/fjernet) has changed, a change event is put on
+the local event queue and handed to the sinks, e.g. a JSON lines file or a
+webhook. An event whose price went down is a price drop alert.
+
+Scheduling is adaptive: a listing that changed is checked twice as often,
+one that did not is checked 1.5 times less often, between MIN_INTERVAL and
+MAX_INTERVAL. All fetches share one per-host request rate and a fixed
+number of workers, and no listing is polled more often than the rate
+allows for the whole watchlist (with REFRESH_HEADROOM to spare), so at the
+default rate of 2 requests per second 5000 listings are all refreshed
+within the hour.
+
+Usage:
+    python watchlist.py add finnkoder.txt
+    python watchlist.py run --events events.jsonl --webhook http://localhost:9000/hook
+    python watchlist.py status
+"""
+import argparse
+import heapq
+import json
+import os
+import queue
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from finn import (
+    LISTING_CACHE,
+    create_session,
+    download_listing_conditional,
+    extract_finnkode,
+    parse_finn_html,
+)
+from finn_batch import RETRY_STATUS_CODES, HostRateLimiter, normalize_listing_url
+from instrumentation import METRICS, logger
+
+DEFAULT_WATCHLIST_PATH = os.environ.get(
+    "BOLIGBUDSJETT_WATCHLIST",
+    os.path.join("data", "watchlist.sqlite")
+)
+WATCH_WORKERS = 4
+WATCH_RATE = 2.0  # requests per second per host, shared by all workers
+MIN_INTERVAL = 15 * 60
+DEFAULT_INTERVAL = 60 * 60
+MAX_INTERVAL = 24 * 60 * 60
+REFRESH_HEADROOM = 0.8  # share of the request rate the schedule may plan for
+MAX_RETRY_DELAY = 60 * 60
+EVENT_QUEUE_SIZE = 10_000
+
+# Listing states
+ACTIVE = "aktiv"
+REMOVED = "fjernet"
+GONE_STATUS_CODES = {404, 410}
+
+# Fields whose changes are reported, in event order
+WATCHED_FIELDS = ("price", "total_price", "shared_debt", "status")
+PRICE_DROP = "price_drop"
+CHANGE = "change"
+
+
+def refresh_listing(url, session=None):
+    """Fetch a watched listing, returning (property_data, status)
+
+    The listing cache's validators make unchanged listings cost a 304. A
+    removed listing (HTTP 404/410) returns (None, REMOVED); other failures
+    raise requests.RequestException.
+    """
+    finnkode = extract_finnkode(url)
+    previous = LISTING_CACHE.lookup(finnkode) if finnkode else None
+    validators = previous['validators'] if previous else {}
+    try:
+        html, new_validators = download_listing_conditional(url, validators, session)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code in GONE_STATUS_CODES:
+            return None, REMOVED
+        raise
+    if html is None or (previous and new_validators['content_hash'] == validators.get('content_hash')):
+        property_data = previous['data']
+    else:
+        property_data = parse_finn_html(html)
+    if finnkode:
+        LISTING_CACHE.put(finnkode, property_data, validators=new_validators)
+    return property_data, ACTIVE
+
+
+def diff_listing(old, new):
+    """Changed watched fields between two {**property_data, "status"} dicts as {field: [old, new]}"""
+    return {
+        field: [old.get(field), new.get(field)]
+        for field in WATCHED_FIELDS
+        if old.get(field) != new.get(field)
+    }
+
+
+def change_event(watch, changes, at):
+    """Change event for a watched listing; kind is PRICE_DROP when its (total) price went down"""
+    dropped = any(
+        old is not None and new is not None and new < old
+        for field, (old, new) in changes.items() if field in ("price", "total_price")
+    )
+    return {
+        "kind": PRICE_DROP if dropped else CHANGE,
+        "finnkode": watch.finnkode,
+        "url": watch.url,
+        "address": (watch.data or {}).get("address"),
+        "changes": changes,
+        "at": at,
+    }
+
+
+class JsonLinesSink:
+    """Appends every event as a JSON line, a local stand-in for a webhook"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """POSTs every event as JSON to a URL"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+        self._session = create_session(pool_size=WATCH_WORKERS)
+
+    def __call__(self, event):
+        self._session.post(self.url, json=event, timeout=self.timeout).raise_for_status()
+
+
+class Watch:
+    """Schedule and last known version of one watched listing"""
+
+    def __init__(self, finnkode, url, data=None, status=None, interval=DEFAULT_INTERVAL,
+                 due_at=0.0, checked_at=None, changed_at=None, failures=0):
+        self.finnkode = finnkode
+        self.url = url
+        self.data = data
+        self.status = status
+        self.interval = interval
+        self.due_at = due_at
+        self.checked_at = checked_at
+        self.changed_at = changed_at
+        self.failures = failures
+
+    def version(self):
+        return {**(self.data or {}), "status": self.status}
+
+
+class Watchlist:
+    """Watched listings in SQLite, refreshed on adaptive schedules by a background thread
+
+    fetch(url, session) returns (property_data, status) like refresh_listing.
+    Events go to the events queue (the oldest are dropped when it is full)
+    and to every sink; a failing sink is logged and does not stop the
+    refresher. store is an optional ListingStore that refreshed listings are
+    appended to, which keeps their price history.
+    """
+
+    def __init__(self, path=DEFAULT_WATCHLIST_PATH, fetch=refresh_listing, workers=WATCH_WORKERS,
+                 rate=WATCH_RATE, sinks=(), store=None, clock=time.time):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS watches (
+                finnkode TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                data TEXT,
+                status TEXT,
+                interval REAL NOT NULL,
+                due_at REAL NOT NULL,
+                checked_at REAL,
+                changed_at REAL,
+                failures INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._db.commit()
+        self._fetch = fetch
+        self.workers = workers
+        self.rate = rate
+        self.sinks = list(sinks)
+        self.store = store
+        self.clock = clock
+        self.events = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self._session = create_session(pool_size=workers)
+        self._limiter = HostRateLimiter(rate)
+        self._lock = threading.Lock()
+        self._watches = {}
+        self._schedule = []  # heap of (due_at, finnkode); stale entries are skipped
+        self._in_flight = set()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(workers)
+        self._stats = {"refreshed": 0, "changed": 0, "price_drops": 0, "removed": 0, "failed": 0}
+        for row in self._db.execute("SELECT * FROM watches"):
+            finnkode, url, data, status, interval, due_at, checked_at, changed_at, failures = row
+            watch = Watch(finnkode, url, json.loads(data) if data else None, status, interval,
+                          due_at, checked_at, changed_at, failures)
+            self._watches[finnkode] = watch
+            heapq.heappush(self._schedule, (due_at, finnkode))
+
+    def __len__(self):
+        return len(self._watches)
+
+    def __contains__(self, finnkode):
+        return finnkode in self._watches
+
+    def min_interval(self):
+        """Shortest interval the request rate allows for every listing on the watchlist"""
+        if not self.rate:
+            return MIN_INTERVAL
+        return max(MIN_INTERVAL, len(self._watches) / (self.rate * REFRESH_HEADROOM))
+
+    def _save(self, watch):
+        self._db.execute(
+            "INSERT OR REPLACE INTO watches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (watch.finnkode, watch.url, json.dumps(watch.data, ensure_ascii=False) if watch.data else None,
+             watch.status, watch.interval, watch.due_at, watch.checked_at, watch.changed_at, watch.failures)
+        )
+
+    def add(self, urls, data=None):
+        """Watch listings by URL or finnkode; returns the number added
+
+        New listings are due at spread-out times over the first minimum
+        interval, so adding thousands at once does not start with a burst.
+        data maps finnkode -> known property_data, the baseline of the first
+        comparison; without it the first refresh only records the listing.
+        """
+        now = self.clock()
+        added = []
+        with self._lock:
+            for url in urls:
+                if not url.strip():
+                    continue
+                url = normalize_listing_url(url)
+                finnkode = extract_finnkode(url)
+                if not finnkode or finnkode in self._watches:
+                    continue
+                known = (data or {}).get(finnkode)
+                watch = Watch(finnkode, url, known, ACTIVE if known else None)
+                self._watches[finnkode] = watch
+                added.append(watch)
+            spread = self.min_interval()
+            for watch in added:
+                watch.due_at = now + random.uniform(0, spread)
+                heapq.heappush(self._schedule, (watch.due_at, watch.finnkode))
+                self._save(watch)
+            self._db.commit()
+        self._wakeup.set()
+        return len(added)
+
+    def remove(self, finnkodes):
+        with self._lock:
+            for finnkode in finnkodes:
+                if self._watches.pop(finnkode, None) is not None:
+                    self._db.execute("DELETE FROM watches WHERE finnkode = ?", (finnkode,))
+            self._db.commit()
+
+    def watches(self):
+        with self._lock:
+            return list(self._watches.values())
+
+    # Refreshing
+
+    def _pop_due(self, now):
+        """The most overdue watch that is not being refreshed, and the seconds until the next one"""
+        while self._schedule:
+            due_at, finnkode = self._schedule[0]
+            watch = self._watches.get(finnkode)
+            if watch is None or watch.due_at != due_at or finnkode in self._in_flight:
+                heapq.heappop(self._schedule)
+                continue
+            if due_at > now:
+                return None, due_at - now
+            heapq.heappop(self._schedule)
+            self._in_flight.add(finnkode)
+            return watch, 0.0
+        return None, None
+
+    def _reschedule(self, watch, interval, delay=None):
+        # Up to 10% jitter keeps listings added together from staying in lockstep
+        watch.interval = min(max(interval, self.min_interval()), MAX_INTERVAL)
+        delay = watch.interval if delay is None else delay
+        watch.due_at = self.clock() + delay * random.uniform(0.9, 1.0)
+
+    def refresh(self, watch):
+        """Fetch one watched listing, compare it with the stored version and emit its change event
+
+        Returns the event, or None when nothing changed or the fetch failed.
+        """
+        host = urlparse(watch.url).netloc
+        self._limiter.wait(host)
+        event = None
+        try:
+            property_data, status = self._fetch(watch.url, self._session)
+        except Exception as e:
+            response = getattr(e, "response", None)
+            retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+            if response is not None and response.status_code in RETRY_STATUS_CODES:
+                self._limiter.pause(host, float(retry_after) if retry_after.isdigit() else 30)
+            METRICS.increment("watchlist_refreshes_total", result="failed")
+            logger.info("watchlist refresh failed finnkode=%s error=%s", watch.finnkode, e)
+            with self._lock:
+                self._stats["failed"] += 1
+                watch.failures += 1
+                self._reschedule(watch, watch.interval, min(60 * 2 ** watch.failures, MAX_RETRY_DELAY))
+                self._finish(watch)
+            return None
+
+        now = self.clock()
+        with self._lock:
+            first = watch.status is None
+            old = watch.version()
+            if property_data is not None:
+                watch.data = property_data
+            watch.status = status
+            changes = {} if first else diff_listing(old, watch.version())
+            watch.checked_at = now
+            watch.failures = 0
+            self._stats["refreshed"] += 1
+            if changes:
+                watch.changed_at = now
+                event = change_event(watch, changes, now)
+                self._stats["changed"] += 1
+                self._stats["price_drops"] += event["kind"] == PRICE_DROP
+                self._stats["removed"] += "status" in changes and status == REMOVED
+            if status == REMOVED:
+                self._reschedule(watch, MAX_INTERVAL)  # kept in case the listing comes back
+            elif changes:
+                self._reschedule(watch, watch.interval / 2)
+            else:
+                self._reschedule(watch, watch.interval * 1.5)
+            self._finish(watch)
+        METRICS.increment("watchlist_refreshes_total", result=event["kind"] if event else "unchanged")
+
+        if self.store is not None and property_data is not None and (first or event):
+            self.store.append([{**property_data, "url": watch.url, "finnkode": watch.finnkode}])
+        if event is not None:
+            self._emit(event)
+        return event
+
+    def _finish(self, watch):
+        # Under the lock: persist the watch and put it back on the schedule
+        self._in_flight.discard(watch.finnkode)
+        if watch.finnkode in self._watches:
+            self._save(watch)
+            self._db.commit()
+            heapq.heappush(self._schedule, (watch.due_at, watch.finnkode))
+
+    def _emit(self, event):
+        while True:
+            try:
+                self.events.put_nowait(event)
+                break
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                except queue.Empty:
+                    pass
+        for sink in self.sinks:
+            try:
+                sink(event)
+            except Exception as e:
+                logger.warning("watchlist sink failed sink=%s error=%s", type(sink).__name__, e)
+
+    def refresh_due(self, limit=None):
+        """Refresh every listing that is due now, concurrently; returns the change events"""
+        now = self.clock()
+        due = []
+        with self._lock:
+            while limit is None or len(due) < limit:
+                watch, _ = self._pop_due(now)
+                if watch is None:
+                    break
+                due.append(watch)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return [event for event in executor.map(self.refresh, due) if event is not None]
+
+    # Background thread
+
+    def start(self):
+        """Refresh listings as they fall due on a daemon thread until stop()"""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="watchlist")
+        self._thread = threading.Thread(target=self._run, name="watchlist-scheduler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            # A free worker first, so due listings wait in the schedule rather than in the executor
+            if not self._slots.acquire(timeout=1.0):
+                continue
+            with self._lock:
+                watch, wait = self._pop_due(self.clock())
+            if watch is None:
+                self._slots.release()
+                self._wakeup.wait(60.0 if wait is None else min(wait, 60.0))
+                self._wakeup.clear()
+                continue
+            self._executor.submit(self._refresh_and_release, watch)
+
+    def _refresh_and_release(self, watch):
+        try:
+            self.refresh(watch)
+        finally:
+            self._slots.release()
+
+    def stop(self, wait=True):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def stats(self):
+        now = self.clock()
+        with self._lock:
+            overdue = sum(1 for watch in self._watches.values() if watch.due_at <= now)
+            return {**self._stats, "watched": len(self._watches), "in_flight": len(self._in_flight),
+                    "overdue": overdue, "min_interval": self.min_interval()}
+
+    def close(self):
+        self.stop()
+        self._session.close()
+        with self._lock:
+            self._db.close()
+
+
+def _collect_watchlist_metrics(watchlist):
+    def collect(metrics):
+        stats = watchlist.stats()
+        metrics.set_gauge("watchlist_listings", stats["watched"])
+        metrics.set_gauge("watchlist_overdue", stats["overdue"])
+    return collect
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Overvåk Finn.no-annonser og varsle om endringer")
+    parser.add_argument("--watchlist", default=DEFAULT_WATCHLIST_PATH, help="SQLite-fil for overvåkingslisten")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Legg til annonser fra en fil med én URL eller finnkode per linje")
+    add.add_argument("input", help="Fil med annonser ('-' for stdin)")
+    remove = commands.add_parser("remove", help="Slutt å overvåke finnkoder")
+    remove.add_argument("finnkoder", nargs="+")
+    commands.add_parser("status", help="Vis overvåkingslisten og når annonsene sjekkes neste gang")
+    run = commands.add_parser("run", help="Sjekk annonsene etter hvert som de forfaller")
+    run.add_argument("--events", help="JSON lines-fil som hendelsene legges til i")
+    run.add_argument("--webhook", help="URL som hendelsene sendes til med POST")
+    run.add_argument("--store", help="Lagre oppdaterte annonser i boliglageret i denne katalogen")
+    run.add_argument("--workers", type=int, default=WATCH_WORKERS, help="Antall samtidige nedlastinger")
+    run.add_argument("--rate", type=float, default=WATCH_RATE, help="Maks forespørsler per sekund per vert")
+    run.add_argument("--once", action="store_true", help="Sjekk bare annonsene som har forfalt, og avslutt")
+    args = parser.parse_args(argv)
+
+    sinks, store = [], None
+    if args.command == "run":
+        if args.events:
+            sinks.append(JsonLinesSink(args.events))
+        if args.webhook:
+            sinks.append(WebhookSink(args.webhook))
+        if args.store:
+            from listing_store import ListingStore
+            store = ListingStore(args.store)
+    watchlist = Watchlist(args.watchlist, workers=getattr(args, "workers", WATCH_WORKERS),
+                          rate=getattr(args, "rate", WATCH_RATE), sinks=sinks, store=store)
+    try:
+        if args.command == "add":
+            source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+            with source:
+                added = watchlist.add(source)
+            print(f"{added} annonser lagt til, {len(watchlist)} overvåkes")
+        elif args.command == "remove":
+            watchlist.remove(args.finnkoder)
+            print(f"{len(watchlist)} annonser overvåkes")
+        elif args.command == "status":
+            now = time.time()
+            for watch in sorted(watchlist.watches(), key=lambda watch: watch.due_at):
+                print(f"{watch.finnkode}  {watch.status or 'ny':7}  hvert {watch.interval / 60:6.0f} min  "
+                      f"neste om {max(watch.due_at - now, 0) / 60:6.0f} min  {watch.url}")
+            stats = watchlist.stats()
+            print(f"{stats['watched']} annonser, {stats['overdue']} forfalt, "
+                  f"korteste intervall {stats['min_interval'] / 60:.0f} min")
+        elif args.once:
+            for event in watchlist.refresh_due():
+                print(json.dumps(event, ensure_ascii=False))
+        else:
+            METRICS.add_collector(_collect_watchlist_metrics(watchlist))
+            watchlist.start()
+            try:
+                while True:
+                    print(json.dumps(watchlist.events.get(), ensure_ascii=False), flush=True)
+            except KeyboardInterrupt:
+                pass
+    finally:
+        watchlist.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())